@@ -11,12 +11,14 @@
 #   same computer, and to be correctly identified.
 #   
 #   This script lists all current serial ports in the system. 
+#   It then probes the CP2102 ports in parallel, and lists the XLN power supplies found, with their
+#   model and serial number. The port map is saved for the xln_discover.find_port() auto-discovery.
 # 
 #--------------------------------------------------------------------------------------------------
 #   DESCRIPTION
 #   -----------
 # 
-#   The program lists all serial ports. 
+#   The program lists all serial ports, and the XLN power supplies found. 
 # 
 #--------------------------------------------------------------------------------------------------
 #   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
@@ -56,22 +58,37 @@
 
 import serial
 from serial.tools import list_ports as lp
+from xln_discover import discover
 
-script_ver = "v1.0.2"
+script_ver = "v1.1.0"
 
-print()
-print('LIST SERIAL PORTS ', script_ver)
-print('----------------------------------------------')
+# main code
+def main():
+    print()
+    print('LIST SERIAL PORTS ', script_ver)
+    print('----------------------------------------------')
 
-for com in lp.comports():
-    print(com.device)
-    print("\tname:\t\t", com.name)
-    if (com.description != "n/a"):  print("\tdescription:\t", com.description)
-    if (com.hwid != "n/a"):         print("\thwid:\t\t", com.hwid)
-    if (com.vid != None):           print("\tvid:\t\t", com.vid)
-    if (com.pid != None):           print("\tpid:\t\t", com.pid)
-    if (com.serial_number != None): print("\tserial_number:\t", com.serial_number)
-    if (com.location != None):      print("\tlocation:\t", com.location)
-    if (com.manufacturer != None):  print("\tmanufacturer:\t", com.manufacturer)
-    if (com.product != None):       print("\tproduct:\t", com.product)
-    if (com.interface != None):     print("\tinterface:\t", com.interface)
+    for com in lp.comports():
+        print(com.device)
+        print("\tname:\t\t", com.name)
+        if (com.description != "n/a"):  print("\tdescription:\t", com.description)
+        if (com.hwid != "n/a"):         print("\thwid:\t\t", com.hwid)
+        if (com.vid != None):           print("\tvid:\t\t", com.vid)
+        if (com.pid != None):           print("\tpid:\t\t", com.pid)
+        if (com.serial_number != None): print("\tserial_number:\t", com.serial_number)
+        if (com.location != None):      print("\tlocation:\t", com.location)
+        if (com.manufacturer != None):  print("\tmanufacturer:\t", com.manufacturer)
+        if (com.product != None):       print("\tproduct:\t", com.product)
+        if (com.interface != None):     print("\tinterface:\t", com.interface)
+
+    print()
+    print('XLN POWER SUPPLIES')
+    print('----------------------------------------------')
+    for dev, entry in sorted(discover(refresh=True).items()):
+        if entry['model']:
+            print(dev, '\t', entry['model'], '\tSN:', entry['sernum'])
+        else:
+            print(dev, '\t', 'CP2102 bridge present, no XLN answer')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+###################################################################################################
+#   XLN - COMMAND LINE INTERFACE TO THE XLN POWER SUPPLY EXAMPLE SCRIPTS
+#   --------------------------------------------------------------------
+#
+#   This is an example code to demonstrate the BK PRECISION XLN Programmable Power Supply Series.
+#
+#   This script runs the example scripts as subcommands of a single command, with the serial port,
+#   the XLN model and the waveform profile given as options, instead of edited in each script:
+#
+#       python xln.py id                    identify the supply, and turn the output ON (xln_id.py)
+#       python xln.py clear                 clear all the list programs (xln_clr_pgm.py)
+#       python xln.py gen                   upload the staircase, or a profile, to PROG 1 (xln_gen_pgm.py)
+#       python xln.py gen-sine              upload the sinewave to PROG 1 (xln_gen_pgm_sine.py)
+#       python xln.py run                   run PROG 1, and record the output (xln_run_pgm.py)
+#       python xln.py wave                  play the staircase, or a profile, with a realtime plot (xln_wave.py)
+#       python xln.py ports                 list the serial ports and the XLN supplies (list_serial_ports.py)
+#
+#   Options:
+#       --port PORT         serial port name or url, or 'daemon://NAME' for a supply served by xln_daemon.
+#                           'replay://FILE[?speed=N]' replays a session recorded by xln_transcript
+#                           default: $XLN_PORT, or auto-discovery of the model
+#       --model MODEL       XLN model string. default: $XLN_MODEL, or XLN3640
+#       --profile FILE      CSV profile of the 'gen' and 'wave' waveform, a 'volt, curr, ont' row per step
+#       --headless          'wave' without the plot and without matplotlib, at the maximum sample rate
+#       --out FILE          file of the headless 'wave' CSV records, '-' (default) for stdout
+#       --trace FILE        CSV file of the V/I trace of the 'run' program, not saved by default
+#       --log FILE          xln_telemetry log of all the 'wave' samples, not saved by default
+#
+#   Each subcommand imports its script only when it runs, and the scripts import NumPy and matplotlib
+#   inside their main(), so the quick subcommands ('id', 'clear', 'ports') start without loading them.
+#   Link this file as 'xln' in a folder of the PATH to run it as 'xln id'.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   The program parses the command line, and calls the main() of the script of the subcommand.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import os
+import argparse
+
+script_ver = "v1.3.1"
+
+# the step lists of the '--profile' file, as main() keyword arguments. none without a profile
+def profile_args(args):
+    if not args.profile:
+        return {}
+    from xln_program import load_profile
+    vp, ip, tp = load_profile(args.profile)
+    return {'vp': vp, 'ip': ip, 'tp': tp}
+
+def cmd_id(args):
+    import xln_id
+    xln_id.main(args.port, args.model)
+
+def cmd_clear(args):
+    import xln_clr_pgm
+    xln_clr_pgm.main(args.port, args.model)
+
+def cmd_gen(args):
+    import xln_gen_pgm
+    xln_gen_pgm.main(args.port, args.model, **profile_args(args))
+
+def cmd_gen_sine(args):
+    import xln_gen_pgm_sine
+    xln_gen_pgm_sine.main(args.port, args.model)
+
+def cmd_run(args):
+    import xln_run_pgm
+    xln_run_pgm.main(args.port, args.model, trace_file=args.trace)
+
+def cmd_wave(args):
+    import xln_wave
+    xln_wave.main(args.port, args.model, headless=args.headless, out_file=args.out, log_file=args.log,
+                  **profile_args(args))
+
+def cmd_ports(args):
+    import list_serial_ports
+    list_serial_ports.main()
+
+# subcommands: name, function, help, takes a profile
+COMMANDS = [
+    ('id', cmd_id, 'identify the supply, and turn the output ON', False),
+    ('clear', cmd_clear, 'clear all the list programs', False),
+    ('gen', cmd_gen, 'upload the staircase, or the profile, to PROG 1', True),
+    ('gen-sine', cmd_gen_sine, 'upload the sinewave to PROG 1', False),
+    ('run', cmd_run, 'run PROG 1, and record the output', False),
+    ('wave', cmd_wave, 'play the staircase, or the profile, with a realtime plot', True),
+    ('ports', cmd_ports, 'list the serial ports and the XLN power supplies', False),
+]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='xln', description='XLN power supply examples ' + script_ver)
+    parser.add_argument('--port', default=os.environ.get('XLN_PORT'),
+                        help="serial port name or url, 'daemon://NAME' or 'replay://FILE[?speed=N]', "
+                             "default $XLN_PORT or auto-discovery")
+    parser.add_argument('--model', default=os.environ.get('XLN_MODEL', 'XLN3640'),
+                        help='XLN model, default $XLN_MODEL or XLN3640')
+    sub = parser.add_subparsers(dest='command', metavar='command')
+    sub.required = True
+    for name, func, text, profile in COMMANDS:
+        p = sub.add_parser(name, help=text, description=text)
+        if profile:
+            p.add_argument('--profile', help="CSV step list, a 'volt, curr, ont' row per step")
+        if name == 'run':
+            p.add_argument('--trace', help='CSV file of the V/I trace of the run, default none')
+        if name == 'wave':
+            p.add_argument('--headless', action='store_true', help='no plot, write the samples as CSV records')
+            p.add_argument('--out', default='-', help="headless records file, default '-' for stdout")
+            p.add_argument('--log', help='telemetry log file of all the samples, default none')
+        p.set_defaults(func=func)
+    args = parser.parse_args(argv)
+    args.model = args.model.encode()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+###################################################################################################
+#   XLN_ACQ - BACKGROUND V/I ACQUISITION THREAD
+#   -------------------------------------------
+#
+#   This module samples the XLN output voltage and current in a background thread, as fast as the
+#   serial link allows, decoupled from any plotting or user interface work.
+#
+#   The sampler thread loops on the read_vi() of a xln_response.ResponseEngine, and appends each
+#   (t, vout, iout) sample to a preallocated xln_ringbuf.RingBuffer. The consumers (a plot renderer,
+#   a logger) read the buffer at their own pace, so a slow frame never stalls the serial link, and
+#   the sample rate does not depend on the plot cost. The memory used does not depend on the
+#   capture length.
+#
+#   The sampler owns the serial port while it runs. Commands to the instrument are sent through the
+#   sampler write() method, which queues them and writes them between two VOUT?/IOUT? round trips, so
+#   they never interleave with a pending response. The sampler can be passed in place of the port
+#   object to any function that only writes commands:
+#
+#       write_cmd(sampler, "SOUR:VOLT 5.0")
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   Sampler(instr)      creates the sampler thread for the open port 'instr'
+#   engine              the ResponseEngine that reads the samples, with learned timeouts
+#                       (a sample that could not be read has NaN values)
+#   ring                the RingBuffer holding the latest samples
+#   start() / stop()    start the acquisition, stop it and wait for the thread to finish
+#   write(data)         queues a command to be written between two samples
+#   last                the most recent (t, vout, iout) sample
+#   rate()              the average sample rate since start(), in samples per second
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+import queue
+import threading
+from xln_ringbuf import RingBuffer
+from xln_scpi import MISSING
+from xln_response import ResponseEngine
+
+# background V/I sampler
+class Sampler(threading.Thread):
+    def __init__(self, instr, period=0.0, capacity=65536, ring=None, engine=None):
+        super().__init__(daemon=True)
+        self.instr = instr
+        self.period = period            # minimum time between samples, 0 for the maximum link rate
+        self.lock = threading.Lock()    # serial port access lock
+        self.pending = queue.SimpleQueue()
+        self.ring = ring if ring is not None else RingBuffer(capacity)
+        self.engine = engine or ResponseEngine(instr)
+        self.last = (0.0, MISSING, MISSING)
+        self.count = 0
+        self.t_start = None
+        self._halt = threading.Event()
+
+    def run(self):
+        self.t_start = time.monotonic()
+        t_next = self.t_start
+        while not self._halt.is_set():
+            with self.lock:
+                while not self.pending.empty():
+                    self.instr.write(self.pending.get())
+                sample = self.engine.read_vi()
+            self.ring.append(*sample)
+            self.last = sample
+            self.count += 1
+            if self.period > 0:
+                t_next += self.period
+                dt = t_next - time.monotonic()
+                if dt > 0:
+                    self._halt.wait(dt)
+
+    # queue a command, written to the instrument before the next sample
+    def write(self, data):
+        self.pending.put(bytes(data))
+        return len(data)
+
+    # stop the acquisition and wait for the thread to finish
+    def stop(self):
+        self._halt.set()
+        if self.is_alive():
+            self.join()
+        while not self.pending.empty():
+            self.instr.write(self.pending.get())
+
+    # average sample rate since start, in samples per second
+    def rate(self):
+        if self.t_start is None:
+            return 0.0
+        dt = time.monotonic() - self.t_start
+        return self.count / dt if dt > 0 else 0.0
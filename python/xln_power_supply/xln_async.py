@@ -0,0 +1,381 @@
+###################################################################################################
+#   XLN_ASYNC - ASYNCIO CLIENT FOR CONCURRENT CONTROL OF MULTIPLE XLN POWER SUPPLIES
+#   --------------------------------------------------------------------------------
+#
+#   This module drives any number of XLN power supplies from a single process with asyncio, so a rack
+#   of instruments is identified, programmed, run and sampled concurrently. The serial links are
+#   independent, so the total wall time is set by the slowest supply instead of the sum of all of them.
+#
+#   Each XlnClient owns one serial port, and a command queue served by its own task. A request is the
+#   bytes to write and the number of response lines to read back. The queue task executes the
+#   requests in order, one at a time, so responses are never mixed between coroutines sharing the
+#   same client, while the other clients keep running in the meantime. All the reads and writes are
+#   non-blocking for the event loop:
+#
+#   1)  'socket://host:port' urls (the xln_emu.py TCP server) use asyncio streams.
+#
+#   2)  Serial ports use the pyserial-asyncio streams if the 'serial_asyncio' module is installed.
+#
+#   3)  Otherwise, the blocking pyserial port is run in a dedicated worker thread per client.
+#       'emu://MODEL' urls open an in-process xln_emu.EmulatedSerial the same way, 'daemon://NAME'
+#       port names a xln_daemon.DaemonPort, and 'replay://FILE' names a xln_transcript.ReplayPort.
+#
+#   Queries in one request are pipelined in a single write, as in ResponseEngine.read_vi(), so each request
+#   pays the link latency once.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   XlnClient(portname)                 client of one XLN, opened with 'await open()' or 'async with'
+#   request(data, nlines, timeout)      queue raw bytes, and return the list of 'nlines' response lines
+#   write(cmd) / query(cmd)             write a command / a query and return its response line
+#   query_many(cmds)                    pipelined queries, returns the list of response lines
+#   identify()                          *IDN?, MODEL?, SYS:SER? and VER? in a single round trip
+#   read_vi()                           (t, vout, iout) sample, like ResponseEngine.read_vi()
+#   upload(compiled)                    uploads a xln_program.CompiledProgram, returns (steps, stats)
+#   run_program(prog)                   runs a program while sampling V/I, returns the samples
+#   open_all(portnames)                 opens several clients concurrently
+#
+#   A missing response line is returned as b''. Response lines keep their '\r\n' terminator, like
+#   pyserial readline(). After a missing or partial line, the queue task resynchronizes the link
+#   before the next request: a '*OPC?' sentinel is written, and the lines are discarded up to its
+#   '1', so the late response of the failed request is never returned to the next one.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from xln_scpi import EOL, VI_QUERY, MISSING
+from xln_program import compile_program, SLOW_COMMANDS
+from xln_upload import UploadStats, SAVE_TIMEOUT, forget_slot
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+# V/I sample and program run state, in a single round trip
+_RUN_QUERY = VI_QUERY + ("PROG:RUN?" + EOL).encode()
+
+# shortest wait for the '*OPC?' sentinel of a resync, in seconds: the late response may take longer
+# than the request timeout
+RESYNC_TIMEOUT = 1.0
+
+# default maximum run time of run_program(), in seconds
+RUN_TIMEOUT = 600.0
+
+# parse a sample value response. return MISSING if read error
+def _float(rd):
+    try:
+        return float(rd)
+    except ValueError:
+        return MISSING
+
+# asyncio stream link (TCP socket, or pyserial-asyncio port)
+class _StreamLink:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def readline(self, timeout):
+        try:
+            return await asyncio.wait_for(self.reader.readuntil(b'\n'), timeout)
+        except asyncio.TimeoutError:
+            return b''
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+
+    async def reset_input(self):
+        # drop any stale bytes already received
+        while True:
+            try:
+                if not await asyncio.wait_for(self.reader.read(4096), 0.01):
+                    return
+            except asyncio.TimeoutError:
+                return
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+# blocking pyserial port, run in a dedicated worker thread
+class _ThreadLink:
+    def __init__(self, port):
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _readline(self, timeout):
+        self.port.timeout = timeout
+        return self.port.readline()
+
+    async def write(self, data):
+        await self._run(self.port.write, data)
+
+    async def readline(self, timeout):
+        return await self._run(self._readline, timeout)
+
+    async def reset_input(self):
+        await self._run(self.port.reset_input_buffer)
+
+    async def close(self):
+        await self._run(self.port.close)
+        self.executor.shutdown()
+
+# open the link for 'portname'
+async def open_link(portname, baudrate=57600):
+    if portname.startswith('socket://'):
+        host, port = portname[len('socket://'):].rsplit(':', 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+        return _StreamLink(reader, writer)
+    if portname.startswith('emu://'):
+        from xln_emu import EmulatedSerial
+        return _ThreadLink(EmulatedSerial(portname, model=portname[len('emu://'):], baudrate=baudrate))
+    if portname.startswith('daemon://'):
+        from xln_daemon import DaemonPort
+        return _ThreadLink(DaemonPort(portname))
+    if portname.startswith('replay://'):
+        from xln_transcript import replay_for_url
+        return _ThreadLink(replay_for_url(portname))
+    if serial_asyncio is not None:
+        reader, writer = await serial_asyncio.open_serial_connection(url=portname, baudrate=baudrate)
+        return _StreamLink(reader, writer)
+    import serial
+    port = serial.serial_for_url(portname, do_not_open=True)
+    port.baudrate = baudrate
+    await asyncio.get_running_loop().run_in_executor(None, port.open)
+    return _ThreadLink(port)
+
+# asyncio client of one XLN power supply
+class XlnClient:
+    def __init__(self, portname, baudrate=57600, timeout=0.2):
+        self.portname = portname
+        self.baudrate = baudrate
+        self.timeout = timeout          # default response line timeout
+        self.link = None
+        self.queue = None
+        self.task = None
+        self.idn = self.model = self.sernum = self.version = b''
+
+    async def open(self):
+        self.link = await open_link(self.portname, self.baudrate)
+        await self.link.reset_input()
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self._serve())
+        return self
+
+    async def close(self):
+        if self.task is not None:
+            await self.queue.put(None)
+            await self.task
+            self.task = None
+        if self.link is not None:
+            await self.link.close()
+            self.link = None
+
+    async def __aenter__(self):
+        if self.task is None:
+            await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # command queue task: execute the requests in order
+    async def _serve(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            data, nlines, timeout, fut = item
+            try:
+                if data:
+                    await self.link.write(data)
+                lines = [await self.link.readline(timeout) for _ in range(nlines)]
+                if not all(ln.endswith(b'\n') for ln in lines):
+                    await self._resync(max(timeout, RESYNC_TIMEOUT))
+            except Exception as e:
+                if not fut.cancelled():
+                    fut.set_exception(e)
+                continue
+            if not fut.cancelled():
+                fut.set_result(lines)
+
+    # discard the late responses: write a '*OPC?' sentinel, and read the lines up to its '1' within
+    # 'timeout' seconds, then drop the rest of the input. returns True if the sentinel was read
+    async def _resync(self, timeout):
+        deadline = time.monotonic() + timeout
+        await self.link.write(b"*OPC?\r\n")
+        while True:
+            line = await self.link.readline(max(deadline - time.monotonic(), 0.0))
+            if not line.endswith(b'\n') or line.strip() == b'1':
+                await self.link.reset_input()
+                return line.strip() == b'1'
+
+    # queue raw bytes to write, and wait for 'nlines' response lines
+    async def request(self, data, nlines=0, timeout=None):
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((data, nlines, timeout or self.timeout, fut))
+        return await fut
+
+    async def write(self, cmd):
+        await self.request((cmd + EOL).encode())
+
+    async def query(self, cmd, timeout=None):
+        return (await self.request((cmd + EOL).encode(), 1, timeout))[0]
+
+    async def query_many(self, cmds, timeout=None):
+        return await self.request(''.join(c + EOL for c in cmds).encode(), len(cmds), timeout)
+
+    # identification queries, pipelined in a single round trip. returns the model string
+    async def identify(self):
+        await self.write("")
+        self.idn, self.model, self.sernum, self.version = await self.query_many(["*IDN?", "MODEL?", "SYS:SER?", "VER?"])
+        return self.model
+
+    # wait until the instrument has processed all previous commands
+    async def opc_sync(self, timeout=None):
+        return (await self.query("*OPC?", timeout)).strip() == b'1'
+
+    # read the output (volts, amps). returns (t, vout, iout), see xln_response.ResponseEngine.read_vi()
+    async def read_vi(self):
+        t0 = time.monotonic()
+        vout, iout = await self.request(VI_QUERY, 2)
+        return (t0 + time.monotonic()) / 2, _float(vout), _float(iout)
+
+    # number of steps stored in program 'prog'
+    async def read_total(self, prog):
+        resp, = await self.request("PROG {}\r\nPROG:TOTA?\r\n".format(prog).encode(), 1)
+        try:
+            return int(resp)
+        except ValueError:
+            return 0
+
+    # upload a compiled program. windows of at most 'window' bytes are each closed by '*OPC?', and
+    # slow commands are synchronized on their own. the host-side cache record of the slot is forgotten.
+    # returns (steps, stats), like xln_upload.upload_compiled()
+    async def upload(self, compiled, window=256):
+        t0 = time.perf_counter()
+        forget_slot(self.sernum.strip().decode(errors='replace'), compiled.prog)
+        if not (await self.opc_sync() or await self.opc_sync()):
+            # no '*OPC?' support: pace every command with a STATUS? round trip
+            print('WARNING: {}: *OPC? not answered, falling back to STATUS? pacing'.format(self.portname))
+            nbytes = 0
+            for line in compiled.lines:
+                for cmd in line.decode().strip().split(';'):
+                    data = (cmd.lstrip(':') + EOL + "STATUS?" + EOL).encode()
+                    await self.request(data, 1, SAVE_TIMEOUT)
+                    nbytes += len(data)
+            steps = await self.read_total(compiled.prog)
+            return steps, UploadStats(compiled.ncmd, nbytes, time.perf_counter() - t0, 'status', 0.0)
+
+        nbytes = 0
+        ok = True
+
+        # write one window closed by '*OPC?', and wait for the '1'
+        async def send(buf, timeout=None):
+            ack, = await self.request(buf + b"*OPC?\r\n", 1, timeout)
+            return len(buf) + 7, ack.strip() == b'1'
+
+        buf = b''
+        for line in compiled.lines:
+            slow = line.startswith(SLOW_COMMANDS)
+            if buf and (slow or len(buf) + len(line) > window):
+                n, ack = await send(buf)
+                nbytes, ok, buf = nbytes + n, ok and ack, b''
+            buf += line
+            if slow:
+                n, ack = await send(buf, SAVE_TIMEOUT)
+                nbytes, ok, buf = nbytes + n, ok and ack, b''
+        if buf:
+            n, ack = await send(buf, SAVE_TIMEOUT)
+            nbytes, ok = nbytes + n, ok and ack
+        elapsed = time.perf_counter() - t0
+        if not ok:
+            print('WARNING: {}: *OPC? timeout during program upload'.format(self.portname))
+        steps = await self.read_total(compiled.prog)
+        return steps, UploadStats(compiled.ncmd, nbytes, elapsed, 'stream', 0.0)
+
+    # compile and upload program 'prog'. returns (steps, stats)
+    async def upload_program(self, prog, vp, ip, tp, rep=0, nxt=0):
+        return await self.upload(compile_program(prog, vp, ip, tp, rep, nxt))
+
+    # run program 'prog', sampling V/I at the maximum link rate until it stops, or until 'timeout'
+    # seconds (RUN_TIMEOUT by default). each sample also reads PROG:RUN?, in the same round trip.
+    # returns the list of (t, vout, iout) samples, or an empty list if the program did not start
+    # within 'start_timeout'.
+    # the '*OPC?' after PROG:RUN ON confirms the start, so a program that already ended before the
+    # first PROG:RUN? reads OFF, and is complete
+    async def run_program(self, prog, timeout=RUN_TIMEOUT, start_timeout=2.0):
+        await self.request("PROG {}\r\nPROG:RUN ON\r\n".format(prog).encode())
+        samples = []
+        if not await self.opc_sync(start_timeout):
+            print('WARNING: {}: PROG {} did not start'.format(self.portname, prog))
+            await self.write("PROG:RUN OFF")
+            return samples
+        t_start = time.monotonic()
+        while True:
+            t0 = time.monotonic()
+            vout, iout, run = await self.request(_RUN_QUERY, 3)
+            t = (t0 + time.monotonic()) / 2
+            if b'OFF' in run:
+                break
+            samples.append((t, _float(vout), _float(iout)))
+            if timeout is not None and t - t_start > timeout:
+                print('WARNING: {}: PROG {} run timeout, stopped after {:.2f}s'.format(self.portname, prog, t - t_start))
+                break
+        await self.write("PROG:RUN OFF")
+        return samples
+
+# open the clients of all 'portnames' concurrently. returns the list of open clients
+async def open_all(portnames, **kw):
+    return list(await asyncio.gather(*(XlnClient(p, **kw).open() for p in portnames)))
+
+# close all clients concurrently
+async def close_all(clients):
+    await asyncio.gather(*(c.close() for c in clients))
@@ -0,0 +1,125 @@
+###################################################################################################
+#   XLN_CACHE - HOST-SIDE CACHE OF THE PROGRAMS STORED ON EACH XLN
+#   --------------------------------------------------------------
+#
+#   This module keeps a persistent record of the list programs uploaded to each XLN power supply,
+#   keyed by the instrument serial number (SYS:SER?) and the program slot.
+#
+#   Each entry holds the program record (see xln_program.program_record) and a SHA-256 content hash
+#   of it. Before an upload, the hash of the new program is compared with the cached hash. If they
+#   match, and a cheap validation query (PROG:TOTA?, PROG:REP?, PROG:NEXT?) agrees with the record,
+#   the slot already holds the program and the upload is skipped. If they differ, the cached record
+#   is used as the base of a differential upload, with no readback needed.
+#
+#   An entry is invalidated when the validation query disagrees (the program was changed from the
+#   front panel), and xln_clr_pgm.py invalidates all entries of the instrument it clears.
+#
+#   The cache files are stored in the '~/.xln' folder, or in the folder set by the XLN_CACHE_DIR
+#   environment variable.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   cache_path(name)                    path of a cache file in the cache folder
+#   program_hash(record)                content hash of a program record
+#   ProgramCache()                      the persistent program cache, loaded from 'programs.json'
+#   get(sernum, prog)                   the cached entry of a slot, or None
+#   put(sernum, prog, record)           records the program uploaded to a slot
+#   invalidate(sernum, prog)            forgets a slot, or all slots of the instrument if prog is None
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import os
+import json
+import time
+import hashlib
+
+# folder of the cache files
+def cache_dir():
+    return os.environ.get('XLN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.xln'))
+
+# path of the cache file 'name'
+def cache_path(name):
+    return os.path.join(cache_dir(), name)
+
+# load a JSON cache file. returns an empty dict if missing or unreadable
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# save a JSON cache file atomically, so a crash never leaves a truncated cache
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+# content hash of a program record
+def program_hash(record):
+    text = json.dumps(record, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# persistent cache of the programs stored in each instrument slot
+class ProgramCache:
+    def __init__(self, path=None):
+        self.path = path or cache_path('programs.json')
+        self.data = load_json(self.path)
+
+    def get(self, sernum, prog):
+        return self.data.get(sernum, {}).get(str(prog))
+
+    def put(self, sernum, prog, record):
+        self.data.setdefault(sernum, {})[str(prog)] = {
+            'hash': program_hash(record),
+            'record': record,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        save_json(self.path, self.data)
+
+    def invalidate(self, sernum, prog=None):
+        if sernum not in self.data:
+            return
+        if prog is None:
+            del self.data[sernum]
+        else:
+            self.data[sernum].pop(str(prog), None)
+        save_json(self.path, self.data)
@@ -44,6 +44,7 @@
 #   commands:
 #       1) Open the serial port and identify the XLN model
 #       2) Clears all programs with command "PROG:CLE:ALL\r\n"
+#          and invalidates the host-side program cache of the instrument
 #       3) Close the serial port
 # 
 #--------------------------------------------------------------------------------------------------
@@ -82,13 +83,21 @@
 # 
 ###################################################################################################
 
-import serial
+import sys
 import time
+from xln_discover import find_port
+from xln_scpi import serial_for_url
+from xln_ident import identify, print_identity, ID_UNRESPONSIVE
+from xln_cache import ProgramCache
 
-script_ver = "v1.0.4"
+script_ver = "v1.3.1"
 model_id = b'XLN3640'                       # change the model_id to your XLN model
 portname = '/dev/tty.usbserial-275K22178'   # change the device port name for your device name!
                                             # on windows use 'COMxx'
+                                            # use 'socket://localhost:5025' for the xln_emu.py emulator
+                                            # use 'daemon://<sernum>' for a supply served by xln_daemon.py
+                                            # use 'replay://<session.xlr>' to replay a xln_transcript.py recording
+                                            # use None to find the 'model_id' supply by auto-discovery
 
 def read_integer(instr):
     try:
@@ -100,62 +109,60 @@ def read_integer(instr):
     return resp
 
 # main code
-print()
-print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
-print('CLEAR ALL LIST PROGRAMS ', script_ver)
-print('----------------------------------------------')
-bk = serial.Serial()
-bk.port = portname
-bk.baudrate = 57600
-bk.timeout = 0.2
-bk.open()
-if bk.is_open:
-    print('Serial port OPEN')
-    # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
-    bk.reset_input_buffer()
-    bk.reset_output_buffer()
-    bk.write("\r\n".encode())
-    bk.write("*idn?\r\n".encode())
-    idn = bk.readline()
-    bk.write("MODEL?\r\n".encode())
-    model = bk.readline()
-    bk.write("SYS:SER?\r\n".encode())
-    sernum = bk.readline()
-    bk.write("VER?\r\n".encode())
-    version = bk.readline()
-    print('portname:\t\t', portname)
-    print('Instrument ID:\t\t', idn)
-    print('Instrument MODEL:\t', model)
-    print('Instrument VERSION:\t', version)
-    print('Instrument SN:\t\t', sernum)
-    if model_id in model:
-        # The power supply responded. Now we can send SCPI commands. 
-        print(model_id.decode(), "validated!")
-        bk.write("*cls\r\n".encode())
-        bk.write("STATUS?\r\n".encode())
-        print("STATUS? : ", bk.readline())
+def main(portname=portname, model_id=model_id):
+    print()
+    print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+    print('CLEAR ALL LIST PROGRAMS ', script_ver)
+    print('----------------------------------------------')
+    if portname is None:
+        # find the port of the 'model_id' power supply, from the cached port map or by probing the CP2102 ports
+        portname = find_port(model=model_id)
+        print('auto-discovery:\t\t', portname)
+    if portname is None:
+        print('ERROR: no {} power supply found. check the USB cable and the power.'.format(model_id.decode()))
+        sys.exit(1)
+    bk = serial_for_url(portname, do_not_open=True)
+    bk.baudrate = 57600
+    bk.timeout = 0.2
+    bk.open()
+    if bk.is_open:
+        print('Serial port OPEN')
+        # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
+        ident = identify(bk, portname)
+        print_identity(portname, ident)
+        model, sernum = ident.model, ident.sernum
+        if model_id in model:
+            # The power supply responded. Now we can send SCPI commands. 
+            print(model_id.decode(), "validated!")
+            bk.write("*cls\r\n".encode())
+            bk.write("STATUS?\r\n".encode())
+            print("STATUS? : ", bk.readline())
 
-        # clear all programs
-        time.sleep(0.4)
-        bk.write("PROG:CLE:ALL\r\n".encode());
-        print("PROG:CLE:ALL")
-        time.sleep(1.0)
-        bk.write("PROG 1\r\n".encode());
-        print("PROG 1")
-        time.sleep(0.4)
-        bk.write("PROG:TOTA?\r\n".encode())
-        time.sleep(0.4)
-        steps = read_integer(bk)
-        print("PROG:TOTA? : ", steps)
-        if steps == 0:
-            print('PROGRAM 1 IS EMPTY')
+            # clear all programs
+            time.sleep(0.4)
+            bk.write("PROG:CLE:ALL\r\n".encode());
+            print("PROG:CLE:ALL")
+            ProgramCache().invalidate(sernum.strip().decode())
+            time.sleep(1.0)
+            bk.write("PROG 1\r\n".encode());
+            print("PROG 1")
+            time.sleep(0.4)
+            bk.write("PROG:TOTA?\r\n".encode())
+            time.sleep(0.4)
+            steps = read_integer(bk)
+            print("PROG:TOTA? : ", steps)
+            if steps == 0:
+                print('PROGRAM 1 IS EMPTY')
+            else:
+                print('ERROR: PROGRAM 1 IS NOT EMPTY!')
+        elif ident.state == ID_UNRESPONSIVE:
+            print('ERROR: USB BRIDGE PRESENT, POWER SUPPLY UNRESPONSIVE! CHECK THE POWER, OR POWER CYCLE IT.')
         else:
-            print('ERROR: PROGRAM 1 IS NOT EMPTY!')
+            print('MODEL ID ERROR!')
+        bk.close()
+        print('Serial port CLOSED')
     else:
-        print('MODEL ID ERROR!')
-    bk.close()
-    print('Serial port CLOSED')
-else:
-    print('ERROR: serial.open() failed.')
-
+        print('ERROR: serial.open() failed.')
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+###################################################################################################
+#   XLN_DAEMON - PERSISTENT SESSION DAEMON SHARING THE XLN POWER SUPPLIES BETWEEN LOCAL CLIENTS
+#   -------------------------------------------------------------------------------------------
+#
+#   This module keeps the serial ports of the XLN power supplies open and identified in a long-lived
+#   process, and shares each supply between any number of local client processes, such as a logger
+#   and a program upload running at the same time.
+#
+#   1)  Sessions: the daemon opens each port once, with a xln_async.XlnClient, identifies the supply,
+#       and serves it on a Unix-domain socket named after its serial number. The identity is checked
+#       with 'SYS:SER?' every 'keepalive' seconds of idle time. A supply that stops answering, or a
+#       different supply on the same port, is reported, and the requests get empty responses until
+#       the original supply answers again. A link that fails is reopened on the next check.
+#
+#   2)  Requests: each write() of a client is one request, executed atomically: its bytes are written
+#       to the instrument as they are, and as many response lines as it has queries (commands whose
+#       header ends with '?', on each line and after each ';') are read back and returned to that
+#       client only. The writes of the other clients are never interleaved within a request. The
+#       client sets the port timeout before the write: the daemon reads the lines with that timeout,
+#       raised to SAVE_TIMEOUT for a request with a 'PROG:SAV' or 'PROG:CLE', plus the wire time of the
+#       request, since a client timeout set later for the read is not known to the daemon. After a
+#       missing or partial response line, the xln_async.XlnClient of the session resyncs the link
+#       with a '*OPC?' sentinel before the next request, so a late response is never returned to
+#       another client.
+#
+#   3)  Fair queuing: each client has its own request queue, and the session serves the clients with
+#       pending requests in round-robin order, one request at a time. A client uploading a long program
+#       in '*OPC?' windows and a client sampling V/I alternate their requests on the link, and none of
+#       them waits for the whole backlog of the other.
+#
+#   4)  Clients: DaemonPort connects to a session, and is used in place of an open pyserial port by
+#       the functions of xln_scpi, xln_upload, xln_acq, ... The identity is sent by the daemon on
+#       connection, so a client pays a socket round trip instead of the port open and identification.
+#       The scripts and xln_async open a DaemonPort for a 'daemon://NAME' port name. A reply that
+#       arrives after the client read timed out is discarded, and never read as the next response.
+#
+#   The sessions are listed in 'daemon.json' in the xln_cache folder, where the clients find them by
+#   serial number, port name or model.
+#
+#   Framing: a request is a '<dI' header (line timeout in seconds, data length) and the data. A reply
+#   is a '<I' line count, and each line as a '<I' length and the line bytes. A missing line is empty.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   serve(portnames, keepalive)         runs the daemon for the supplies on 'portnames', until stopped
+#   find_socket(name)                   the socket of a supply, by serial number, port name or model
+#   DaemonPort(name, timeout)           client port of the supply 'name', like a pyserial port
+#   URL                                 'daemon://', the port name prefix of a supply served
+#   idn, model, sernum, version         identity of the supply, as sent by the daemon
+#   count_queries(data)                 number of response lines expected for the bytes 'data'
+#
+#   Run 'python xln_daemon.py /dev/tty.usbserial-275K22178 ...' to start the daemon, and use
+#   'daemon:///dev/tty.usbserial-275K22178', or 'daemon://<sernum>', as the port name of the scripts.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import os
+import sys
+import time
+import signal
+import socket
+import struct
+import asyncio
+from collections import deque
+from xln_async import XlnClient
+from xln_program import SLOW_COMMANDS
+from xln_upload import SAVE_TIMEOUT
+from xln_cache import cache_dir, cache_path, load_json, save_json
+
+# request header: line timeout in seconds, data length. reply: line count, then each line length
+_REQUEST = struct.Struct('<dI')
+_COUNT = struct.Struct('<I')
+
+# idle time between the identity checks of a supply, in seconds
+KEEPALIVE = 5.0
+
+# response line timeout of a client that does not set one, in seconds
+DEFAULT_TIMEOUT = 0.2
+
+# index of the sessions served
+INDEX = 'daemon.json'
+
+# port name prefix of a supply served by the daemon: 'daemon://' and its serial number, port name or model
+URL = 'daemon://'
+
+# number of response lines expected for the bytes 'data': one per query, in every line and after every ';'
+def count_queries(data):
+    n = 0
+    for line in bytes(data).split(b'\n'):
+        for cmd in line.split(b';'):
+            words = cmd.split(None, 1)
+            if words and words[0].endswith(b'?'):
+                n += 1
+    return n
+
+# response line timeout of a request: the client timeout, at least SAVE_TIMEOUT for a request with a
+# slow command, plus the wire time of the request bytes, 10 bits per byte
+def request_timeout(data, timeout=None, baudrate=57600):
+    timeout = timeout or DEFAULT_TIMEOUT
+    if any(cmd in data for cmd in SLOW_COMMANDS):
+        timeout = max(timeout, SAVE_TIMEOUT)
+    return timeout + len(data) * 10 / baudrate
+
+# socket path of the supply 'sernum'
+def socket_path(sernum):
+    name = ''.join(c if c.isalnum() else '_' for c in sernum) or 'unknown'
+    return os.path.join(cache_dir(), 'xln-{}.sock'.format(name))
+
+# the socket of the supply 'name': a socket path, or the serial number, port name or model of a
+# supply in the session index. returns None if not served
+def find_socket(name):
+    if os.path.sep in name and os.path.exists(name) and not name.startswith('/dev/'):
+        return name
+    for sernum, entry in sorted(load_json(cache_path(INDEX)).items()):
+        if name in (sernum, entry['portname'], entry['model']) and os.path.exists(entry['socket']):
+            return entry['socket']
+    return None
+
+# send a reply frame of response lines
+def _reply(lines):
+    return _COUNT.pack(len(lines)) + b''.join(_COUNT.pack(len(ln)) + ln for ln in lines)
+
+# one connected client: its request queue
+class _Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = deque()
+        self.active = False
+
+# session of one supply: the open link, and the round-robin queue of its clients
+class _Session:
+    def __init__(self, portname, keepalive=KEEPALIVE):
+        self.portname = portname
+        self.keepalive = keepalive
+        self.xln = None
+        self.identity = None            # (idn, model, sernum, version) of the supply served
+        self.ok = False                 # the supply answered the last identity check
+        self.active = deque()           # clients with pending requests, in service order
+        self.wakeup = asyncio.Event()
+        self.server = None
+        self.path = None
+        self.requests = 0
+
+    # open the link and identify the supply. returns True if it answered
+    async def connect(self):
+        try:
+            self.xln = await XlnClient(self.portname).open()
+            await self.xln.identify()
+        except (OSError, EOFError) as e:
+            print('WARNING: {}: cannot open: {}'.format(self.portname, e))
+            await self.disconnect()
+            return False
+        ident = tuple(x.strip() for x in (self.xln.idn, self.xln.model, self.xln.sernum, self.xln.version))
+        if not ident[1].startswith(b'XLN'):
+            return self.check(b'') if self.identity else False
+        if self.identity is None:
+            self.identity = ident
+        return self.check(ident[2])
+
+    async def disconnect(self):
+        if self.xln is not None:
+            try:
+                await self.xln.close()
+            except OSError:
+                pass
+            self.xln = None
+        self.ok = False
+
+    # compare the serial number read to the supply served
+    def check(self, sernum):
+        ok = sernum == self.identity[2]
+        if ok != self.ok:
+            if ok:
+                print('{}: {} {} identified'.format(self.portname, self.identity[1].decode(), sernum.decode()))
+            elif sernum:
+                print('WARNING: {}: found {} instead of {}, requests refused'.format(
+                    self.portname, sernum.decode(errors='replace'), self.identity[2].decode()))
+            else:
+                print('WARNING: {}: {} not answering'.format(self.portname, self.identity[2].decode()))
+        self.ok = ok
+        return ok
+
+    # idle identity check, and reconnection of a failed link
+    async def check_identity(self):
+        if self.xln is None:
+            await self.connect()
+            return
+        try:
+            sernum, = await self.xln.request(b"\r\nSYS:SER?\r\n", 1)
+        except OSError:
+            await self.disconnect()
+            return
+        self.check(sernum.strip())
+
+    # execute one request. returns the response lines
+    async def execute(self, data, timeout):
+        nlines = count_queries(data)
+        if not self.ok or self.xln is None:
+            return [b''] * nlines
+        try:
+            lines = await self.xln.request(data, nlines, request_timeout(data, timeout))
+        except OSError as e:
+            print('WARNING: {}: link failed: {}'.format(self.portname, e))
+            await self.disconnect()
+            return [b''] * nlines
+        # a late response was already discarded by the resync of the client, before the next request
+        self.requests += 1
+        return lines
+
+    # service task: serve the clients with pending requests in round-robin order
+    async def run(self):
+        while True:
+            if not self.active:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    await self.check_identity()
+                continue
+            client = self.active.popleft()
+            data, timeout = client.queue.popleft()
+            if client.queue:
+                self.active.append(client)
+            else:
+                client.active = False
+            lines = await self.execute(data, timeout)
+            if not client.writer.is_closing():
+                client.writer.write(_reply(lines))
+
+    # socket connection handler: queue the requests of one client
+    async def handle(self, reader, writer):
+        client = _Client(writer)
+        writer.write(_reply(list(self.identity)))
+        try:
+            while True:
+                timeout, n = _REQUEST.unpack(await reader.readexactly(_REQUEST.size))
+                data = await reader.readexactly(n)
+                client.queue.append((data, timeout or None))
+                if not client.active:
+                    client.active = True
+                    self.active.append(client)
+                    self.wakeup.set()
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        # requests already queued are still executed, their replies are dropped
+        writer.close()
+
+    # start serving the supply on its socket
+    async def start(self):
+        if not await self.connect():
+            print('WARNING: {}: no XLN power supply found, not served'.format(self.portname))
+            await self.disconnect()
+            return False
+        self.path = socket_path(self.identity[2].decode(errors='replace'))
+        if os.path.exists(self.path):
+            try:
+                s = socket.socket(socket.AF_UNIX)
+                s.connect(self.path)
+                s.close()
+                print('WARNING: {}: already served on {}'.format(self.portname, self.path))
+                await self.disconnect()
+                return False
+            except OSError:
+                os.unlink(self.path)            # stale socket of a daemon that did not exit cleanly
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.server = await asyncio.start_unix_server(self.handle, self.path)
+        print('{}: served on {}'.format(self.portname, self.path))
+        return True
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        await self.disconnect()
+
+# update the session index: add the 'sessions' served, or remove them
+def _update_index(sessions, add=True):
+    path = cache_path(INDEX)
+    index = load_json(path)
+    for s in sessions:
+        sernum = s.identity[2].decode(errors='replace')
+        if add:
+            index[sernum] = {'portname': s.portname, 'model': s.identity[1].decode(errors='replace'),
+                             'socket': s.path, 'pid': os.getpid(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+        else:
+            index.pop(sernum, None)
+    save_json(path, index)
+
+# run the daemon for the supplies on 'portnames', until cancelled
+async def serve(portnames, keepalive=KEEPALIVE):
+    sessions = [_Session(p, keepalive) for p in portnames]
+    started = await asyncio.gather(*(s.start() for s in sessions))
+    sessions = [s for s, ok in zip(sessions, started) if ok]
+    if not sessions:
+        print('no XLN power supply to serve')
+        return
+    _update_index(sessions)
+    main = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main.cancel)
+    tasks = [asyncio.get_running_loop().create_task(s.run()) for s in sessions]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        _update_index(sessions, add=False)
+        for s in sessions:
+            await s.stop()
+            print('{}: {} requests served'.format(s.portname, s.requests))
+
+# client port of a supply served by the daemon. it has the pyserial methods used by the scripts.
+# 'name' may be a 'daemon://' port name. with 'do_not_open', the socket is connected by open()
+class DaemonPort:
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, wait=30.0, do_not_open=False):
+        if name.startswith(URL):
+            name = name[len(URL):]
+        self.port = name
+        self.timeout = timeout          # response line timeout, applied by the daemon
+        self.wait = wait                # maximum wait for a reply, including the queue time
+        self.baudrate = 57600
+        self.path = find_socket(name)
+        if self.path is None:
+            raise OSError('{} is not served by xln_daemon'.format(name))
+        self.sock = None
+        self.buf = bytearray()          # bytes received, of a reply not yet complete
+        self.lines = deque()
+        self.pending = 0                # replies not received yet
+        self.skip = 0                   # replies to discard, after an input buffer reset or a timeout
+        self.is_open = False
+        self.idn = self.model = self.sernum = self.version = b''
+        if not do_not_open:
+            self.open()
+
+    # receive until the buffer holds 'n' bytes. the bytes received before a timeout are kept, so the
+    # framing of a reply interrupted by a timeout is not lost
+    def _fill(self, n):
+        while len(self.buf) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise OSError('xln_daemon closed the connection')
+            self.buf += chunk
+
+    # receive a whole reply. returns its lines
+    def _recv_reply(self):
+        self._fill(_COUNT.size)
+        n, = _COUNT.unpack_from(self.buf)
+        pos = _COUNT.size
+        lines = []
+        for _ in range(n):
+            self._fill(pos + _COUNT.size)
+            size, = _COUNT.unpack_from(self.buf, pos)
+            pos += _COUNT.size
+            self._fill(pos + size)
+            lines.append(bytes(self.buf[pos:pos + size]))
+            pos += size
+        del self.buf[:pos]
+        return lines
+
+    def write(self, data):
+        data = bytes(data)
+        self.sock.sendall(_REQUEST.pack(self.timeout or 0.0, len(data)) + data)
+        self.pending += 1
+        return len(data)
+
+    def readline(self, *args, **kw):
+        while not self.lines and self.pending:
+            try:
+                lines = self._recv_reply()
+            except socket.timeout:
+                # the late reply is discarded when it arrives, instead of being read as the next one
+                self.skip = min(self.skip + 1, self.pending)
+                return b''
+            self.pending -= 1
+            if self.skip:
+                self.skip -= 1
+            else:
+                self.lines.extend(lines)
+        return self.lines.popleft() if self.lines else b''
+
+    # the responses still pending are discarded when they arrive
+    def reset_input_buffer(self):
+        self.lines.clear()
+        self.skip = self.pending
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return sum(len(ln) for ln in self.lines)
+
+    # connect to the session, and receive the identity of the supply
+    def open(self):
+        if self.is_open:
+            return
+        self.sock = socket.socket(socket.AF_UNIX)
+        self.sock.connect(self.path)
+        self.sock.settimeout(self.wait)
+        self.is_open = True
+        self.idn, self.model, self.sernum, self.version = self._recv_reply()
+
+    def close(self):
+        if self.is_open:
+            self.sock.close()
+            self.is_open = False
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python xln_daemon.py <portname> [<portname> ...]')
+        sys.exit(1)
+    try:
+        asyncio.run(serve(sys.argv[1:]))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -0,0 +1,161 @@
+###################################################################################################
+#   XLN_DISCOVER - PARALLEL AUTO-DISCOVERY OF THE XLN POWER SUPPLIES CONNECTED TO THE COMPUTER
+#   -----------------------------------------------------------------------------------------
+#
+#   This module finds the serial port of a XLN power supply from its model or serial number, instead
+#   of a hardcoded port name.
+#
+#   1)  Filter: the XLN serial interface is a Silicon Labs CP2102 USB bridge, with USB VID:PID
+#       10C4:EA60. Only the ports with that USB identity are candidates.
+#
+#   2)  Probe: the candidate ports are opened and probed in parallel, one thread per port, with a
+#       short timeout. 'MODEL?' and 'SYS:SER?' are pipelined in a single write. A port that answers
+#       with a XLN model string is a confirmed power supply. The CP2102 is bus-powered, so the port
+#       of an unpowered supply is enumerated, but does not answer.
+#
+#   3)  Cache: the port map (port name, USB identity, model and serial number of each port) is saved
+#       in 'ports.json' in the xln_cache folder. On the next discovery, only the ports whose USB
+#       identity changed (new, replugged or swapped devices), and the ports that did not answer, are
+#       probed again. Resolving a known supply takes only the port enumeration, a few milliseconds.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   candidate_ports()                   the CP2102 ports in the system
+#   probe(portname)                     (model, sernum) of the supply on a port, or None
+#   discover(refresh, extra)            updates and returns the port map {portname: entry}
+#   find_port(model, sernum)            the port name of a supply, or None if not found
+#
+#   'extra' is a list of port names or urls that are always probed, such as xln_emu.py emulators.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+import serial
+from serial.tools import list_ports
+from xln_cache import cache_path, load_json, save_json
+
+# Silicon Labs CP2102 USB to serial bridge
+CP2102_VID = 0x10C4
+CP2102_PID = 0xEA60
+
+# probe timeout, in seconds. a powered supply answers in a few milliseconds
+PROBE_TIMEOUT = 0.3
+
+# USB identity of a port: a replugged or swapped device changes it
+def usb_identity(com):
+    return '{:04X}:{:04X}:{}:{}'.format(com.vid or 0, com.pid or 0, com.serial_number, com.location)
+
+# the CP2102 ports in the system
+def candidate_ports():
+    return [com for com in list_ports.comports() if com.vid == CP2102_VID and com.pid == CP2102_PID]
+
+# probe the supply on 'portname'. returns (model, sernum) strings, or None if no XLN answers
+def probe(portname, timeout=PROBE_TIMEOUT):
+    try:
+        instr = serial.serial_for_url(portname, do_not_open=True)
+        instr.baudrate = 57600
+        instr.timeout = timeout
+        instr.open()
+    except (serial.SerialException, OSError, ValueError):
+        return None
+    try:
+        instr.reset_input_buffer()
+        instr.write("\r\nMODEL?\r\nSYS:SER?\r\n".encode())
+        model = instr.readline().strip().decode(errors='replace')
+        sernum = instr.readline().strip().decode(errors='replace')
+    except (serial.SerialException, OSError):
+        return None
+    finally:
+        instr.close()
+    if not model.startswith('XLN'):
+        return None
+    return model, sernum
+
+# update the port map: enumerate the CP2102 ports, and probe in parallel the ports that are new, whose
+# USB identity changed or that did not answer before, and the 'extra' ports. refresh=True probes all.
+# returns the port map {portname: {'usb', 'model', 'sernum', 'time'}}, model is '' for no answer
+def discover(refresh=False, extra=(), timeout=PROBE_TIMEOUT, path=None):
+    path = path or cache_path('ports.json')
+    cached = load_json(path)
+    current = {com.device: usb_identity(com) for com in candidate_ports()}
+    current.update({p: '' for p in extra})
+    ports = {}
+    stale = []
+    for dev, usb in current.items():
+        entry = cached.get(dev)
+        if refresh or not usb or entry is None or entry['usb'] != usb or not entry['model']:
+            stale.append(dev)
+        else:
+            ports[dev] = entry
+    if stale:
+        # imported here: it loads the logging module, a sizeable part of the start time of the scripts
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+            results = pool.map(lambda p: probe(p, timeout), stale)
+        for dev, res in zip(stale, results):
+            model, sernum = res or ('', '')
+            ports[dev] = {'usb': current[dev], 'model': model, 'sernum': sernum,
+                          'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+    if ports != cached:
+        save_json(path, ports)
+    return ports
+
+# check a port map entry against a model and/or serial number
+def _match(entry, model, sernum):
+    if not entry['model']:
+        return False
+    if model and model != entry['model']:
+        return False
+    if sernum and sernum != entry['sernum']:
+        return False
+    return True
+
+# the port name of the supply with 'model' and/or 'sernum' (str or bytes), or None if not found.
+# the cached port map is tried first, and all ports are probed again only if it has no match
+def find_port(model=None, sernum=None, extra=()):
+    if isinstance(model, bytes):
+        model = model.decode()
+    if isinstance(sernum, bytes):
+        sernum = sernum.decode()
+    for refresh in (False, True):
+        ports = discover(refresh, extra)
+        for dev in sorted(ports):
+            if _match(ports[dev], model, sernum):
+                return dev
+    return None
@@ -0,0 +1,575 @@
+###################################################################################################
+#   XLN_EMU - SOFTWARE EMULATOR OF THE XLN POWER SUPPLY SERIAL INTERFACE
+#   --------------------------------------------------------------------
+#
+#   This is an emulated XLN power supply, used to run and benchmark the example scripts without the
+#   instrument connected.
+#
+#   The emulator implements the SCPI commands used by the scripts:
+#
+#       *IDN?  *OPC?  *CLS  *RST  MODEL?  SYS:SER?  VER?  STATUS?  SYS:ERR?
+#       SOUR:VOLT  SOUR:CURR  VOUT?  IOUT?  OUTP
+#       PROG  PROG:CLE  PROG:CLE:ALL  PROG:REP  PROG:TOTA  PROG:NEXT  PROG:SAV  PROG:RUN
+#       PROG:STEP  PROG:STEP:VOLT  PROG:STEP:CURR  PROG:STEP:ONT
+#
+#   and the query form of all the settings. List programs are executed on the emulator's own
+#   timeline, following the PROG:REP repetitions and the PROG:NEXT chaining. The output is connected
+#   to a resistive load, so VOUT? and IOUT? follow the voltage and current settings, including the
+#   constant current limit.
+#
+#   The serial link is modelled with:
+#       - baud rate throttling of the bytes on the wire, in both directions
+#       - a per-command execution latency, with a random jitter
+#       - an optional finite instrument input buffer, that drops commands sent faster than the
+#         instrument can execute them
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   The emulator can be used in three ways:
+#
+#   1)  In-process, as a drop-in replacement of the pyserial object:
+#
+#           bk = EmulatedSerial(model='XLN3640', latency=0.002)
+#
+#   2)  As a pseudo-terminal. The scripts open the printed '/dev/pts/N' device as their 'portname':
+#
+#           python xln_emu.py --pty
+#
+#   3)  As a TCP server. The scripts open 'socket://localhost:5025' as their 'portname':
+#
+#           python xln_emu.py --tcp 5025
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import threading
+from collections import deque
+from xln_program import MODELS, NUM_PROGRAMS, MAX_STEPS, MIN_ONT
+
+script_ver = "v1.0.1"
+
+# SCPI long form to short form of the command nodes
+_SHORT = {
+    'SOURCE': 'SOUR', 'VOLTAGE': 'VOLT', 'CURRENT': 'CURR', 'OUTPUT': 'OUTP', 'PROGRAM': 'PROG',
+    'TOTAL': 'TOTA', 'CLEAR': 'CLE', 'SAVE': 'SAV', 'REPEAT': 'REP', 'SYSTEM': 'SYS', 'SYST': 'SYS',
+    'SERIAL': 'SER', 'ERROR': 'ERR', 'VERSION': 'VER',
+}
+
+# a new empty list program
+def _new_program():
+    return {'rep': 0, 'next': 0, 'steps': []}
+
+# copy of a list program
+def _copy_program(p):
+    return {'rep': p['rep'], 'next': p['next'], 'steps': [list(s) for s in p['steps']]}
+
+# emulated instrument state and SCPI command parser
+class XlnEmulator:
+    def __init__(self, model='XLN3640', sernum='EMU00000001', version='V1.30', load=10.0):
+        self.model = model
+        self.sernum = sernum
+        self.version = version
+        self.vmax, self.imax = MODELS.get(model, (36.0, 40.0))
+        self.load = load                # resistive load on the output, in ohms
+        self.programs = {n: _new_program() for n in range(1, NUM_PROGRAMS+1)}
+        self.errors = deque(maxlen=16)
+        self.commands = 0
+        self.reset()
+
+    # power-on state
+    def reset(self):
+        self.vset = 0.0
+        self.iset = self.imax
+        self.output = False
+        self.prog = 1
+        self.edit = _copy_program(self.programs[1])
+        self.step = 0
+        self.run = None                 # running program cursor: [prog, cycle, step, step_start]
+
+    def _error(self, msg):
+        self.errors.append(msg)
+
+    # advance the running program cursor to time 't'
+    def _advance(self, t):
+        while self.run is not None:
+            prog, cycle, step, t0 = self.run
+            p = self.programs[prog]
+            if step >= len(p['steps']):
+                self.run = None
+                break
+            t1 = t0 + max(p['steps'][step][2], MIN_ONT)
+            if t < t1:
+                break
+            step += 1
+            if step >= len(p['steps']):
+                step = 0
+                cycle += 1
+                if cycle > p['rep']:
+                    prog, cycle = p['next'], 0
+                    if prog == 0 or not self.programs[prog]['steps']:
+                        self.run = None
+                        break
+            self.run = [prog, cycle, step, t1]
+
+    # programmed (volts, amps) at time 't'
+    def _setpoint(self, t):
+        self._advance(t)
+        if self.run is not None:
+            v, i, _ = self.programs[self.run[0]]['steps'][self.run[2]]
+            return v, i
+        return self.vset, self.iset
+
+    # output (volts, amps) into the resistive load at time 't'
+    def measure(self, t):
+        if not self.output:
+            return 0.0, 0.0
+        v, i = self._setpoint(t)
+        if self.load > 0 and v / self.load > i:
+            return i * self.load, i
+        return v, (v / self.load if self.load > 0 else 0.0)
+
+    # normalize a SCPI header to its short uppercase form
+    def _header(self, hdr):
+        nodes = hdr.upper().lstrip(':').split(':')
+        nodes = [_SHORT.get(n, n) for n in nodes]
+        if nodes and nodes[0] == 'SOUR':
+            nodes = nodes[1:]
+        return ':'.join(nodes)
+
+    # execute one SCPI line at time 't'. returns the response string, or None for commands
+    def execute(self, line, t):
+        responses = []
+        for cmd in line.strip().split(';'):
+            cmd = cmd.strip()
+            if not cmd:
+                continue
+            self.commands += 1
+            parts = cmd.split(None, 1)
+            hdr = self._header(parts[0])
+            arg = parts[1].strip() if len(parts) > 1 else ''
+            try:
+                resp = self._execute(hdr, arg, t)
+            except (ValueError, IndexError, KeyError):
+                self._error('-224,"Illegal parameter value" ' + cmd)
+                resp = None
+            if resp is not None:
+                responses.append(resp)
+        if not responses:
+            return None
+        return ';'.join(responses)
+
+    def _execute(self, hdr, arg, t):
+        query = hdr.endswith('?')
+        node = hdr.rstrip('?')
+        if query:
+            return self._query(node, t)
+        # common commands
+        if node == '*CLS':
+            self.errors.clear()
+        elif node == '*RST':
+            self.reset()
+        elif node in ('*WAI', '*OPC'):
+            pass
+        # output settings
+        elif node == 'VOLT':
+            self.vset = min(max(float(arg), 0.0), self.vmax)
+        elif node == 'CURR':
+            self.iset = min(max(float(arg), 0.0), self.imax)
+        elif node == 'OUTP':
+            self.output = arg.upper() in ('ON', '1')
+            if not self.output:
+                self.run = None
+        # list programs
+        elif node == 'PROG':
+            n = int(arg)
+            if n not in self.programs:
+                raise ValueError
+            self.prog = n
+            self.edit = _copy_program(self.programs[n])
+            self.step = 0
+        elif node == 'PROG:CLE':
+            self.programs[self.prog] = _new_program()
+            self.edit = _new_program()
+        elif node == 'PROG:CLE:ALL':
+            self.programs = {n: _new_program() for n in range(1, NUM_PROGRAMS+1)}
+            self.edit = _new_program()
+        elif node == 'PROG:REP':
+            self.edit['rep'] = int(arg)
+        elif node == 'PROG:NEXT':
+            n = int(arg)
+            if n != 0 and n not in self.programs:
+                raise ValueError
+            self.edit['next'] = n
+        elif node == 'PROG:TOTA':
+            n = int(arg)
+            if n < 0 or n > MAX_STEPS:
+                raise ValueError
+            steps = self.edit['steps'][:n]
+            steps += [[0.0, 0.0, 0.0] for _ in range(n - len(steps))]
+            self.edit['steps'] = steps
+        elif node == 'PROG:STEP':
+            n = int(arg)
+            if n < 1 or n > len(self.edit['steps']):
+                raise ValueError
+            self.step = n - 1
+        elif node == 'PROG:STEP:VOLT':
+            self.edit['steps'][self.step][0] = min(max(float(arg), 0.0), self.vmax)
+        elif node == 'PROG:STEP:CURR':
+            self.edit['steps'][self.step][1] = min(max(float(arg), 0.0), self.imax)
+        elif node == 'PROG:STEP:ONT':
+            self.edit['steps'][self.step][2] = max(float(arg), 0.0)
+        elif node == 'PROG:SAV':
+            self.programs[self.prog] = _copy_program(self.edit)
+        elif node == 'PROG:RUN':
+            if arg.upper() in ('ON', '1'):
+                if self.programs[self.prog]['steps']:
+                    self.run = [self.prog, 0, 0, t]
+            else:
+                self._advance(t)
+                self.run = None
+        else:
+            self._error('-113,"Undefined header" ' + hdr)
+        return None
+
+    def _query(self, node, t):
+        if node == '*IDN':
+            return 'B&K PRECISION,{},{},{}'.format(self.model, self.sernum, self.version)
+        if node == '*OPC':
+            return '1'
+        if node == 'MODEL':
+            return self.model
+        if node == 'SYS:SER':
+            return self.sernum
+        if node == 'VER':
+            return self.version
+        if node == 'STATUS':
+            self._advance(t)
+            return '{}'.format((1 if self.output else 0) | (2 if self.run is not None else 0))
+        if node == 'SYS:ERR':
+            return self.errors.popleft() if self.errors else '0,"No error"'
+        if node == 'VOLT':
+            return '{:.3f}'.format(self.vset)
+        if node == 'CURR':
+            return '{:.3f}'.format(self.iset)
+        if node == 'VOUT':
+            return '{:.3f}'.format(self.measure(t)[0])
+        if node == 'IOUT':
+            return '{:.3f}'.format(self.measure(t)[1])
+        if node == 'OUTP':
+            return 'ON' if self.output else 'OFF'
+        if node == 'PROG':
+            return '{}'.format(self.prog)
+        if node == 'PROG:REP':
+            return '{}'.format(self.edit['rep'])
+        if node == 'PROG:NEXT':
+            return '{}'.format(self.edit['next'])
+        if node == 'PROG:TOTA':
+            return '{}'.format(len(self.edit['steps']))
+        if node == 'PROG:STEP':
+            return '{}'.format(self.step + 1)
+        if node == 'PROG:STEP:VOLT':
+            return '{:.3f}'.format(self.edit['steps'][self.step][0])
+        if node == 'PROG:STEP:CURR':
+            return '{:.3f}'.format(self.edit['steps'][self.step][1])
+        if node == 'PROG:STEP:ONT':
+            return '{:.3f}'.format(self.edit['steps'][self.step][2])
+        if node == 'PROG:RUN':
+            self._advance(t)
+            return 'ON' if self.run is not None else 'OFF'
+        self._error('-113,"Undefined header" ' + node + '?')
+        return None
+
+# timing model of the serial link and of the instrument command parser.
+# all times are time.monotonic() seconds
+class EmuLink:
+    def __init__(self, emu, baudrate=57600, latency=0.002, jitter=0.0005, rx_buffer=None, seed=None):
+        self.emu = emu
+        self.baudrate = baudrate        # wire rate, None or 0 to disable throttling
+        self.latency = latency          # command execution time, in seconds
+        self.jitter = jitter            # random extra execution time, uniform in [0, jitter]
+        self.rx_buffer = rx_buffer      # instrument input buffer size in bytes, None for unlimited
+        self.overruns = 0               # commands dropped by input buffer overrun
+        self.lock = threading.Condition()
+        self._rnd = random.Random(seed)
+        self._line = b''
+        self._wire_in = 0.0             # time the host-to-instrument wire becomes idle
+        self._wire_out = 0.0            # time the instrument-to-host wire becomes idle
+        self._busy = 0.0                # time the command parser becomes idle
+        self._pending = deque()         # (start time, bytes) of received lines waiting for the parser
+        self._out = deque()             # (ready time, bytes) of responses in flight to the host
+
+    def _byte_time(self):
+        return 10.0 / self.baudrate if self.baudrate else 0.0
+
+    # bytes written by the host at time 'now'
+    def feed(self, data, now=None):
+        with self.lock:
+            now = time.monotonic() if now is None else now
+            bt = self._byte_time()
+            t = max(now, self._wire_in)
+            while data:
+                k = data.find(b'\n')
+                seg, data = (data, b'') if k < 0 else (data[:k+1], data[k+1:])
+                t += len(seg) * bt
+                self._line += seg
+                if k >= 0:
+                    self._receive(self._line, t)
+                    self._line = b''
+            self._wire_in = t
+            self.lock.notify_all()
+
+    # a complete line arrived at the instrument at time 't'
+    def _receive(self, line, t):
+        while self._pending and self._pending[0][0] <= t:
+            self._pending.popleft()
+        if self.rx_buffer and sum(n for _, n in self._pending) + len(line) > self.rx_buffer:
+            self.overruns += 1
+            return
+        start = max(t, self._busy)
+        ncmd = max(line.count(b';') + 1, 1)
+        done = start + ncmd * self.latency + self._rnd.uniform(0.0, self.jitter)
+        self._busy = done
+        self._pending.append((start, len(line)))
+        resp = self.emu.execute(line.decode(errors='replace'), done)
+        if resp is not None:
+            out = (resp + '\r\n').encode()
+            ready = max(done, self._wire_out) + len(out) * self._byte_time()
+            self._wire_out = ready
+            self._out.append((ready, out))
+
+    # time the next response is ready, or None
+    def next_ready(self):
+        with self.lock:
+            return self._out[0][0] if self._out else None
+
+    # pop all responses ready at time 'now'
+    def collect(self, now=None):
+        now = time.monotonic() if now is None else now
+        data = b''
+        with self.lock:
+            while self._out and self._out[0][0] <= now:
+                data += self._out.popleft()[1]
+        return data
+
+# pyserial compatible port object connected to an emulated XLN
+class EmulatedSerial:
+    def __init__(self, port='emu://XLN3640', model='XLN3640', baudrate=57600, timeout=None, link=None, **kw):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.link = link or EmuLink(XlnEmulator(model), baudrate=baudrate, **kw)
+        self.is_open = False
+        self._buf = b''
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        self.link.feed(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _fill(self):
+        self._buf += self.link.collect()
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self._buf)
+
+    def reset_input_buffer(self):
+        self._fill()
+        self._buf = b''
+
+    def reset_output_buffer(self):
+        pass
+
+    # wait for data until 'deadline'. returns False on timeout
+    def _wait(self, deadline):
+        nxt = self.link.next_ready()
+        now = time.monotonic()
+        if nxt is None:
+            if deadline is None:
+                raise RuntimeError('emulated read would block forever')
+            if now < deadline:
+                time.sleep(deadline - now)
+            return False
+        if deadline is not None and nxt > deadline:
+            if now < deadline:
+                time.sleep(deadline - now)
+            return False
+        if nxt > now:
+            time.sleep(nxt - now)
+        return True
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._fill()
+        while len(self._buf) < size and self._wait(deadline):
+            self._fill()
+        self._fill()
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def read_until(self, expected=b'\n', size=None):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._fill()
+        while expected not in self._buf and self._wait(deadline):
+            self._fill()
+        self._fill()
+        k = self._buf.find(expected)
+        n = len(self._buf) if k < 0 else k + len(expected)
+        if size is not None:
+            n = min(n, size)
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+    def readline(self, size=None):
+        return self.read_until(b'\n', size)
+
+# move bytes between a host connection and the link, until the connection closes.
+# 'recv' returns b'' when the host disconnects, 'send' writes bytes to the host
+def _pump(link, recv, send):
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            nxt = link.next_ready()
+            if nxt is None:
+                with link.lock:
+                    link.lock.wait(0.05)
+                continue
+            dt = nxt - time.monotonic()
+            if dt > 0:
+                time.sleep(min(dt, 0.05))
+                continue
+            data = link.collect()
+            if data:
+                send(data)
+
+    th = threading.Thread(target=writer, daemon=True)
+    th.start()
+    try:
+        while True:
+            data = recv()
+            if not data:
+                break
+            link.feed(data)
+    finally:
+        stop.set()
+        th.join()
+
+# serve the emulator on a pseudo-terminal. returns the device name the scripts should open
+def serve_pty(link):
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    name = os.ttyname(slave)
+
+    def recv():
+        try:
+            return os.read(master, 4096)
+        except OSError:
+            return b''
+
+    th = threading.Thread(target=_pump, args=(link, recv, lambda d: os.write(master, d)), daemon=True)
+    th.start()
+    return name
+
+# serve the emulator on a TCP port, for pyserial 'socket://host:port' urls. blocks forever
+def serve_tcp(link, port, host='localhost'):
+    srv = socket.create_server((host, port))
+    while True:
+        conn, addr = srv.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print('client connected:', addr)
+
+        def recv():
+            # acknowledge at once: pyserial does not disable Nagle on its side, and a delayed ACK
+            # would stall every small command write by tens of milliseconds
+            if hasattr(socket, 'TCP_QUICKACK'):
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            return conn.recv(4096)
+
+        _pump(link, recv, conn.sendall)
+        conn.close()
+        print('client disconnected:', addr)
+
+# main code
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='XLN power supply emulator')
+    ap.add_argument('--model', default='XLN3640', choices=sorted(MODELS))
+    ap.add_argument('--sernum', default='EMU00000001')
+    ap.add_argument('--pty', action='store_true', help='serve on a pseudo-terminal')
+    ap.add_argument('--tcp', type=int, metavar='PORT', help='serve on a TCP port (socket://localhost:PORT)')
+    ap.add_argument('--baud', type=int, default=57600, help='wire rate throttling, 0 to disable')
+    ap.add_argument('--latency', type=float, default=0.002, help='command execution time, in seconds')
+    ap.add_argument('--jitter', type=float, default=0.0005, help='random extra execution time, in seconds')
+    ap.add_argument('--rx-buffer', type=int, default=None, help='instrument input buffer size, in bytes')
+    ap.add_argument('--load', type=float, default=10.0, help='resistive load on the output, in ohms')
+    args = ap.parse_args()
+
+    print()
+    print('XLN POWER SUPPLY EMULATOR ', script_ver)
+    print('----------------------------------------------')
+    emu = XlnEmulator(args.model, args.sernum, load=args.load)
+    link = EmuLink(emu, args.baud, args.latency, args.jitter, args.rx_buffer)
+    if args.tcp:
+        print('portname:\t\t socket://localhost:{}'.format(args.tcp))
+        serve_tcp(link, args.tcp)
+    elif args.pty or sys.platform != 'win32':
+        print('portname:\t\t', serve_pty(link))
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print('ERROR: --pty is not available on windows, use --tcp.')
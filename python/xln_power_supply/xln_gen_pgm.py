@@ -46,7 +46,10 @@
 #       2) Generates each step for the defined waveform
 #       3) Store the program to memory '1'
 #       4) Validate the number of steps in PROG 1
-#       5) Close the serial port
+#       5) Print the xln_metrics count, bytes and latency of each SCPI command, and export them
+#       6) Close the serial port
+#   The serial session can be recorded to 'transcript_file', and replayed with xln_transcript, by
+#   running the script again with the port name 'replay://<transcript_file>'.
 # 
 #--------------------------------------------------------------------------------------------------
 #   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
@@ -84,109 +87,105 @@
 # 
 ###################################################################################################
 
-import serial
+import sys
 import time
+from xln_discover import find_port
+from xln_scpi import serial_for_url
+from xln_ident import identify, print_identity, ID_UNRESPONSIVE
+from xln_program import compile_program
+from xln_upload import upload_compiled, upload_diff, upload_cached, print_stats
+from xln_metrics import MeteredPort, print_metrics
+from xln_transcript import RecordingPort
 
-script_ver = "v1.0.13"
+script_ver = "v1.9.2"
 model_id = b'XLN3640'                       # change the model_id to your XLN model
 portname = '/dev/tty.usbserial-275K22178'   # change the device port name for your device name!
                                             # on windows use 'COMxx'
+                                            # use 'socket://localhost:5025' for the xln_emu.py emulator
+                                            # use 'daemon://<sernum>' for a supply served by xln_daemon.py
+                                            # use 'replay://<session.xlr>' to replay a xln_transcript.py recording
+                                            # use None to find the 'model_id' supply by auto-discovery
 
 # program list definition: change these lists to modify the program list waveform
 vp = [0.0,  0.5,  1.0,  1.5,  2.0,  2.5,  3.0,  3.5,  4.0,  4.5,  5.0,  5.5,  6.0,  6.5,  7.0,  7.5,  8.0,  8.5,  9.0,  9.5,  10.0, 0.0]
 ip = [6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  0.0]
 tp = [0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50, 0.50]
 
-def read_integer(instr):
-    try:
-        rd = instr.readline()
-        # print('rd: ', rd)
-        resp = int(rd)
-    except:
-        resp = 0
-    return resp
+# upload mode: 'full' clears and rewrites PROG 1, 'diff' only rewrites the steps that changed,
+# 'cache' skips the upload if PROG 1 already holds this program, according to the host-side cache
+upload_mode = 'cache'
 
-# main code
-print()
-print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
-print('LIST PROGRAM GENERATOR ', script_ver)
-print('----------------------------------------------')
-bk = serial.Serial()
-bk.port = portname
-bk.baudrate = 57600
-bk.timeout = 0.2
-bk.open()
-if bk.is_open:
-    print('Serial port OPEN')
-    # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
-    bk.reset_input_buffer()
-    bk.reset_output_buffer()
-    bk.write("\r\n".encode())               
-    bk.write("*idn?\r\n".encode())          
-    idn = bk.readline()                     
-    bk.write("MODEL?\r\n".encode())
-    model = bk.readline()                   
-    bk.write("SYS:SER?\r\n".encode())          
-    sernum = bk.readline()                  
-    bk.write("VER?\r\n".encode())          
-    version = bk.readline()
-    print('portname:\t\t', portname)
-    print('Instrument ID:\t\t', idn)
-    print('Instrument MODEL:\t', model)
-    print('Instrument VERSION:\t', version)
-    print('Instrument SN:\t\t', sernum)
-    if model_id in model:
-        # The power supply responded. Now we can send SCPI commands. 
-        print(model_id.decode(), "validated!")
-        bk.write("*cls\r\n".encode())
-        bk.write("STATUS?\r\n".encode())
-        print("STATUS? : ", bk.readline())
+# link metrics export: writes '<metrics_file>.json' and the Prometheus '<metrics_file>.prom'. None to only print them
+metrics_file = None
 
-        # clear existing PROG 1
-        time.sleep(0.2);    bk.write("PROG 1\r\n".encode());                        print("PROG 1")
-        time.sleep(0.2);    bk.write("PROG:CLE\r\n".encode());                      print("PROG:CLE")
-        
-        # define list program 1 header
-        time.sleep(0.2);    bk.write("PROG 1\r\n".encode());                        print("PROG 1")
-        time.sleep(0.2);    bk.write("PROG:REP 0\r\n".encode());                    print("PROG:REP 0")
-        time.sleep(0.2);    bk.write("PROG:TOTA {}\r\n".format(len(vp)).encode());  print("PROG:TOTA {}".format(len(vp)))
+# transcript of the serial session, for xln_transcript.ReplayPort. None to not record it
+transcript_file = None
 
-        # generate all the program steps
-        k = 0
-        while k < len(vp):
-            time.sleep(0.2);    bk.write("PROG:STEP {}\r\n".format(k+1).encode());         print("PROG:STEP {}".format(k+1))
-            time.sleep(0.2);    bk.write("PROG:STEP:CURR {}\r\n".format(ip[k]).encode());  print("PROG:STEP:CURR {}".format(ip[k]))
-            time.sleep(0.2);    bk.write("PROG:STEP:VOLT {}\r\n".format(vp[k]).encode());  print("PROG:STEP:VOLT {}".format(vp[k]))
-            time.sleep(0.2);    bk.write("PROG:STEP:ONT {}\r\n".format(tp[k]).encode());   print("PROG:STEP:ONT {}".format(tp[k]))
-            k = k + 1
+# main code
+def main(portname=portname, model_id=model_id, vp=vp, ip=ip, tp=tp):
+    print()
+    print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+    print('LIST PROGRAM GENERATOR ', script_ver)
+    print('----------------------------------------------')
+    if portname is None:
+        # find the port of the 'model_id' power supply, from the cached port map or by probing the CP2102 ports
+        portname = find_port(model=model_id)
+        print('auto-discovery:\t\t', portname)
+    if portname is None:
+        print('ERROR: no {} power supply found. check the USB cable and the power.'.format(model_id.decode()))
+        sys.exit(1)
+    bk = serial_for_url(portname, do_not_open=True)
+    bk.baudrate = 57600
+    bk.timeout = 0.2
+    bk.open()
+    if bk.is_open:
+        print('Serial port OPEN')
+        if transcript_file:
+            # record every byte exchanged, with its timestamp
+            bk = RecordingPort(bk, transcript_file)
+        # count the commands, bytes and round-trip latency of every SCPI command
+        bk = MeteredPort(bk, portname)
+        # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
+        ident = identify(bk, portname)
+        print_identity(portname, ident)
+        model, sernum = ident.model, ident.sernum
+        if model_id in model:
+            # The power supply responded. Now we can send SCPI commands. 
+            print(model_id.decode(), "validated!")
+            bk.write("*cls\r\n".encode())
+            bk.write("STATUS?\r\n".encode())
+            print("STATUS? : ", bk.readline())
 
-        # set NEXT program as 0
-        time.sleep(0.2);    bk.write("PROG:NEXT 0\r\n".encode());                   print("PROG:NEXT 0")
-        # save program as PROG 1
-        time.sleep(0.2);    
-        bk.write("PROG:SAV\r\n".encode());  
-        print("PROG:SAV")
-        time.sleep(1.0);    
-        
-        # readback PROG 1 total steps to validate
-        bk.write("PROG 1\r\n".encode());
-        print("PROG 1")
-        time.sleep(0.4)
-        bk.write("PROG:TOTA?\r\n".encode())
-        time.sleep(0.4)
-        steps = read_integer(bk)
-        print("PROG:TOTA? : ", steps)
-        if steps == 0:
-            print('ERROR: PROG 1 IS EMPTY!')
-        elif steps == len(vp):
-            print('PROG 1 IS SAVED.')
+            if upload_mode == 'cache':
+                # check the host-side cache of the programs stored on this instrument
+                steps, stats = upload_cached(bk, sernum.strip().decode(), 1, vp, ip, tp, rep=0, nxt=0)
+            elif upload_mode == 'diff':
+                # read back PROG 1, and only rewrite the steps that changed
+                steps, stats = upload_diff(bk, 1, vp, ip, tp, rep=0, nxt=0, sernum=sernum.strip().decode())
+            else:
+                # compile the list program into a single byte stream, and upload it to PROG 1
+                pgm = compile_program(1, vp, ip, tp, rep=0, nxt=0)
+                steps, stats = upload_compiled(bk, pgm, sernum=sernum.strip().decode())
+            print_stats(1, stats)
+            print("PROG:TOTA? : ", steps)
+            if steps == 0:
+                print('ERROR: PROG 1 IS EMPTY!')
+            elif steps == len(vp):
+                print('PROG 1 IS SAVED.')
+            else:
+                print('ERROR GENERATING PROG 1!')
+        elif ident.state == ID_UNRESPONSIVE:
+            print('ERROR: USB BRIDGE PRESENT, POWER SUPPLY UNRESPONSIVE! CHECK THE POWER, OR POWER CYCLE IT.')
         else:
-            print('ERROR GENERATING PROG 1!')
+            print('MODEL ID ERROR!')
+        print_metrics(bk)
+        if metrics_file:
+            bk.export_json(metrics_file + '.json')
+            bk.export_prometheus(metrics_file + '.prom')
+        bk.close()
+        print('Serial port CLOSED')
     else:
-        print('MODEL ID ERROR!')
-    bk.close()
-    print('Serial port CLOSED')
-else:
-    print('ERROR: serial.open() failed.')
-
+        print('ERROR: serial.open() failed.')
 
+if __name__ == '__main__':
+    main()
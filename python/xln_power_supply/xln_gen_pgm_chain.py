@@ -0,0 +1,178 @@
+###################################################################################################
+#   XLN_GEN_PGM_CHAIN - GENERATE A LONG PROFILE AS A CHAIN OF LINKED LIST PROGRAMS
+#   ------------------------------------------------------------------------------
+#
+#   This is an example code to demonstrate the BK PRECISION XLN Programmable Power Supply Series. 
+#   
+#   The XLN series have a CP1202 Serial to USB bridge, and enumerate as a serial port. 
+#   On Windows, it will enumerate as a 'COMxx' port name.
+#   On MacOSX, it will enumerate as a '/dev/tty.usbserial-<serial_number>', where <serial_number> 
+#   is the equipment serial number. This naming scheme allows multiple XLN units to be connected to the
+#   same computer, and to be correctly identified.
+#   
+#   The example code uses the pyserial module, and SCPI commands to control the XLN power supply.
+#   This is the basic sequence to talk to the power supply:
+# 
+#   1)  Identify the serial port device name. On Windows, it enumerates as a 'COMxx' virtual serial port. 
+#       On MacOS, it enumerates as a tty.usbserial device, with name '/dev/tty.usbserial-<sernum>', where
+#       <sernum> is the serial number of the XLN power supply. 
+# 
+#   2)  The communication uses the PySerial module API, to open the serial port and exchange ascii strings
+#       with the power supply. All strings exchanged to/from the serial port are byte strings, and need to 
+#       be byte encoded. 
+# 
+#   3)  The XLN series devices have a CP1202 Serial-to-USB Bridge chip, which is bus-powered. So, even when
+#       the power supply is unpowered or unresponsive, the USB device port can be enumerated and opened. This
+#       requires an positive identification from the power supply, before starting sending control commands. 
+# 
+#   4)  The power supply responds with its full device name to the '*IDN?' command, and also with the model and
+#       version to the commands 'MODEL?' and 'VER?'. The serial number can also be read with the 'SYS:SER?' SCPI 
+#       command. We use here the MODEL returned to validate a working device. 
+#       NOTE:   If the power supply is connected and powered up, but is not responding to any identification commands,
+#               it might be necessary to do a manual power OFF/ON on the power supply. 
+# 
+#   5)  Some commands do not need a response, but a few commands are query/response commands, and need to have the 
+#       response read, even if it will be discarded. 
+# 
+#   6)  The serial port must be closed at the end of the program, to avoid a locked port in some operating systems. 
+# 
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+# 
+#   A list program slot holds at most MAX_STEPS steps, too few for a profile of several minutes, such
+#   as a vehicle drive cycle or a battery load profile. The XLN links a program to the next one with
+#   'PROG:NEXT', so when a slot ends the instrument runs the next one, on its own timing, with no
+#   host involvement. This script:
+#       1) Defines a 5 minute profile from a list of (time, volts) waypoints, sampled every 10ms
+#       2) Segments it into the fewest variable-length steps within 'seg_tol' of the profile, up to
+#          MAX_STEPS steps in each of the 'slots' program slots
+#       3) Splits the steps into a chain of slots, each linked to the next with 'PROG:NEXT', and the
+#          last one ending the chain
+#       4) Authenticates the XLN power supply model
+#       5) Uploads every slot (skipped for the slots that already hold their part of the chain)
+#       6) Verifies the steps, repetitions and 'PROG:NEXT' link of every slot
+#       7) Close the serial port
+#   Running the first slot (xln_run_pgm.py) runs the whole profile.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import sys
+import time
+from xln_discover import find_port
+from xln_scpi import serial_for_url
+from xln_ident import identify, print_identity, ID_UNRESPONSIVE
+from xln_program import link_program, MAX_STEPS
+from xln_waveform import segment_waveform
+from xln_upload import upload_chain, print_stats
+import numpy as np
+
+script_ver = "v1.1.1"
+model_id = b'XLN3640'                       # change the model_id to your XLN model
+portname = '/dev/tty.usbserial-275K22178'   # change the device port name for your device name!
+                                            # on windows use 'COMxx'
+                                            # use 'socket://localhost:5025' for the xln_emu.py emulator
+                                            # use 'daemon://<sernum>' for a supply served by xln_daemon.py
+                                            # use 'replay://<session.xlr>' to replay a xln_transcript.py recording
+                                            # use None to find the 'model_id' supply by auto-discovery
+
+# --- define the profile ------------------------
+# (time s, volts) waypoints of the profile, linearly interpolated. change to your profile
+waypoints = [(0, 0.0), (5, 12.0), (40, 12.0), (45, 14.4), (90, 14.4), (92, 9.0), (95, 12.6),
+             (150, 13.8), (152, 6.5), (153, 11.0), (200, 12.0), (240, 14.4), (280, 12.0), (300, 0.0)]
+ripple = 0.5                                # volts of a 0.2Hz ripple added to the profile
+ip = 6.0                                    # 6A current limit
+dt = 0.01                                   # 10ms profile sampling
+seg_tol = 0.05                              # max error (V) of the steps, relaxed if the chain is full
+slots = list(range(1, 11))                  # program slots of the chain, the first one starts it
+# -----------------------------------------------
+
+wt, wv = np.array(waypoints).T
+t = np.arange(0, wt[-1], dt)
+v = np.interp(t, wt, wv) + ripple * np.sin(2*np.pi*0.2*t) * (t > wt[1]) * (t < wt[-2])
+
+# variable-length steps within 'seg_tol' of the profile, with the step budget of all the slots
+wf = segment_waveform(v, ip, dt, tol=seg_tol, max_steps=MAX_STEPS*len(slots), model=model_id)
+chain = link_program(wf.vp, wf.ip, wf.tp, slots=slots)
+
+# main code
+print()
+print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+print('LIST PROGRAM GENERATOR - CHAINED PROFILE ', script_ver)
+print('----------------------------------------------')
+print('profile: {} samples, {:.0f}s, segmented into {} steps, max error {:.3f}V, {} clamped'.format(
+    wf.samples, sum(wf.tp), len(wf.vp), wf.error, wf.clamped))
+print('chain: PROG', ' -> '.join(str(ln.prog) for ln in chain))
+if portname is None:
+    # find the port of the 'model_id' power supply, from the cached port map or by probing the CP2102 ports
+    portname = find_port(model=model_id)
+    print('auto-discovery:\t\t', portname)
+if portname is None:
+    print('ERROR: no {} power supply found. check the USB cable and the power.'.format(model_id.decode()))
+    sys.exit(1)
+bk = serial_for_url(portname, do_not_open=True)
+bk.baudrate = 57600
+bk.timeout = 0.2
+bk.open()
+if bk.is_open:
+    print('Serial port OPEN')
+    # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
+    ident = identify(bk, portname)
+    print_identity(portname, ident)
+    model, sernum = ident.model, ident.sernum
+    if model_id in model:
+        # The power supply responded. Now we can send SCPI commands. 
+        print(model_id.decode(), "validated!")
+        bk.write("*cls\r\n".encode())
+        bk.write("STATUS?\r\n".encode())
+        print("STATUS? : ", bk.readline())
+
+        # upload all the slots through the host-side cache, then verify the chain links
+        steps, stats = upload_chain(bk, chain, sernum.strip().decode(), verbose=True)
+        print('chain upload: {} commands, {} bytes in {:.2f}s'.format(stats.commands, stats.nbytes, stats.elapsed))
+        if steps == len(wf.vp):
+            print('PROG {} CHAIN IS SAVED, {} steps in {} slots.'.format(chain[0].prog, steps, len(chain)))
+        else:
+            print('ERROR GENERATING THE PROGRAM CHAIN!')
+    elif ident.state == ID_UNRESPONSIVE:
+        print('ERROR: USB BRIDGE PRESENT, POWER SUPPLY UNRESPONSIVE! CHECK THE POWER, OR POWER CYCLE IT.')
+    else:
+        print('MODEL ID ERROR!')
+    bk.close()
+    print('Serial port CLOSED')
+else:
+    print('ERROR: serial.open() failed.')
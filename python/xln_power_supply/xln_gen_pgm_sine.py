@@ -87,114 +87,113 @@
 # 
 ###################################################################################################
 
-import serial
+import sys
 import time
-import numpy as np
+from xln_discover import find_port
+from xln_scpi import serial_for_url
+from xln_ident import identify, print_identity, ID_UNRESPONSIVE
+from xln_program import compile_program, MAX_STEPS
+from xln_upload import upload_compiled, upload_diff, upload_cached, print_stats
 
-script_ver = "v1.0.14"
+script_ver = "v1.9.2"
 model_id = b'XLN3640'                       # change the model_id to your XLN model
 portname = '/dev/tty.usbserial-275K22178'   # change the device port name for your device name!
                                             # on windows use 'COMxx'
+                                            # use 'socket://localhost:5025' for the xln_emu.py emulator
+                                            # use 'daemon://<sernum>' for a supply served by xln_daemon.py
+                                            # use 'replay://<session.xlr>' to replay a xln_transcript.py recording
+                                            # use None to find the 'model_id' supply by auto-discovery
 
-# --- generate an array vp[] with SIN(x) --------
-step = np.pi/32
-x = np.arange(0, 2*np.pi, step)             # 64 steps
-vp = 10*((np.sin(x)+1.0)/2.0)               # offset and scale for (0V, 10V)
+# --- sine waveform definition ------------------
+nsteps = 64                                 # 64 steps per cycle
+vmax = 10.0                                 # offset and scale for (0V, 10V)
 ip = 6.0                                    # 6A current limit
 tp = 0.02                                   # 20ms step duration
 cyc = 10                                    # 10 cycles total
+seg_tol = 0.0                               # max error (V) of variable-length steps, 0 for the 64 equal steps
+upload_mode = 'cache'                       # 'full' rewrites PROG 1, 'diff' only the changed steps,
+                                            # 'cache' skips the upload if PROG 1 already holds it
 # -----------------------------------------------
 
-def read_integer(instr):
-    try:
-        rd = instr.readline()
-        # print('rd: ', rd)
-        resp = int(rd)
-    except:
-        resp = 0
-    return resp
+# main code. NumPy is only imported here, so importing this module is fast
+def main(portname=portname, model_id=model_id, ip=ip, tp=tp):
+    import numpy as np
+    from xln_waveform import compile_waveform, segment_waveform
 
-# main code
-print()
-print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
-print('LIST PROGRAM GENERATOR - SINEWAVE ', script_ver)
-print('----------------------------------------------')
-bk = serial.Serial()
-bk.port = portname
-bk.baudrate = 57600
-bk.timeout = 0.2
-bk.open()
-if bk.is_open:
-    print('Serial port OPEN')
-    # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
-    bk.reset_input_buffer()
-    bk.reset_output_buffer()
-    bk.write("\r\n".encode())               
-    bk.write("*idn?\r\n".encode())          
-    idn = bk.readline()                     
-    bk.write("MODEL?\r\n".encode())
-    model = bk.readline()                   
-    bk.write("SYS:SER?\r\n".encode())          
-    sernum = bk.readline()                  
-    bk.write("VER?\r\n".encode())          
-    version = bk.readline()
-    print('portname:\t\t', portname)
-    print('Instrument ID:\t\t', idn)
-    print('Instrument MODEL:\t', model)
-    print('Instrument VERSION:\t', version)
-    print('Instrument SN:\t\t', sernum)
-    if model_id in model:
-        # The power supply responded. Now we can send SCPI commands. 
-        print(model_id.decode(), "validated!")
-        bk.write("*cls\r\n".encode())
-        bk.write("STATUS?\r\n".encode())
-        print("STATUS? : ", bk.readline())
+    # --- generate an array vp[] with SIN(x) --------
+    step = np.pi/(nsteps/2)
+    x = np.arange(0, 2*np.pi, step)
+    vp = vmax*((np.sin(x)+1.0)/2.0)
 
-        # clear existing PROG 1
-        time.sleep(0.2);    bk.write("PROG 1\r\n".encode());                        print("PROG 1")
-        time.sleep(0.2);    bk.write("PROG:CLE\r\n".encode());                      print("PROG:CLE")
-        
-        # define list program 1 header
-        time.sleep(0.2);    bk.write("PROG 1\r\n".encode());                        print("PROG 1")
-        time.sleep(0.2);    bk.write("PROG:REP {}\r\n".format(cyc-1).encode());     print("PROG:REP {}".format(cyc-1))
-        time.sleep(0.2);    bk.write("PROG:TOTA {}\r\n".format(len(vp)).encode());  print("PROG:TOTA {}".format(len(vp)))
+    # compile the waveform into the smallest step list: setpoints clamped to the model limits and quantized
+    # to the programming resolution, and consecutive equal steps merged into longer steps
+    if seg_tol > 0:
+        # variable-length steps within 'seg_tol' of the sine sampled every 1ms: short steps where the sine
+        # changes fast, long steps near the peaks. the tolerance is relaxed if it needs more than MAX_STEPS
+        period = len(x) * tp
+        wf = segment_waveform(lambda t: vmax*((np.sin(2*np.pi*t/period)+1.0)/2.0), ip, 0.001, duration=period,
+                              tol=seg_tol, max_steps=MAX_STEPS, model=model_id)
+    else:
+        wf = compile_waveform(vp, ip, tp, model=model_id)
+    vp, ip, tp = wf.vp, wf.ip, wf.tp
 
-        # generate the program steps
-        k = 0
-        while k < len(vp):
-            time.sleep(0.2);    bk.write("PROG:STEP {}\r\n".format(k+1).encode());          print("PROG:STEP {}".format(k+1))
-            time.sleep(0.2);    bk.write("PROG:STEP:VOLT {}\r\n".format(vp[k]).encode());   print("PROG:STEP:VOLT {}".format(vp[k]))
-            time.sleep(0.2);    bk.write("PROG:STEP:CURR {}\r\n".format(ip).encode());      print("PROG:STEP:CURR {}".format(ip))
-            time.sleep(0.2);    bk.write("PROG:STEP:ONT {}\r\n".format(tp).encode());       print("PROG:STEP:ONT {}".format(tp))
-            k = k + 1
+    print()
+    print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+    print('LIST PROGRAM GENERATOR - SINEWAVE ', script_ver)
+    print('----------------------------------------------')
+    print('waveform: {} samples compiled into {} steps, {} clamped'.format(wf.samples, len(vp), wf.clamped))
+    if wf.error is not None:
+        print('waveform: max error {:.3f}V'.format(wf.error))
+    if portname is None:
+        # find the port of the 'model_id' power supply, from the cached port map or by probing the CP2102 ports
+        portname = find_port(model=model_id)
+        print('auto-discovery:\t\t', portname)
+    if portname is None:
+        print('ERROR: no {} power supply found. check the USB cable and the power.'.format(model_id.decode()))
+        sys.exit(1)
+    bk = serial_for_url(portname, do_not_open=True)
+    bk.baudrate = 57600
+    bk.timeout = 0.2
+    bk.open()
+    if bk.is_open:
+        print('Serial port OPEN')
+        # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
+        ident = identify(bk, portname)
+        print_identity(portname, ident)
+        model, sernum = ident.model, ident.sernum
+        if model_id in model:
+            # The power supply responded. Now we can send SCPI commands. 
+            print(model_id.decode(), "validated!")
+            bk.write("*cls\r\n".encode())
+            bk.write("STATUS?\r\n".encode())
+            print("STATUS? : ", bk.readline())
 
-        # set NEXT program as 0
-        time.sleep(0.2);    bk.write("PROG:NEXT 0\r\n".encode());                   print("PROG:NEXT 0")
-        # save program as PROG 1
-        time.sleep(0.2);    
-        bk.write("PROG:SAV\r\n".encode());  
-        print("PROG:SAV")
-        time.sleep(1.0);    
-        
-        # readback PROG 1 total steps to validate
-        bk.write("PROG 1\r\n".encode());
-        print("PROG 1")
-        time.sleep(0.4)
-        bk.write("PROG:TOTA?\r\n".encode())
-        time.sleep(0.4)
-        steps = read_integer(bk)
-        print("PROG:TOTA? : ", steps)
-        if steps == 0:
-            print('ERROR: PROG 1 IS EMPTY!')
-        elif steps == len(vp):
-            print('PROG 1 IS SAVED.')
+            if upload_mode == 'cache':
+                # check the host-side cache of the programs stored on this instrument
+                steps, stats = upload_cached(bk, sernum.strip().decode(), 1, vp, ip, tp, rep=cyc-1, nxt=0)
+            elif upload_mode == 'diff':
+                # read back PROG 1, and only rewrite the steps that changed
+                steps, stats = upload_diff(bk, 1, vp, ip, tp, rep=cyc-1, nxt=0, sernum=sernum.strip().decode())
+            else:
+                # compile the list program into a single byte stream, and upload it to PROG 1
+                pgm = compile_program(1, vp, ip, tp, rep=cyc-1, nxt=0)
+                steps, stats = upload_compiled(bk, pgm, sernum=sernum.strip().decode())
+            print_stats(1, stats)
+            print("PROG:TOTA? : ", steps)
+            if steps == 0:
+                print('ERROR: PROG 1 IS EMPTY!')
+            elif steps == len(vp):
+                print('PROG 1 IS SAVED.')
+            else:
+                print('ERROR GENERATING PROG 1!')
+        elif ident.state == ID_UNRESPONSIVE:
+            print('ERROR: USB BRIDGE PRESENT, POWER SUPPLY UNRESPONSIVE! CHECK THE POWER, OR POWER CYCLE IT.')
         else:
-            print('ERROR GENERATING PROG 1!')
+            print('MODEL ID ERROR!')
+        bk.close()
+        print('Serial port CLOSED')
     else:
-        print('MODEL ID ERROR!')
-    bk.close()
-    print('Serial port CLOSED')
-else:
-    print('ERROR: serial.open() failed.')
-
+        print('ERROR: serial.open() failed.')
 
+if __name__ == '__main__':
+    main()
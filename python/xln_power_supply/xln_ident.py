@@ -0,0 +1,135 @@
+###################################################################################################
+#   XLN_IDENT - FAST CACHED IDENTIFICATION HANDSHAKE
+#   ------------------------------------------------
+#
+#   This module identifies the XLN power supply on an open serial port, before any command is sent.
+#
+#   The scripts used to send '*IDN?', 'MODEL?', 'SYS:SER?' and 'VER?' as four blocking round trips.
+#   With an unpowered supply (the CP2102 USB bridge is bus-powered, so the port opens anyway), each
+#   query waits for the full port timeout, and nothing happens for almost a second. Here:
+#
+#   1)  Pipelined queries: the four identity queries are written at once, and the four responses
+#       read back, so a full identification pays the link latency once.
+#
+#   2)  Cache: the identity is saved in 'ident.json' in the xln_cache folder, keyed by the port name
+#       and the USB identity of the port. The next session only sends 'SYS:SER?', and uses the cached
+#       identity if the serial number matches. A different serial number runs a full identification.
+#
+#   3)  Fail fast: if the first response line does not arrive within the port timeout, the other
+#       responses are not waited for, and the identity state is ID_UNRESPONSIVE: the USB bridge is
+#       present, but the power supply does not answer. It is usually unpowered, or needs a power cycle.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   identify(instr, portname) returns an Identity (state, idn, model, sernum, version). The strings
+#   are bytes, without the line terminator. 'state' is one of:
+#
+#       ID_OK               the supply answered (or was validated against the cache)
+#       ID_UNRESPONSIVE     bridge present, supply unresponsive
+#
+#   print_identity(portname, ident) prints the identity, in the format used by the scripts.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+from collections import namedtuple
+from serial.tools import list_ports
+from xln_scpi import EOL
+from xln_cache import cache_path, load_json, save_json
+
+# identification states
+ID_OK = 'ok'
+ID_UNRESPONSIVE = 'bridge present, supply unresponsive'
+
+# instrument identity
+Identity = namedtuple('Identity', 'state idn model sernum version')
+
+# the four identity queries, pipelined. the leading EOL flushes any partial command in the instrument
+ID_QUERY = (EOL + "*IDN?" + EOL + "MODEL?" + EOL + "SYS:SER?" + EOL + "VER?" + EOL).encode()
+
+# cheap validation of a cached identity
+SER_QUERY = (EOL + "SYS:SER?" + EOL).encode()
+
+# cache key of a port: the port name and its USB identity, so a swapped device is not mistaken
+def _port_key(portname):
+    for com in list_ports.comports():
+        if com.device == portname:
+            return '{}|{}:{}'.format(portname, com.serial_number, com.location)
+    return portname
+
+# identify the supply on the open port 'instr'. the cached identity of 'portname' is validated with a
+# single 'SYS:SER?' query. set cache=False to always run the full identification
+def identify(instr, portname=None, cache=True):
+    instr.reset_input_buffer()
+    instr.reset_output_buffer()
+    path = cache_path('ident.json')
+    key = _port_key(portname) if portname else None
+    cached = load_json(path) if cache and key else {}
+    entry = cached.get(key)
+    if entry is not None:
+        instr.write(SER_QUERY)
+        sernum = instr.readline().strip()
+        if not sernum:
+            return Identity(ID_UNRESPONSIVE, b'', b'', b'', b'')
+        if sernum.decode(errors='replace') == entry['sernum']:
+            return Identity(ID_OK, entry['idn'].encode(), entry['model'].encode(), sernum, entry['version'].encode())
+
+    instr.write(ID_QUERY)
+    idn = instr.readline().strip()
+    if not idn:
+        # fail fast: no need to wait for the other three responses
+        return Identity(ID_UNRESPONSIVE, b'', b'', b'', b'')
+    model, sernum, version = [instr.readline().strip() for _ in range(3)]
+    ident = Identity(ID_OK, idn, model, sernum, version)
+    if key and model:
+        cached[key] = {f: getattr(ident, f).decode(errors='replace') for f in ('idn', 'model', 'sernum', 'version')}
+        cached[key]['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        save_json(path, cached)
+    return ident
+
+# print the identity of the supply on 'portname'
+def print_identity(portname, ident):
+    print('portname:\t\t', portname)
+    if ident.state != ID_OK:
+        print('Instrument STATE:\t', ident.state)
+        return
+    print('Instrument ID:\t\t', ident.idn)
+    print('Instrument MODEL:\t', ident.model)
+    print('Instrument VERSION:\t', ident.version)
+    print('Instrument SN:\t\t', ident.sernum)
@@ -0,0 +1,258 @@
+###################################################################################################
+#   XLN_METRICS - PER-COMMAND LATENCY AND THROUGHPUT INSTRUMENTATION OF THE SERIAL LINK
+#   -----------------------------------------------------------------------------------
+#
+#   This module measures the traffic of the SCPI link, per command, to find where the time goes: the
+#   sample queries, the setpoint writes, or the 'PROG:STEP' commands of a program upload.
+#
+#   MeteredPort wraps an open serial port, and is used in its place. It records, for each SCPI
+#   command header ('VOUT?', 'PROG:STEP:VOLT', ...):
+#
+#       count           number of commands sent
+#       bytes out/in    bytes written, and bytes of the responses read
+#       latency         histogram of the round-trip time of the queries, from the write of the query
+#                       to the end of its response line
+#       timeouts        queries whose response line was not received before the port timeout
+#       parse errors    responses of numeric queries that are not a number
+#
+#   The responses are matched to the queries in order: each write pushes its queries on a FIFO, and
+#   each readline() pops the oldest one. After a timeout, all the pending queries are counted as
+#   timeouts, and the FIFO starts again empty. Several commands joined with ';' on one line are counted
+#   separately. The bookkeeping is a few dictionary updates per command, cheap enough to be left on.
+#
+#   The summary is exported as JSON, and as a Prometheus text-format file, written atomically, for the
+#   textfile collector of a local node exporter.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   MeteredPort(instr, name)            wraps the open port 'instr'. all port methods are available
+#   stats                               {header: CommandStats}
+#   summary()                           the summary dict of all the commands
+#   export_json(path)                   writes the summary as JSON
+#   export_prometheus(path)             writes the Prometheus text-format metrics
+#   print_metrics(port, top)            prints the 'top' commands by total latency
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import os
+import json
+import time
+from bisect import bisect_left
+from collections import deque
+
+# latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+# queries with a numeric response
+NUMERIC = {'*OPC?', 'STATUS?', 'VOUT?', 'IOUT?', 'VOLT?', 'CURR?', 'PROG?', 'PROG:TOTA?', 'PROG:REP?',
+           'PROG:NEXT?', 'PROG:STEP?', 'PROG:STEP:VOLT?', 'PROG:STEP:CURR?', 'PROG:STEP:ONT?'}
+
+# counters of one SCPI command header
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.timeouts = 0
+        self.parse_errors = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    def observe(self, dt):
+        self.buckets[bisect_left(BUCKETS, dt)] += 1
+        self.latency_sum += dt
+        self.latency_count += 1
+
+    # the 'q' quantile of the latency, interpolated in the histogram buckets
+    def quantile(self, q):
+        if not self.latency_count:
+            return 0.0
+        rank = q * self.latency_count
+        seen = 0
+        for k, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lo = BUCKETS[k - 1] if k > 0 else 0.0
+                hi = BUCKETS[k] if k < len(BUCKETS) else BUCKETS[-1]
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+    def summary(self):
+        n = self.latency_count
+        return {'count': self.count, 'bytes_out': self.bytes_out, 'bytes_in': self.bytes_in,
+                'responses': n, 'timeouts': self.timeouts, 'parse_errors': self.parse_errors,
+                'latency_mean': self.latency_sum / n if n else 0.0,
+                'latency_p50': self.quantile(0.5), 'latency_p99': self.quantile(0.99),
+                'latency_buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], self.buckets))}
+
+# header of a SCPI command, as counted: uppercase, without the argument and the leading ':'
+def _header(cmd):
+    return cmd.split(None, 1)[0].lstrip(':').upper() if cmd.strip() else ''
+
+# serial port wrapper recording the per-command metrics
+class MeteredPort:
+    def __init__(self, instr, name=None):
+        self.instr = instr
+        self.name = name or getattr(instr, 'port', None) or getattr(instr, 'portstr', '') or ''
+        self.stats = {}
+        self.t_start = time.time()
+        self._queries = deque()
+
+    # the port timeout, read and set on the wrapped port
+    @property
+    def timeout(self):
+        return self.instr.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.instr.timeout = value
+
+    def __getattr__(self, attr):
+        return getattr(self.instr, attr)
+
+    def _stats(self, hdr):
+        st = self.stats.get(hdr)
+        if st is None:
+            st = self.stats[hdr] = CommandStats()
+        return st
+
+    def write(self, data):
+        t = time.perf_counter()
+        n = self.instr.write(data)
+        for line in bytes(data).decode(errors='replace').split('\n'):
+            for cmd in line.split(';'):
+                hdr = _header(cmd)
+                if not hdr:
+                    continue
+                st = self._stats(hdr)
+                st.count += 1
+                st.bytes_out += len(cmd) + 1
+                if hdr.endswith('?'):
+                    self._queries.append((hdr, t))
+        return n
+
+    def readline(self, *args, **kw):
+        line = self.instr.readline(*args, **kw)
+        if not self._queries:
+            return line
+        hdr, t = self._queries.popleft()
+        st = self.stats[hdr]
+        st.bytes_in += len(line)
+        if not line.endswith(b'\n'):
+            # resynchronize: the other pending responses are not waited for, and a late response
+            # is not counted
+            st.timeouts += 1
+            while self._queries:
+                self.stats[self._queries.popleft()[0]].timeouts += 1
+            return line
+        st.observe(time.perf_counter() - t)
+        if hdr in NUMERIC:
+            try:
+                float(line)
+            except ValueError:
+                st.parse_errors += 1
+        return line
+
+    # the responses still pending are discarded with the input buffer
+    def reset_input_buffer(self):
+        self._queries.clear()
+        self.instr.reset_input_buffer()
+
+    # the summary of all the commands
+    def summary(self):
+        return {'port': self.name, 'start': self.t_start, 'time': time.time(),
+                'commands': {hdr: st.summary() for hdr, st in sorted(self.stats.items())}}
+
+    # write the summary as JSON
+    def export_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    # write the metrics in the Prometheus text format
+    def export_prometheus(self, path):
+        port = self.name.replace('\\', '\\\\').replace('"', '\\"')
+        out = []
+        for name, kind, text in _METRICS:
+            out.append('# HELP {} {}'.format(name, text))
+            out.append('# TYPE {} {}'.format(name, kind))
+            for hdr, st in sorted(self.stats.items()):
+                lbl = 'port="{}",command="{}"'.format(port, hdr)
+                if kind == 'histogram':
+                    if not st.latency_count:
+                        continue
+                    acc = 0
+                    for b, n in zip([str(b) for b in BUCKETS] + ['+Inf'], st.buckets):
+                        acc += n
+                        out.append('{}_bucket{{{},le="{}"}} {}'.format(name, lbl, b, acc))
+                    out.append('{}_sum{{{}}} {}'.format(name, lbl, repr(st.latency_sum)))
+                    out.append('{}_count{{{}}} {}'.format(name, lbl, st.latency_count))
+                else:
+                    out.append('{}{{{}}} {}'.format(name, lbl, getattr(st, _FIELDS[name])))
+        _write_atomic(path, '\n'.join(out) + '\n')
+
+# exported metrics: name, type, help
+_METRICS = [
+    ('xln_scpi_commands_total', 'counter', 'SCPI commands sent'),
+    ('xln_scpi_bytes_written_total', 'counter', 'bytes written for the command'),
+    ('xln_scpi_bytes_read_total', 'counter', 'bytes of the responses read'),
+    ('xln_scpi_timeouts_total', 'counter', 'queries without a response before the timeout'),
+    ('xln_scpi_parse_errors_total', 'counter', 'numeric query responses that are not a number'),
+    ('xln_scpi_latency_seconds', 'histogram', 'query round-trip time'),
+]
+_FIELDS = {'xln_scpi_commands_total': 'count', 'xln_scpi_bytes_written_total': 'bytes_out',
+           'xln_scpi_bytes_read_total': 'bytes_in', 'xln_scpi_timeouts_total': 'timeouts',
+           'xln_scpi_parse_errors_total': 'parse_errors'}
+
+# write a file atomically, so a reader never sees a partial file
+def _write_atomic(path, text):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+# print the 'top' commands by total latency, then by count
+def print_metrics(port, top=10):
+    rows = sorted(port.stats.items(), key=lambda kv: (kv[1].latency_sum, kv[1].count), reverse=True)
+    print('{:<18} {:>7} {:>9} {:>9} {:>9} {:>9} {:>5} {:>5}'.format(
+        'command', 'count', 'out B', 'in B', 'mean ms', 'p99 ms', 'tmo', 'err'))
+    for hdr, st in rows[:top]:
+        n = st.latency_count
+        print('{:<18} {:>7} {:>9} {:>9} {:>9.2f} {:>9.2f} {:>5} {:>5}'.format(
+            hdr, st.count, st.bytes_out, st.bytes_in, st.latency_sum / n * 1e3 if n else 0.0,
+            st.quantile(0.99) * 1e3, st.timeouts, st.parse_errors))
@@ -0,0 +1,229 @@
+###################################################################################################
+#   XLN_MONITOR - EVENT-DRIVEN LIST PROGRAM RUN MONITOR WITH V/I TELEMETRY
+#   ----------------------------------------------------------------------
+#
+#   This module runs a list program and records the output voltage and current during the whole run,
+#   instead of polling 'PROG:RUN?' with fixed sleeps and recording nothing.
+#
+#   1)  Telemetry: the V/I samples are read back-to-back, at the maximum rate of the serial link,
+#       through a xln_response.ResponseEngine, into a timestamped trace.
+#
+#   2)  State checks: 'PROG:RUN?' is appended to the 'VOUT?/IOUT?' query of a sample every
+#       'check_period' seconds, so a state check costs a few bytes in the same round trip, and does not
+#       interrupt the telemetry.
+#
+#   3)  End of run: the expected run time of the program is known from its program records (the
+#       host-side xln_cache records, or the program read back from the instrument), following the
+#       repetitions and the 'PROG:NEXT' links. Near the expected end, every sample checks the state, so
+#       the end of the run is bracketed between two consecutive samples: the last one that saw the
+#       program running, and the first one that saw it stopped. The end time is the middle of the
+#       bracket, known to half a sample period.
+#
+#   4)  Timeout: the run is stopped after the expected run time plus a margin, so a program that
+#       never stops (a chain that loops back with PROG:NEXT) does not hang the monitor. A looping
+#       chain is stopped after a single pass of its loop.
+#
+#   All times are time.monotonic() seconds, relative to the write of 'PROG:RUN ON'. The time of a
+#   sample is the middle of its round trip. By default the trace is sized from the run timeout and the
+#   highest sample rate of the link, so it holds the entire run; a fixed 'capacity' holds the latest
+#   samples, with a warning when older ones were overwritten.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   expected_duration(instr, prog, sernum)  the run time of program 'prog', or None if unknown
+#   monitor_run(instr, prog, duration)      runs program 'prog' and records it. returns a RunTrace
+#   run_timeout(instr, prog, duration)      the default run timeout of program 'prog'
+#   save_trace(path, trace)                 saves the trace as a CSV file
+#   print_run(trace)                        prints the run report
+#
+#   RunTrace fields:
+#       t, v, i         NumPy arrays of the samples: time, output voltage and current
+#       end             time of the end of the run, the middle of the bracket
+#       uncertainty     half width of the end bracket, in seconds
+#       latency         time from the end of the run to its detection
+#       samples, checks number of samples, and of samples with a state check
+#       completed       True if the program ran to its end
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+from collections import namedtuple
+import numpy as np
+from xln_scpi import EOL, VI_QUERY, MISSING, write_cmd
+from xln_program import program_duration
+from xln_upload import read_program, validate_program
+from xln_cache import ProgramCache
+from xln_response import ResponseEngine
+from xln_ringbuf import RingBuffer
+
+# program run trace
+RunTrace = namedtuple('RunTrace', 't v i end uncertainty latency samples checks completed')
+
+# V/I sample with a program state check, in a single round trip
+RUN_QUERY = VI_QUERY + ("PROG:RUN?" + EOL).encode()
+
+# check the response of a sample with a state check
+def _run_parses(lines):
+    try:
+        float(lines[0])
+        float(lines[1])
+    except ValueError:
+        return False
+    return lines[2].strip() in (b'ON', b'OFF')
+
+# margin of the default run timeout: a fraction of the expected run time, plus a fixed time for the
+# link latency and the step time resolution
+TIMEOUT_MARGIN = 0.1
+TIMEOUT_SLACK = 2.0
+
+# run timeout when the program records cannot be read
+UNKNOWN_TIMEOUT = 3600.0
+
+# trace capacity: samples per second at most on a 57600 baud link (a RUN_QUERY and its ~18 byte
+# response per sample, 10 bits per byte), and the bounds of the default capacity
+SAMPLE_RATE = 57600 / 10 / (len(RUN_QUERY) + 18)
+MIN_CAPACITY = 1 << 18
+MAX_CAPACITY = 1 << 23
+
+# default trace capacity for a run of at most 'timeout' seconds
+def trace_capacity(timeout):
+    return int(min(max(timeout * SAMPLE_RATE * 1.1, MIN_CAPACITY), MAX_CAPACITY))
+
+# program records {slot: record} of program 'prog' and of the programs it is linked to. the records come
+# from the host-side program cache of the instrument 'sernum' if they are still valid, or are read back
+# from the slots. returns None if a record could not be read
+def program_records(instr, prog, sernum=None, cache=None):
+    cache = cache or ProgramCache()
+    records = {}
+    while prog != 0 and prog not in records:
+        entry = cache.get(sernum, prog) if sernum else None
+        if entry is not None and validate_program(instr, prog, entry['record']):
+            rec = entry['record']
+        else:
+            rec = read_program(instr, prog)
+        if rec is None:
+            return None
+        records[prog] = rec
+        prog = rec['next'] if rec['steps'] else 0
+    return records
+
+# run time of program 'prog' and of the programs it is linked to, or None if unknown or endless
+def expected_duration(instr, prog, sernum=None, cache=None):
+    records = program_records(instr, prog, sernum, cache)
+    return program_duration(records, prog) if records is not None else None
+
+# default run timeout of program 'prog': the expected run time 'duration' if known, or else the time of
+# a single pass of its chain, read from the program records, plus the margin
+def run_timeout(instr, prog, duration=None, sernum=None, cache=None):
+    if duration is None:
+        records = program_records(instr, prog, sernum, cache)
+        if records is None:
+            return UNKNOWN_TIMEOUT
+        duration = program_duration(records, prog, once=True)
+    return duration * (1 + TIMEOUT_MARGIN) + TIMEOUT_SLACK
+
+# run program 'prog' and record the output until it stops. 'duration' is the expected run time, the
+# state is checked on every sample from 'window' seconds before it. without it, the end is only known
+# to 'check_period'. the run is stopped after 'timeout' seconds, by default the run_timeout() of the
+# program. the trace holds 'capacity' samples, by default the trace_capacity() of the timeout.
+# returns a RunTrace
+def monitor_run(instr, prog, duration=None, check_period=0.1, window=0.05, timeout=None, engine=None,
+                capacity=None):
+    if timeout is None:
+        timeout = run_timeout(instr, prog, duration)
+    engine = engine or ResponseEngine(instr)
+    ring = RingBuffer(capacity or trace_capacity(timeout))
+    checks = 0
+    t_on = t_off = 0.0
+    t_check = 0.0
+    completed = False
+    write_cmd(instr, "PROG {}".format(prog))
+    t0 = time.monotonic()
+    write_cmd(instr, "PROG:RUN ON")
+    while True:
+        t1 = time.monotonic() - t0
+        if t1 >= t_check or (duration is not None and t1 >= duration - window):
+            lines = engine.request(RUN_QUERY, 3, _run_parses)
+            t2 = time.monotonic() - t0
+            t_check = t2 + check_period
+            checks += 1
+            t = (t1 + t2) / 2
+            if lines is None:
+                ring.append(t, MISSING, MISSING)
+            elif lines[2].strip() == b'OFF':
+                # the first sample is already after 'PROG:RUN ON': an empty or very short program
+                # stopped before it, and the end bracket starts at the write
+                ring.append(t, float(lines[0]), float(lines[1]))
+                t_off = t
+                completed = True
+                break
+            else:
+                ring.append(t, float(lines[0]), float(lines[1]))
+                t_on = t
+        else:
+            t, v, i = engine.read_vi()
+            t2 = time.monotonic() - t0
+            ring.append(t - t0, v, i)
+        if t2 > timeout:
+            write_cmd(instr, "PROG:RUN OFF")
+            print('WARNING: program run timeout, stopped after {:.2f}s'.format(t2))
+            break
+    end = (t_on + t_off) / 2 if completed else t2
+    unc = (t_off - t_on) / 2 if completed else 0.0
+    latency = t2 - end if completed else 0.0
+    if ring.count > ring.capacity:
+        print('WARNING: trace holds the last {} samples only, {} older samples overwritten'.format(
+            ring.capacity, ring.count - ring.capacity))
+    t, v, i = ring.snapshot()
+    return RunTrace(t, v, i, end, unc, latency, ring.count, checks, completed)
+
+# save the trace as a CSV file, with a (t, vout, iout) row per sample
+def save_trace(path, trace):
+    np.savetxt(path, np.column_stack((trace.t, trace.v, trace.i)), delimiter=',', fmt=('%.6f', '%.3f', '%.3f'),
+               header='t,vout,iout', comments='')
+
+# print the run report
+def print_run(trace):
+    if trace.completed:
+        print('program run: {:.4f}s (+/-{:.1f}ms), end detected {:.1f}ms later'.format(
+            trace.end, trace.uncertainty * 1e3, trace.latency * 1e3))
+    else:
+        print('program run: NOT COMPLETED after {:.2f}s'.format(trace.end))
+    rate = trace.samples / trace.t[-1] if trace.samples and trace.t[-1] > 0 else 0.0
+    print('telemetry: {} samples ({:.1f} samples/s), {} state checks'.format(trace.samples, rate, trace.checks))
@@ -0,0 +1,170 @@
+###################################################################################################
+#   XLN_PLOT - BLITTED, DECIMATED REALTIME V/I PLOT
+#   -----------------------------------------------
+#
+#   This module draws the realtime VOUT/IOUT plot of the samples held in a xln_ringbuf.RingBuffer,
+#   at a steady frame rate and with a bounded CPU cost, for captures of any length.
+#
+#   1)  Blitting: the axes, grid, ticks and legend are drawn once and saved as a background bitmap.
+#       Each frame only restores the background and redraws the two trace lines, instead of redrawing
+#       the whole figure as plt.pause() does.
+#
+#   2)  Scrolling time window: the x axis shows the last 'window' seconds. When the trace reaches the
+#       right edge, the axis jumps forward by half a window, and the background is redrawn once.
+#
+#   3)  Min/max decimation: when the window holds more samples than the axes have pixels, the samples
+#       are grouped in one bucket per pixel column, and only the minimum and maximum of each bucket are
+#       plotted. This keeps every peak visible, and bounds the number of plotted points to twice the
+#       axes width in pixels, whatever the sample rate.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   RealtimePlot(title, window, ylim)   creates the figure
+#   show()                              shows the figure and captures the background
+#   update(ring)                        redraws the traces from the ring buffer
+#   pause(dt)                           processes the GUI events for 'dt' seconds, without a redraw
+#   decimate(x, y, width)               min/max decimation of (x, y) to 'width' buckets
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+
+# min/max decimation of (x, y) to 'width' buckets. returns (x, y) with at most 2*width points
+def decimate(x, y, width):
+    n = len(y)
+    width = max(int(width), 1)
+    if n <= 2 * width:
+        return x, y
+    b = -(-n // width)                      # bucket size, rounded up
+    m = n // b                              # number of full buckets
+    yb = y[:m*b].reshape(m, b)
+    imin = yb.argmin(axis=1)
+    imax = yb.argmax(axis=1)
+    # keep the min and max of each bucket in their time order, so the trace is drawn left to right
+    first = np.where(imin <= imax, imin, imax)
+    second = np.where(imin <= imax, imax, imin)
+    rows = np.arange(m)
+    xd = np.empty(2 * m, dtype=x.dtype)
+    yd = np.empty(2 * m, dtype=y.dtype)
+    xd[0::2] = x[rows * b + first]
+    xd[1::2] = x[rows * b + second]
+    yd[0::2] = yb[rows, first]
+    yd[1::2] = yb[rows, second]
+    if m * b < n:
+        # last partial bucket
+        xt, yt = x[m*b:], y[m*b:]
+        k = np.sort([yt.argmin(), yt.argmax()])
+        xd = np.concatenate((xd, xt[k]))
+        yd = np.concatenate((yd, yt[k]))
+    return xd, yd
+
+# realtime VOUT/IOUT plot with blitting, scrolling window and min/max decimation
+class RealtimePlot:
+    def __init__(self, title, window=30.0, ylim=(0, 10), figsize=(6, 3)):
+        self.window = window
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        self.ln1, = self.ax.plot([], [], '-g', label='VOUT', linewidth=2.0, animated=True)
+        self.ln2, = self.ax.plot([], [], '-r', label='IOUT', linewidth=2.0, animated=True)
+        self.ax.set_title(title)
+        self.ax.set_xlabel('time (s)')
+        self.ax.grid()
+        self.ax.legend(loc='upper left')
+        self.ax.set_xlim(0, window)
+        self.ax.set_ylim(*ylim)
+        self.t0 = None
+        self.background = None
+        self.redraws = 0
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    # the figure was fully redrawn (first show, resize, axis scroll): capture the new background
+    def _on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.redraws += 1
+        self.ax.draw_artist(self.ln1)
+        self.ax.draw_artist(self.ln2)
+
+    # show the figure without blocking
+    def show(self):
+        plt.show(block=False)
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    # redraw the traces from the ring buffer samples
+    def update(self, ring):
+        t, v, i = ring.view()
+        if len(t) == 0:
+            return
+        if self.t0 is None:
+            self.t0 = t[0]
+        t_last = t[-1] - self.t0
+
+        # scroll the window by half its width when the trace reaches the right edge
+        x0, x1 = self.ax.get_xlim()
+        if t_last > x1:
+            x0 = max(t_last - self.window / 2, 0.0)
+            self.ax.set_xlim(x0, x0 + self.window)
+            self.fig.canvas.draw()
+
+        # select the window samples: timestamps are monotonic, so a binary search finds the start
+        k = np.searchsorted(t, self.t0 + x0)
+        x = t[k:] - self.t0
+        width = self.ax.bbox.width
+        self.ln1.set_data(*decimate(x, v[k:], width))
+        self.ln2.set_data(*decimate(x, i[k:], width))
+
+        # blit: restore the background and draw only the trace lines
+        if self.background is None:
+            self.fig.canvas.draw()
+        self.fig.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.ln1)
+        self.ax.draw_artist(self.ln2)
+        self.fig.canvas.blit(self.ax.bbox)
+        self.fig.canvas.flush_events()
+
+    # process the GUI events for 'dt' seconds, without redrawing the figure
+    def pause(self, dt):
+        t_end = time.monotonic() + dt
+        while True:
+            self.fig.canvas.flush_events()
+            dt = t_end - time.monotonic()
+            if dt <= 0:
+                break
+            time.sleep(min(dt, 0.01))
@@ -0,0 +1,269 @@
+###################################################################################################
+#   XLN_PROGRAM - LIST PROGRAM COMPILER
+#   -----------------------------------
+#
+#   This module compiles a list program, defined by the step voltage, current and duration arrays
+#   'vp', 'ip' and 'tp', into the preformatted byte stream of SCPI command lines that writes it to
+#   a XLN program slot.
+#
+#   The whole program is formatted and encoded once, before the upload starts, so the upload loop only
+#   writes bytes to the serial port. To reduce the number of lines the instrument has to parse, the
+#   commands of one step (or of several steps) are joined with ';' into a single line. Each joined
+#   command uses the absolute ':PROG:...' header form, so it does not depend on the SCPI header path
+#   left by the previous command.
+#
+#   Numbers are written with the minimum number of digits, at the 1mV/1mA/1ms resolution.
+#
+#   A program can also be compiled as a difference against the program already stored in the slot:
+#   only the steps and the header fields (PROG:TOTA, PROG:REP, PROG:NEXT) that changed are rewritten,
+#   which makes iterative tuning of a long profile almost instant. Programs are compared as records,
+#   with all values formatted at the programming resolution, so float noise is not a difference.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   compile_program(prog, vp, ip, tp, rep, nxt) returns a CompiledProgram, holding the list of
+#   '\r\n' terminated lines to send, the number of SCPI commands they hold, and the program header.
+#   The lines are sent to the instrument by xln_upload.upload_compiled().
+#
+#   program_record(vp, ip, tp, rep, nxt) returns the record of a program: a dict with the 'rep' and
+#   'next' header fields, and the 'steps' list of [volt, curr, ont] strings.
+#
+#   compile_diff(prog, old, new) compiles the commands that change the program record 'old', stored in
+#   slot 'prog', into the program record 'new'. It returns a CompiledProgram with no lines if the
+#   programs are equal.
+#
+#   link_program(vp, ip, tp, first) splits a step list longer than one program slot into a chain of
+#   slots, each linked to the next one with PROG:NEXT, so the instrument runs the whole waveform on
+#   its own timing. It returns the list of ChainLink (prog, vp, ip, tp, next) of the slots, uploaded
+#   by xln_upload.upload_chain(). Running the first slot runs the chain.
+#
+#   load_profile(path) reads a step list from a CSV profile file, with a 'volt, curr, ont' row per step.
+#
+#   program_duration(records, prog) is the run time of program 'prog', with its repetitions and the
+#   programs it is linked to with PROG:NEXT, from the program records of the slots. With 'once', a
+#   chain that loops back is counted up to the link that closes the loop, instead of None.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+from collections import namedtuple
+
+# compiled list program
+CompiledProgram = namedtuple('CompiledProgram', 'prog lines ncmd nsteps rep nxt')
+
+# one program slot of a chained program
+ChainLink = namedtuple('ChainLink', 'prog vp ip tp next')
+
+# XLN models: maximum output (volts, amps)
+MODELS = {
+    'XLN3640':  (36.0, 40.0),
+    'XLN6024':  (60.0, 24.0),
+    'XLN8018':  (80.0, 18.0),
+    'XLN10014': (100.0, 14.0),
+    'XLN15010': (150.0, 10.0),
+    'XLN30052': (300.0, 5.2),
+    'XLN60026': (600.0, 2.6),
+}
+
+# list program memory
+NUM_PROGRAMS = 10
+MAX_STEPS = 100
+
+# programming resolution of the step voltage, current and duration, and the minimum step duration
+VOLT_RES = 0.001
+CURR_RES = 0.001
+TIME_RES = 0.001
+MIN_ONT = 0.001
+
+# commands that take much longer than a parameter write, and must be synchronized on their own
+SLOW_COMMANDS = (b'PROG:CLE', b'PROG:SAV')
+
+# format a number with the minimum number of digits
+def fmt_num(x):
+    s = '{:.3f}'.format(float(x)).rstrip('0').rstrip('.')
+    return s if s not in ('', '-0') else '0'
+
+# expand a scalar program parameter into a list of 'n' values
+def as_list(val, n):
+    try:
+        return list(val)
+    except TypeError:
+        return [val] * n
+
+# SCPI commands that write step 'k' (1..n)
+def step_commands(k, v, i, t):
+    return ["PROG:STEP {}".format(k),
+            "PROG:STEP:CURR {}".format(fmt_num(i)),
+            "PROG:STEP:VOLT {}".format(fmt_num(v)),
+            "PROG:STEP:ONT {}".format(fmt_num(t))]
+
+# join SCPI commands into one line, using absolute headers after the first one
+def join_commands(cmds):
+    return ';:'.join(cmds)
+
+# encode groups of SCPI commands into lines: each group is joined into one line, unless join=False
+def _encode(groups, join):
+    lines = []
+    ncmd = 0
+    for cmds in groups:
+        ncmd += len(cmds)
+        if join:
+            lines.append((join_commands(cmds) + "\r\n").encode())
+        else:
+            lines += [(c + "\r\n").encode() for c in cmds]
+    return lines, ncmd
+
+# group the commands of the steps 'ks' (0..n-1) of a program record, 'steps_per_line' steps per group
+def _step_groups(rec, ks, steps_per_line):
+    groups = []
+    spl = max(steps_per_line, 1)
+    for j in range(0, len(ks), spl):
+        cmds = []
+        for k in ks[j:j+spl]:
+            cmds += step_commands(k+1, *rec['steps'][k])
+        groups.append(cmds)
+    return groups
+
+# record of a program, with all values formatted at the programming resolution
+def program_record(vp, ip, tp, rep=0, nxt=0):
+    n = len(vp)
+    vp = as_list(vp, n)
+    ip = as_list(ip, n)
+    tp = as_list(tp, n)
+    steps = [[fmt_num(vp[k]), fmt_num(ip[k]), fmt_num(tp[k])] for k in range(n)]
+    return {'rep': int(rep), 'next': int(nxt), 'steps': steps}
+
+# compile list program 'prog' into SCPI lines. vp, ip and tp are the step voltage, current and
+# duration, either as sequences or as scalars applied to all steps. 'steps_per_line' steps are joined
+# into one line; use join=False to send one command per line.
+def compile_program(prog, vp, ip, tp, rep=0, nxt=0, steps_per_line=1, join=True, clear=True):
+    rec = program_record(vp, ip, tp, rep, nxt)
+    n = len(rec['steps'])
+    groups = []
+    if clear:
+        groups += [["PROG {}".format(prog)], ["PROG:CLE"]]
+    groups.append(["PROG {}".format(prog), "PROG:REP {}".format(rep), "PROG:TOTA {}".format(n)])
+    groups += _step_groups(rec, list(range(n)), steps_per_line)
+    groups += [["PROG:NEXT {}".format(nxt)], ["PROG:SAV"]]
+    lines, ncmd = _encode(groups, join)
+    return CompiledProgram(prog, lines, ncmd, n, rep, nxt)
+
+# compile the commands that change program record 'old', stored in slot 'prog', into record 'new'.
+# returns a CompiledProgram with no lines if both programs are equal
+def compile_diff(prog, old, new, steps_per_line=1, join=True):
+    n = len(new['steps'])
+    header = []
+    if new['rep'] != old['rep']:
+        header.append("PROG:REP {}".format(new['rep']))
+    if n != len(old['steps']):
+        header.append("PROG:TOTA {}".format(n))
+    changed = [k for k in range(n) if k >= len(old['steps']) or new['steps'][k] != old['steps'][k]]
+    groups = _step_groups(new, changed, steps_per_line)
+    if new['next'] != old['next']:
+        groups.append(["PROG:NEXT {}".format(new['next'])])
+    if not header and not groups:
+        return CompiledProgram(prog, [], 0, n, new['rep'], new['next'])
+    groups = [["PROG {}".format(prog)] + header] + groups + [["PROG:SAV"]]
+    lines, ncmd = _encode(groups, join)
+    return CompiledProgram(prog, lines, ncmd, n, new['rep'], new['next'])
+
+# split the step lists vp, ip, tp into a chain of program slots of at most 'max_steps' steps, starting at
+# slot 'first' (or in the 'slots' list), each linked to the next one with PROG:NEXT. the last slot
+# ends the chain, or links back to the first one if 'loop' is set. returns the list of ChainLink
+def link_program(vp, ip, tp, first=1, slots=None, max_steps=MAX_STEPS, loop=False):
+    n = len(vp)
+    vp = as_list(vp, n)
+    ip = as_list(ip, n)
+    tp = as_list(tp, n)
+    count = max(-(-n // max_steps), 1)
+    if slots is None:
+        slots = list(range(first, first + count))
+    slots = [p for p in slots if 1 <= p <= NUM_PROGRAMS]
+    if len(slots) < count:
+        raise ValueError('{} steps need {} program slots, only {} available'.format(n, count, len(slots)))
+    slots = slots[:count]
+    links = []
+    for j, prog in enumerate(slots):
+        k = slice(j * max_steps, (j + 1) * max_steps)
+        nxt = slots[j + 1] if j + 1 < count else (slots[0] if loop else 0)
+        links.append(ChainLink(prog, vp[k], ip[k], tp[k], nxt))
+    return links
+
+# run time of program 'prog' from the program records {slot: record} of the slots: the steps of every
+# cycle, and the programs linked with PROG:NEXT. returns None for a missing record or an endless loop,
+# or with 'once', the run time of a single pass of the loop
+def program_duration(records, prog, once=False):
+    total = 0.0
+    seen = set()
+    while prog != 0:
+        rec = records.get(prog)
+        if prog in seen and once:
+            break
+        if rec is None or prog in seen:
+            return None
+        seen.add(prog)
+        if not rec['steps']:
+            break
+        total += (rec['rep'] + 1) * sum(max(float(s[2]), MIN_ONT) for s in rec['steps'])
+        prog = rec['next']
+    return total
+
+# read a step list from the CSV profile file 'path': one 'volt, curr, ont' row per step, with the step
+# duration in seconds. empty lines, '#' comments and a header row are skipped. returns (vp, ip, tp)
+def load_profile(path):
+    vp, ip, tp = [], [], []
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            cols = [c.strip() for c in line.split(',')]
+            try:
+                v, i, t = [float(c) for c in cols]
+            except ValueError:
+                if not vp and not any(c[:1].isdigit() for c in cols):
+                    continue        # header row
+                raise ValueError('{}:{}: expected a volt, curr, ont row: {}'.format(path, n, line))
+            vp.append(v)
+            ip.append(i)
+            tp.append(t)
+    return vp, ip, tp
+
+# the whole program as a single byte buffer
+def program_bytes(compiled):
+    return b''.join(compiled.lines)
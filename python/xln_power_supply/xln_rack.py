@@ -0,0 +1,128 @@
+###################################################################################################
+#   XLN_RACK - CONCURRENT CONTROL OF A RACK OF XLN POWER SUPPLIES
+#   -------------------------------------------------------------
+#
+#   This is an example code to demonstrate the BK PRECISION XLN Programmable Power Supply Series.
+#
+#   The XLN series have a CP1202 Serial to USB bridge, and enumerate as a serial port. Each power
+#   supply has its own serial port, so several units connected to the same computer can be driven
+#   in parallel.
+#
+#   This script uses the xln_async module to control all the power supplies listed in 'rack' from a
+#   single process. Each supply is identified, programmed, run and sampled by its own asyncio task,
+#   so the total time is the time of the slowest supply, instead of the sum of the times of all
+#   supplies when the single-instrument scripts are run one after the other.
+#
+#   As in the other scripts, each power supply is positively identified by its MODEL string before
+#   any command is sent to it. A supply that fails the identification is skipped, and does not stop
+#   the others.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   The program opens all the serial ports concurrently, and for each power supply:
+#       1) Authenticates the XLN power supply model
+#       2) Uploads the staircase program to PROG 1
+#       3) Runs PROG 1, sampling the output voltage and current until the program stops
+#       4) Closes the serial port
+#   and prints the time taken by each supply and the total time.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+import asyncio
+from xln_async import XlnClient
+from xln_upload import print_stats
+
+script_ver = "v1.0.0"
+
+# rack definition: (portname, model_id) of each power supply. change to your devices!
+# use 'socket://localhost:5025', 'socket://localhost:5026', ... for xln_emu.py emulators,
+# or 'emu://XLN3640' for an in-process emulator
+rack = [
+    ('/dev/tty.usbserial-275K22178', b'XLN3640'),
+    ('/dev/tty.usbserial-275K22179', b'XLN3640'),
+]
+
+# program list definition: change these lists to modify the program list waveform
+vp = [0.0,  1.0,  2.0,  3.0,  4.0,  5.0,  6.0,  7.0,  8.0,  9.0,  10.0, 0.0]
+ip = [6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  0.0]
+tp = [0.20, 0.20, 0.20, 0.20, 0.20, 0.20, 0.20, 0.20, 0.20, 0.20, 0.20, 0.20]
+
+# identify, program and run one power supply
+async def run_supply(portname, model_id):
+    t0 = time.perf_counter()
+    try:
+        bk = await XlnClient(portname).open()
+    except Exception as e:
+        print(portname, ': ERROR: open failed,', e)
+        return None
+    async with bk:
+        model = await bk.identify()
+        if model_id not in model:
+            print(portname, ': MODEL ID ERROR!', model)
+            return None
+        print(portname, ':', model_id.decode(), 'validated! SN:', bk.sernum.strip().decode())
+        await bk.write("*cls")
+        await bk.write("OUTP ON")
+        steps, stats = await bk.upload_program(1, vp, ip, tp)
+        print(portname, end=' : ')
+        print_stats(1, stats)
+        if steps != len(vp):
+            print(portname, ': ERROR GENERATING PROG 1!')
+            return None
+        # stop a run that takes much longer than the program
+        samples = await bk.run_program(1, timeout=sum(tp) * 1.1 + 2.0)
+        dt = time.perf_counter() - t0
+        print(portname, ': PROGRAM STOPPED. {} samples, {:.2f}s total'.format(len(samples), dt))
+        return dt
+
+async def main():
+    t0 = time.perf_counter()
+    times = await asyncio.gather(*(run_supply(p, m) for p, m in rack))
+    wall = time.perf_counter() - t0
+    done = [t for t in times if t is not None]
+    print('{} of {} supplies done in {:.2f}s (sum of the supply times: {:.2f}s)'.format(
+        len(done), len(rack), wall, sum(done)))
+
+# main code
+print()
+print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+print('RACK CONTROL ', script_ver)
+print('----------------------------------------------')
+asyncio.run(main())
@@ -0,0 +1,221 @@
+###################################################################################################
+#   XLN_RESPONSE - ADAPTIVE, LATENCY-AWARE RESPONSE TIMEOUTS WITH RETRIES
+#   ---------------------------------------------------------------------
+#
+#   This module reads query responses with timeouts learned from the instrument, instead of the fixed
+#   0.2s port timeout of the scripts.
+#
+#   1)  Latency model: the round-trip time of every request is recorded online, per request (for
+#       example the pipelined 'VOUT?/IOUT?' of a sample), in a window of the most recent values.
+#
+#   2)  Timeout: once enough round trips are recorded, the timeout of a request is a multiple of the
+#       p99 of its latency, bounded by a floor and a ceiling. A fast query never waits for the
+#       worst-case timeout, and a late response is detected in a few milliseconds. Before that, the
+#       timeout is the port timeout.
+#
+#   3)  Retry: a request with a missing or unreadable response is sent again, with the timeout
+#       multiplied by 'backoff' on each attempt, up to 'retries' times and up to the ceiling.
+#       After every failed attempt, the link is resynchronized before anything else is sent: a
+#       '*OPC?' sentinel is written, and the lines are discarded up to its '1'. The instrument
+#       answers in order, so the late response of the failed attempt is discarded with them, and is
+#       never read as the response of the next request.
+#
+#   4)  Stuck instrument: after 'stuck_after' consecutive failed requests the engine reports the
+#       instrument as stuck, and stops retrying, so each request fails within one learned timeout
+#       until the instrument answers again.
+#
+#   A value that could not be read is reported as missing: NaN in a V/I sample (a gap in the plot),
+#   or None from read_float(), never a placeholder value like -1.0, that would corrupt the data.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   ResponseEngine(instr)               adaptive response engine of the open port 'instr'
+#   request(data, nlines)               writes 'data', returns the list of 'nlines' response lines,
+#                                       or None
+#   read_float(cmd)                     float response of a query, or None if missing
+#   read_vi()                           (t, vout, iout) sample, with NaN for a missing value
+#   timeout(data)                       the current timeout of a request
+#   latency(data)                       the p99 round-trip time of a request, or None if not learned
+#   stuck                               True while the instrument does not answer
+#   timeouts, retries_done, failures    counts of failed attempts, retries and failed requests
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+from collections import deque
+from xln_scpi import EOL, VI_QUERY, MISSING
+
+# check that all response lines are numbers
+def _parses(lines):
+    try:
+        for line in lines:
+            float(line)
+    except ValueError:
+        return False
+    return True
+
+# window of the most recent round-trip times of one request
+class LatencyStats:
+    def __init__(self, size=256):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, dt):
+        self.samples.append(dt)
+        self.count += 1
+
+    # the 'q' quantile (0..1) of the recorded latencies
+    def quantile(self, q):
+        s = sorted(self.samples)
+        return s[min(int(q * len(s)), len(s) - 1)]
+
+# response engine with learned timeouts, bounded retries and stuck detection
+class ResponseEngine:
+    def __init__(self, instr, quantile=0.99, multiple=3.0, floor=0.02, ceiling=1.0, min_samples=16,
+                 retries=2, backoff=2.0, stuck_after=3):
+        self.instr = instr
+        self.initial = instr.timeout or 0.2   # timeout used until enough latencies are recorded
+        self.quantile = quantile
+        self.multiple = multiple
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+        self.retries = retries
+        self.backoff = backoff
+        self.stuck_after = stuck_after
+        self.stats = {}
+        self._timeouts = {}
+        self.stuck = False
+        self.timeouts = 0
+        self.retries_done = 0
+        self.failures = 0
+        self._failed = 0
+
+    # current timeout of request 'data'. updated every 16 round trips, sorting the window is not free
+    def timeout(self, data):
+        st = self.stats.get(data)
+        if st is None or st.count < self.min_samples:
+            return self.initial
+        if st.count % 16 == 0 or data not in self._timeouts:
+            t = self.multiple * st.quantile(self.quantile)
+            self._timeouts[data] = min(max(t, self.floor), self.ceiling)
+        return self._timeouts[data]
+
+    # the 'q' quantile (default: the engine quantile) of the round-trip time of request 'data', or None
+    # before enough round trips are recorded
+    def latency(self, data, q=None):
+        st = self.stats.get(data)
+        if st is None or st.count < self.min_samples:
+            return None
+        return st.quantile(self.quantile if q is None else q)
+
+    # one attempt: write 'data' and read 'nlines' lines before the deadline. returns the lines or None
+    def _attempt(self, data, nlines, timeout):
+        t0 = time.perf_counter()
+        deadline = t0 + timeout
+        self.instr.write(data)
+        lines = []
+        for _ in range(nlines):
+            self.instr.timeout = max(deadline - time.perf_counter(), 0.0)
+            line = self.instr.readline()
+            if not line.endswith(b'\n'):
+                return None
+            lines.append(line)
+        self.stats.setdefault(data, LatencyStats()).add(time.perf_counter() - t0)
+        return lines
+
+    # drop the late or partial response of a failed attempt: write a '*OPC?' sentinel, and discard the
+    # lines up to its '1', waiting at most 'timeout'. returns True if the sentinel was received
+    def _resync(self, timeout):
+        deadline = time.perf_counter() + timeout
+        self.instr.write(b"*OPC?\r\n")
+        while True:
+            self.instr.timeout = max(deadline - time.perf_counter(), 0.0)
+            line = self.instr.readline()
+            if not line.endswith(b'\n'):
+                # no sentinel before the deadline: drop what arrived, the rest is lost with it
+                self.instr.reset_input_buffer()
+                return False
+            if line.strip() == b'1':
+                self.instr.reset_input_buffer()
+                return True
+
+    # write request 'data' and return its 'nlines' response lines, retrying on a missing response.
+    # 'check' validates the lines (for example, parses them). returns None if all attempts failed
+    def request(self, data, nlines, check=None):
+        saved = self.instr.timeout
+        timeout = self.timeout(data)
+        attempts = 1 if self.stuck else 1 + self.retries
+        try:
+            for k in range(attempts):
+                if k > 0:
+                    self.retries_done += 1
+                    timeout = min(timeout * self.backoff, self.ceiling)
+                lines = self._attempt(data, nlines, timeout)
+                if lines is not None and (check is None or check(lines)):
+                    self._failed = 0
+                    self.stuck = False
+                    return lines
+                self.timeouts += 1
+                # drop the late response of the failed attempt, before the retry or the next request.
+                # a stuck instrument is only waited for one timeout
+                self._resync(timeout if self.stuck else self.ceiling)
+        finally:
+            self.instr.timeout = saved
+        self.failures += 1
+        self._failed += 1
+        if self._failed >= self.stuck_after and not self.stuck:
+            self.stuck = True
+            print('WARNING: instrument not answering, no response to {} requests'.format(self._failed))
+        return None
+
+    # float response of query 'cmd', or None if missing
+    def read_float(self, cmd):
+        lines = self.request((cmd + EOL).encode(), 1, _parses)
+        return float(lines[0]) if lines is not None else None
+
+    # read the output (volts, amps) with a single round trip. returns (t, vout, iout), where 't' is the
+    # time.monotonic() at the middle of the round trip, and a missing value is NaN
+    def read_vi(self):
+        t0 = time.monotonic()
+        lines = self.request(VI_QUERY, 2, _parses)
+        t = (t0 + time.monotonic()) / 2
+        if lines is None:
+            return t, MISSING, MISSING
+        return t, float(lines[0]), float(lines[1])
@@ -0,0 +1,113 @@
+###################################################################################################
+#   XLN_RINGBUF - PREALLOCATED NUMPY RING BUFFER FOR REALTIME V/I SAMPLES
+#   ---------------------------------------------------------------------
+#
+#   This module holds the most recent (t, vout, iout) samples in fixed-capacity NumPy columns:
+#
+#       t       float64 time.monotonic() timestamps, in seconds
+#       v       float32 output voltage, in volts
+#       i       float32 output current, in amps
+#
+#   The memory is allocated once, so the buffer size and the append cost do not depend on the length
+#   of the capture. Every sample is stored twice, at position k and k + capacity, so the latest
+#   'capacity' samples are always a contiguous slice of each column. view() returns those slices as
+#   zero-copy NumPy views, that can be passed directly to the plot lines.
+#
+#   The buffer has a single producer (the sampler thread) and any number of readers. The producer
+#   writes a sample before publishing it in 'count', so a reader never sees a partial sample. A view
+#   keeps referencing the buffer memory, so its oldest samples are overwritten as new samples arrive.
+#   Use snapshot() for a stable copy.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   RingBuffer(capacity)    allocates the buffer
+#   append(t, v, i)         stores one sample, overwriting the oldest one when the buffer is full
+#   view(n)                 zero-copy (t, v, i) views of the latest n samples (default: all)
+#   since(index)            zero-copy (t, v, i) views of the samples appended after sample 'index'
+#   snapshot(n)             copy of the latest n samples
+#   count                   total number of samples appended since the buffer was created
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import numpy as np
+
+# fixed-capacity ring buffer of (t, vout, iout) samples
+class RingBuffer:
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = capacity
+        self.t = np.zeros(2 * capacity, dtype=np.float64)
+        self.v = np.zeros(2 * capacity, dtype=dtype)
+        self.i = np.zeros(2 * capacity, dtype=dtype)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    # store one sample
+    def append(self, t, v, i):
+        k = self.count % self.capacity
+        c = self.capacity
+        self.t[k] = self.t[k + c] = t
+        self.v[k] = self.v[k + c] = v
+        self.i[k] = self.i[k + c] = i
+        self.count += 1
+
+    # slice of the latest 'n' samples, in the doubled storage
+    def _slice(self, n, count):
+        n = min(n, count, self.capacity)
+        end = count % self.capacity + (self.capacity if count >= self.capacity else 0)
+        return slice(end - n, end)
+
+    # zero-copy views of the latest 'n' samples
+    def view(self, n=None):
+        count = self.count
+        s = self._slice(self.capacity if n is None else n, count)
+        return self.t[s], self.v[s], self.i[s]
+
+    # zero-copy views of the samples appended after sample 'index', and the index to use on the next call.
+    # samples already overwritten are skipped
+    def since(self, index):
+        count = self.count
+        s = self._slice(count - index, count)
+        return (self.t[s], self.v[s], self.i[s]), count
+
+    # copy of the latest 'n' samples
+    def snapshot(self, n=None):
+        t, v, i = self.view(n)
+        return t.copy(), v.copy(), i.copy()
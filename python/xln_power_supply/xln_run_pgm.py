@@ -45,9 +45,12 @@
 #       1) Turn the output ON
 #       2) Selects a stored program from memory '1'
 #       3) Runs the selected program 
-#       4) Monitors the execution of the program and waits for it to run and stop
-#       5) Turn the output OFF
-#       6) Close the serial port
+#       4) Monitors the execution of the program with the xln_monitor run monitor: samples the output
+#          voltage and current at the maximum link rate, with 'PROG:RUN?' checks in the same queries,
+#          and detects the end of the program to half a sample period
+#       5) Saves the timestamped V/I trace of the run to 'trace_file', if set
+#       6) Turn the output OFF
+#       7) Close the serial port
 # 
 #--------------------------------------------------------------------------------------------------
 #   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
@@ -85,13 +88,22 @@
 # 
 ###################################################################################################
 
-import serial
+import sys
 import time
+from xln_discover import find_port
+from xln_scpi import serial_for_url
+from xln_ident import identify, print_identity, ID_UNRESPONSIVE
+from xln_monitor import monitor_run, expected_duration, run_timeout, save_trace, print_run
 
-script_ver = "v1.0.8"
+script_ver = "v1.5.1"
 model_id = b'XLN3640'                       # change the model_id to your XLN model
 portname = '/dev/tty.usbserial-275K22178'   # change the device port name for your device name!
                                             # on windows use 'COMxx'
+                                            # use 'socket://localhost:5025' for the xln_emu.py emulator
+                                            # use 'daemon://<sernum>' for a supply served by xln_daemon.py
+                                            # use 'replay://<session.xlr>' to replay a xln_transcript.py recording
+                                            # use None to find the 'model_id' supply by auto-discovery
+trace_file = None                           # CSV file of the V/I trace of the program run, None to not save it
 
 def read_integer(instr):
     try:
@@ -103,87 +115,79 @@ def read_integer(instr):
     return resp
 
 # main code
-print()
-print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
-print('LIST PROGRAM EXECUTION ', script_ver)
-print('----------------------------------------------')
-bk = serial.Serial()
-bk.port = portname
-bk.baudrate = 57600
-bk.timeout = 0.2
-bk.open()
-if bk.is_open:
-    print('Serial port OPEN')
-    # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
-    bk.reset_input_buffer()
-    bk.reset_output_buffer()
-    bk.write("\r\n".encode())               
-    bk.write("*idn?\r\n".encode())          
-    idn = bk.readline()                     
-    bk.write("MODEL?\r\n".encode())
-    model = bk.readline()                   
-    bk.write("SYS:SER?\r\n".encode())          
-    sernum = bk.readline()                  
-    bk.write("VER?\r\n".encode())          
-    version = bk.readline()
-    print('portname:\t\t', portname)
-    print('Instrument ID:\t\t', idn)
-    print('Instrument MODEL:\t', model)
-    print('Instrument VERSION:\t', version)
-    print('Instrument SN:\t\t', sernum)
-    if model_id in model:
-        # The power supply responded. Now we can send SCPI commands. 
-        print(model_id.decode(), "validated!")
-        bk.write("*cls\r\n".encode())
+def main(portname=portname, model_id=model_id, trace_file=trace_file):
+    print()
+    print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+    print('LIST PROGRAM EXECUTION ', script_ver)
+    print('----------------------------------------------')
+    if portname is None:
+        # find the port of the 'model_id' power supply, from the cached port map or by probing the CP2102 ports
+        portname = find_port(model=model_id)
+        print('auto-discovery:\t\t', portname)
+    if portname is None:
+        print('ERROR: no {} power supply found. check the USB cable and the power.'.format(model_id.decode()))
+        sys.exit(1)
+    bk = serial_for_url(portname, do_not_open=True)
+    bk.baudrate = 57600
+    bk.timeout = 0.2
+    bk.open()
+    if bk.is_open:
+        print('Serial port OPEN')
+        # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
+        ident = identify(bk, portname)
+        print_identity(portname, ident)
+        model, sernum = ident.model, ident.sernum
+        if model_id in model:
+            # The power supply responded. Now we can send SCPI commands. 
+            print(model_id.decode(), "validated!")
+            bk.write("*cls\r\n".encode())
 
-        bk.write("OUTP ON\r\n".encode())
-        bk.write("OUTP?\r\n".encode())
-        print("OUTP? : ", bk.readline())
+            bk.write("OUTP ON\r\n".encode())
+            bk.write("OUTP?\r\n".encode())
+            print("OUTP? : ", bk.readline())
 
-        bk.write("STATUS?\r\n".encode())
-        print("STATUS? : ", bk.readline())
+            bk.write("STATUS?\r\n".encode())
+            print("STATUS? : ", bk.readline())
 
-        # Select program 1
-        bk.write("PROG 1\r\n".encode())
-        time.sleep(0.2)
-        bk.write("PROG:TOTA?\r\n".encode())
-        time.sleep(0.2)
-        steps = read_integer(bk)
-        print("PROG:TOTA? : ", steps)
-        if steps == 0:
-            print('PROGRAM 1 IS EMPTY')
-        else:
-            bk.write("PROG:RUN ON\r\n".encode())
+            # Select program 1
+            bk.write("PROG 1\r\n".encode())
+            time.sleep(0.2)
+            bk.write("PROG:TOTA?\r\n".encode())
+            time.sleep(0.2)
+            steps = read_integer(bk)
+            print("PROG:TOTA? : ", steps)
+            if steps == 0:
+                print('PROGRAM 1 IS EMPTY')
+            else:
+                # the expected run time, from the cached program records or read back from the instrument
+                duration = expected_duration(bk, 1, sernum.strip().decode())
+                if duration is not None:
+                    print('expected run time: {:.3f}s'.format(duration))
+                # stop the run if it takes longer than expected, or after a single pass of a looping chain
+                timeout = run_timeout(bk, 1, duration, sernum.strip().decode())
+                print('PROG:RUN ON')
+                print("PROGRAM RUNNING ...")
+                trace = monitor_run(bk, 1, duration, timeout=timeout)
+                print("PROGRAM STOPPED.")
+                print_run(trace)
+                if trace_file:
+                    save_trace(trace_file, trace)
+                    print('trace saved to', trace_file)
+                bk.write("PROG:RUN OFF\r\n".encode())
+            time.sleep(2)
+            # bk.write("OUTP OFF\r\n".encode())
+            bk.write("OUTP ON\r\n".encode())
             time.sleep(0.2)
-            print('PROG:RUN ON')
-            while True:
-                time.sleep(0.2)
-                bk.write("PROG:RUN?\r\n".encode())
-                time.sleep(0.2)
-                resp = bk.readline()
-                if b'ON' in resp:
-                    print("PROGRAM RUNNING ...")
-                    break
-            while True:
-                time.sleep(0.2)
-                bk.write("PROG:RUN?\r\n".encode())
-                time.sleep(0.2)
-                resp = bk.readline()
-                if b'OFF' in resp:
-                    print("PROGRAM STOPPED.")
-                    break
-            bk.write("PROG:RUN OFF\r\n".encode())
-        time.sleep(2)
-        # bk.write("OUTP OFF\r\n".encode())
-        bk.write("OUTP ON\r\n".encode())
-        time.sleep(0.2)
-        bk.write("OUTP?\r\n".encode())
-        print("OUTP? : ", bk.readline())
+            bk.write("OUTP?\r\n".encode())
+            print("OUTP? : ", bk.readline())
+        elif ident.state == ID_UNRESPONSIVE:
+            print('ERROR: USB BRIDGE PRESENT, POWER SUPPLY UNRESPONSIVE! CHECK THE POWER, OR POWER CYCLE IT.')
+        else:
+            print('MODEL ID ERROR!')
+        bk.close()
+        print('Serial port CLOSED')
     else:
-        print('MODEL ID ERROR!')
-    bk.close()
-    print('Serial port CLOSED')
-else:
-    print('ERROR: serial.open() failed.')
-
+        print('ERROR: serial.open() failed.')
 
+if __name__ == '__main__':
+    main()
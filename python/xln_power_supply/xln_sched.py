@@ -0,0 +1,198 @@
+###################################################################################################
+#   XLN_SCHED - DEADLINE-BASED HOST-TIMED WAVEFORM PLAYBACK
+#   -------------------------------------------------------
+#
+#   This module plays a step list (vp, ip, tp) from the host, writing each setpoint at an absolute
+#   deadline, instead of waiting a number of sample loops after the previous setpoint. The step
+#   durations do not accumulate the serial, sampling or plot latency: step k is due at the start time
+#   plus the sum of the durations of the steps before it, whatever happened before.
+#
+#   1)  Deadlines: the deadlines are absolute time.monotonic_ns() values. The setpoint write is moved
+#       ahead of its deadline by the wire time of its bytes, so the command is received on time.
+#
+#   2)  Slack: the time between two deadlines is filled with V/I samples, read through the
+#       xln_response.ResponseEngine. A sample is only started if its p99 round trip, times a margin,
+#       ends before the next deadline. The round trip is learned on a burst of samples taken before
+#       the first deadline. The rest of the slack is slept, and the last 'spin' seconds
+#       are busy-waited, since the sleep of the operating system is only accurate to a millisecond.
+#
+#   3)  Timing error: the error of each step is the time the setpoint write started, minus its due
+#       time (positive when late). The report gives the mean error, the jitter (standard deviation),
+#       the p99 and worst absolute error, and a histogram of the errors.
+#
+#   The Scheduler is a xln_acq.Sampler thread: it owns the serial port, appends the samples to the
+#   same ring buffer, and queues the other commands with write(), so it replaces the sampler of a
+#   realtime plot.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   Scheduler(instr, vp, ip, tp)        creates the playback thread for the open port 'instr'
+#   start() / stop()                    start the playback, abort it and wait for the thread
+#   done                                True once the last step has ended
+#   step                                index of the current step, -1 before the first deadline
+#   errors                              timing error of each step written, in nanoseconds
+#   ends                                last (t, vout, iout) sample of each ended step
+#   timing()                            TimingStats of the step timing errors, in seconds
+#   histogram(width)                    [(bin start, count)] of the errors, in bins of 'width' seconds
+#   print_timing(sched)                 prints the timing report and histogram
+#
+#   All the Sampler attributes (ring, last, engine, rate()) are available.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import math
+import time
+from collections import namedtuple
+from xln_acq import Sampler
+from xln_scpi import EOL, VI_QUERY
+from xln_program import as_list, fmt_num
+
+# step timing report, in seconds
+TimingStats = namedtuple('TimingStats', 'steps mean jitter p99 worst late')
+
+# setpoint command of one step
+def _setpoint(v, i):
+    return ("VOLT " + fmt_num(v) + ";:CURR " + fmt_num(i) + EOL).encode()
+
+# host-timed playback of a step list, with V/I samples in the slack between the deadlines
+class Scheduler(Sampler):
+    def __init__(self, instr, vp, ip, tp, margin=1.5, spin=0.002, tolerance=0.001, delay=0.05, **kw):
+        super().__init__(instr, **kw)
+        n = len(vp)
+        self.vp = as_list(vp, n)
+        self.ip = as_list(ip, n)
+        self.tp = as_list(tp, n)
+        self.margin = margin            # safety factor applied to the p99 sample round trip
+        self.spin = spin                # busy-wait time before a deadline, in seconds
+        self.tolerance = tolerance      # timing error counted as late, in seconds
+        self.delay = delay              # time from start() to the first deadline, in seconds
+        self.errors = []
+        self.ends = []                  # last sample of each step, taken before the next deadline
+        self.step = -1
+        self.done = False
+
+    # time of one V/I sample, in nanoseconds. before the latency is learned, the port timeout
+    def _sample_ns(self):
+        rtt = self.engine.latency(VI_QUERY)
+        if rtt is None:
+            rtt = self.engine.timeout(VI_QUERY)
+        return int(rtt * self.margin * 1e9)
+
+    # take one V/I sample, after writing the queued commands
+    def _sample(self):
+        with self.lock:
+            while not self.pending.empty():
+                self.instr.write(self.pending.get())
+            sample = self.engine.read_vi()
+        self.ring.append(*sample)
+        self.last = sample
+        self.count += 1
+
+    # take samples until 'due' (monotonic_ns), then wait for it
+    def _fill(self, due):
+        while not self._halt.is_set() and time.monotonic_ns() + self._sample_ns() < due:
+            self._sample()
+        left = (due - time.monotonic_ns()) / 1e9 - self.spin
+        if left > 0:
+            self._halt.wait(left)
+        while time.monotonic_ns() < due:
+            pass
+
+    def run(self):
+        self.t_start = time.monotonic()
+        baud = getattr(self.instr, 'baudrate', 0) or 0
+        # learn the sample round trip before the first deadline
+        for _ in range(self.engine.min_samples):
+            if self._halt.is_set():
+                return
+            self._sample()
+        deadline = time.monotonic_ns() + int(self.delay * 1e9)
+        for k in range(len(self.vp)):
+            cmd = _setpoint(self.vp[k], self.ip[k])
+            # wire time of the command: 10 bits per byte
+            due = deadline - (len(cmd) * 10 * 1000000000 // baud if baud else 0)
+            self._fill(due)
+            if self._halt.is_set():
+                return
+            if k > 0:
+                self.ends.append(self.last)
+            with self.lock:
+                t = time.monotonic_ns()
+                self.instr.write(cmd)
+            self.errors.append(t - due)
+            self.step = k
+            deadline += int(round(float(self.tp[k]) * 1e9))
+        self._fill(deadline)
+        self.ends.append(self.last)
+        self.done = True
+
+    # statistics of the step timing errors, in seconds
+    def timing(self):
+        if not self.errors:
+            return TimingStats(0, 0.0, 0.0, 0.0, 0.0, 0)
+        e = [x / 1e9 for x in self.errors]
+        n = len(e)
+        mean = sum(e) / n
+        jitter = math.sqrt(sum((x - mean) ** 2 for x in e) / n)
+        a = sorted(abs(x) for x in e)
+        return TimingStats(n, mean, jitter, a[min(int(0.99 * n), n - 1)], a[-1],
+                           sum(1 for x in a if x > self.tolerance))
+
+    # histogram of the step timing errors: [(bin start, count)] of bins of 'width' seconds. the errors
+    # beyond 'nbins' bins are counted in the last bin
+    def histogram(self, width=0.0005, nbins=40):
+        if not self.errors:
+            return []
+        bins = [math.floor(x / 1e9 / width) for x in self.errors]
+        lo = min(bins)
+        hi = min(max(bins), lo + nbins - 1)
+        counts = [0] * (hi - lo + 1)
+        for b in bins:
+            counts[min(b, hi) - lo] += 1
+        return [((lo + j) * width, c) for j, c in enumerate(counts)]
+
+# print the step timing report and error histogram of a scheduler
+def print_timing(sched, width=0.0005, bar=40):
+    st = sched.timing()
+    print('step timing: {} steps, mean error {:+.3f}ms, jitter {:.3f}ms, p99 {:.3f}ms, worst {:.3f}ms, {} late'.format(
+        st.steps, st.mean * 1e3, st.jitter * 1e3, st.p99 * 1e3, st.worst * 1e3, st.late))
+    hist = sched.histogram(width)
+    top = max([c for _, c in hist] or [1])
+    for lo, c in hist:
+        print('  {:+8.2f}ms {:6d} {}'.format(lo * 1e3, c, '#' * int(round(c * bar / top))))
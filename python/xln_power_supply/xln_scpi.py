@@ -0,0 +1,126 @@
+###################################################################################################
+#   XLN_SCPI - SHARED SCPI HELPERS FOR THE XLN EXAMPLE SCRIPTS
+#   ----------------------------------------------------------
+#
+#   This module holds the small SCPI helpers that the XLN example scripts share.
+#
+#   All functions take the open pyserial 'instr' object as their first argument, and exchange
+#   '\r\n' terminated ascii lines with the XLN power supply. serial_for_url() opens that object.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   serial_for_url() opens a port like pyserial, a xln_daemon.DaemonPort for a 'daemon://' name, or
+#                   a xln_transcript.ReplayPort for a 'replay://<file>[?speed=N]' name
+#   write_cmd()     writes one SCPI command line
+#   query()         writes one SCPI query line and returns the raw response line
+#   read_integer()  reads one integer response line, returns 0 on read error
+#   opc_sync()      waits for the instrument to process all pending commands, using '*OPC?'
+#   opc_ack()       reads the response of a '*OPC?' already sent
+#   opc_rtt()       measures the round-trip time of an idle '*OPC?'
+#   MISSING         the value of a sample that could not be read
+#   VI_QUERY        the VOUT? and IOUT? queries, pipelined in a single write
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+
+# SCPI line terminator of the XLN serial interface
+EOL = "\r\n"
+
+# open the port 'portname' like serial.serial_for_url(). a 'daemon://' port name opens the DaemonPort
+# of a supply served by xln_daemon, a 'replay://<file>[?speed=N]' name the ReplayPort of a transcript
+# recorded by xln_transcript, any other name or url a pyserial port
+def serial_for_url(portname, *args, **kw):
+    if portname.startswith('daemon://'):
+        from xln_daemon import DaemonPort
+        return DaemonPort(portname, do_not_open=kw.get('do_not_open', False))
+    if portname.startswith('replay://'):
+        from xln_transcript import replay_for_url
+        return replay_for_url(portname, do_not_open=kw.get('do_not_open', False))
+    import serial
+    return serial.serial_for_url(portname, *args, **kw)
+
+# write a SCPI command line to the instrument
+def write_cmd(instr, cmd):
+    instr.write((cmd + EOL).encode())
+
+# write a SCPI query and return the raw response line. returns b'' on timeout
+def query(instr, cmd):
+    write_cmd(instr, cmd)
+    return instr.readline()
+
+# read an integer response. return 0 if read error.
+def read_integer(instr):
+    try:
+        rd = instr.readline()
+        resp = int(rd)
+    except:
+        resp = 0
+    return resp
+
+# value of a sample that could not be read. NaN leaves a gap in a plot, and is skipped by np.nanmean()
+MISSING = float('nan')
+
+# VOUT? and IOUT? pipelined in a single write
+VI_QUERY = ("VOUT?" + EOL + "IOUT?" + EOL).encode()
+
+# wait until the instrument has processed all previous commands.
+# '*OPC?' is answered with '1' only after the command parser has executed everything sent before it.
+# returns True if the instrument answered within 'timeout' seconds (default: the port timeout)
+def opc_sync(instr, timeout=None):
+    write_cmd(instr, "*OPC?")
+    return opc_ack(instr, timeout)
+
+# read the '1' response of a '*OPC?' already sent. returns True if received within 'timeout'
+def opc_ack(instr, timeout=None):
+    saved = instr.timeout
+    if timeout is not None:
+        instr.timeout = timeout
+    try:
+        resp = instr.readline()
+    finally:
+        instr.timeout = saved
+    return resp.strip() == b'1'
+
+# measure the round-trip time of an idle '*OPC?' handshake, in seconds. returns None on timeout
+def opc_rtt(instr, timeout=None):
+    t0 = time.perf_counter()
+    if not opc_sync(instr, timeout):
+        return None
+    return time.perf_counter() - t0
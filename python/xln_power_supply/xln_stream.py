@@ -0,0 +1,212 @@
+###################################################################################################
+#   XLN_STREAM - DOUBLE-BUFFERED STREAMING OF LONG PROFILES INTO PROGRAM SLOTS
+#   --------------------------------------------------------------------------
+#
+#   This module plays a step list of any length on the XLN power supply, with the instrument timing
+#   of the list programs, but without the limit of the program memory.
+#
+#   The profile is split into segments of at most MAX_STEPS steps, stored in a ring of program slots
+#   (two by default, a double buffer). Each segment is linked with 'PROG:NEXT' to the slot of the next
+#   segment, and the last one ends the chain. The first slots are filled before the start. While the
+#   instrument runs a segment, the slot of a segment that already ended is idle, and the next segment
+#   is uploaded into it, so the slot is ready when the instrument follows the 'PROG:NEXT' link to it.
+#
+#   1)  Time base: the start of the profile is bracketed between the write of 'PROG:RUN ON' and the
+#       response of the '*OPC?' sent after it. A slot is only rewritten after its segment ended at the
+#       latest start time, plus a guard time. An upload is on time if it completes before the segment
+#       is due at the earliest start time.
+#
+#   2)  Throughput: the link rate (steps/s) is measured on the first uploads, and compared to the rate
+#       the profile needs: every segment must be uploaded in the time the instrument plays the other
+#       slots of the ring. If the link cannot sustain the profile step rate, a warning is printed
+#       before the start, with the predicted shortfall. Use more slots, or longer steps.
+#
+#   3)  Underrun: a segment uploaded too late, or a run that stopped before the end of the profile,
+#       stops the run with 'PROG:RUN OFF', and is reported.
+#
+#   The uploads select the idle slot with 'PROG n'. This selects the slot edited by the following
+#   commands, and does not change the program being run. The xln_cache records of the slots of the
+#   ring are forgotten before the first upload, so a later cached upload does not trust them.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   plan_stream(vp, ip, tp, slots)      the segments of a profile, as a list of ChainLink
+#   stream_program(instr, vp, ip, tp)   uploads and plays a profile, returns a StreamStats. 'sernum'
+#                                       forgets the xln_cache records of the slots written
+#   print_stream(stats)                 prints the streaming report
+#
+#   StreamStats fields:
+#       segments, steps, duration       size and playing time of the profile
+#       step_rate                       steps/s the link must sustain to feed the ring in time
+#       link_rate                       steps/s of the link, measured on the uploads
+#       min_slack                       smallest margin, in seconds, between the end of an upload and
+#                                       the start of its segment (negative for an underrun)
+#       underruns                       number of segments uploaded late
+#       completed                       True if the whole profile was played
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+from collections import namedtuple
+from xln_scpi import EOL, write_cmd, opc_ack, query
+from xln_program import ChainLink, as_list, compile_program, program_bytes, MAX_STEPS, MIN_ONT
+from xln_upload import upload_compiled, forget_slot
+
+# streaming report
+StreamStats = namedtuple('StreamStats', 'segments steps duration step_rate link_rate min_slack underruns completed')
+
+# split the profile into segments of at most 'max_steps' steps, stored in the ring of program 'slots'.
+# each segment is linked to the slot of the next one, the last one ends the chain
+def plan_stream(vp, ip, tp, slots=(1, 2), max_steps=MAX_STEPS):
+    n = len(vp)
+    vp = as_list(vp, n)
+    ip = as_list(ip, n)
+    tp = as_list(tp, n)
+    count = -(-n // max_steps)
+    segs = []
+    for k in range(count):
+        j = slice(k * max_steps, (k + 1) * max_steps)
+        nxt = slots[(k + 1) % len(slots)] if k + 1 < count else 0
+        segs.append(ChainLink(slots[k % len(slots)], vp[j], ip[j], tp[j], nxt))
+    return segs
+
+# playing time of a segment
+def _duration(seg):
+    return sum(max(float(t), MIN_ONT) for t in seg.tp)
+
+# the steps/s the link must sustain: each segment is uploaded while the instrument plays the segments
+# between the end of the previous segment in its slot and its own start
+def _step_rate(segs, starts, nslots, guard):
+    rate = 0.0
+    for k in range(nslots, len(segs)):
+        window = starts[k] - starts[k - nslots + 1] - guard
+        rate = max(rate, len(segs[k].vp) / window if window > 0 else float('inf'))
+    return rate
+
+# wait until time.monotonic() 'until', checking that the program still runs every 'poll' seconds.
+# returns False if the program stopped
+def _wait(instr, until, poll):
+    while True:
+        left = until - time.monotonic()
+        if left <= 0:
+            return True
+        time.sleep(min(left, poll))
+        if query(instr, "PROG:RUN?").strip() == b'OFF':
+            return False
+
+# upload and play the profile vp, ip, tp through the ring of program 'slots'. 'guard' is the time, in
+# seconds, a slot is left idle after its segment ended before it is rewritten. the cache records of the
+# slots of the instrument 'sernum' are forgotten. returns a StreamStats
+def stream_program(instr, vp, ip, tp, slots=(1, 2), max_steps=MAX_STEPS, guard=0.05, poll=0.25,
+                   verbose=False, sernum=None):
+    segs = plan_stream(vp, ip, tp, slots, max_steps)
+    for prog in sorted({seg.prog for seg in segs}):
+        forget_slot(sernum, prog)
+    nslots = min(len(slots), len(segs))
+    starts = [0.0]
+    for seg in segs:
+        starts.append(starts[-1] + _duration(seg))
+    duration = starts[-1]
+    nsteps = sum(len(seg.vp) for seg in segs)
+    need = _step_rate(segs, starts, nslots, guard)
+
+    # fill the ring, and measure the link rate
+    t_up = 0.0
+    for seg in segs[:nslots]:
+        compiled = compile_program(seg.prog, seg.vp, seg.ip, seg.tp, 0, seg.next)
+        steps, stats = upload_compiled(instr, compiled)
+        if steps != len(seg.vp):
+            print('ERROR: PROG {} upload failed, {} of {} steps'.format(seg.prog, steps, len(seg.vp)))
+            return StreamStats(len(segs), nsteps, duration, need, 0.0, 0.0, 0, False)
+        t_up += stats.elapsed
+    uploaded = sum(len(seg.vp) for seg in segs[:nslots])
+    link = uploaded / t_up if t_up > 0 else float('inf')
+    if need > link:
+        print('WARNING: the link cannot sustain the profile: {:.0f} steps/s needed, {:.0f} steps/s measured'.format(
+            need, link))
+
+    # start the first slot. the start is between the write and the '*OPC?' response
+    t_early = time.monotonic()
+    instr.write(("PROG {}".format(segs[0].prog) + EOL + "PROG:RUN ON" + EOL + "*OPC?" + EOL).encode())
+    opc_ack(instr)
+    t_late = time.monotonic()
+
+    min_slack = float('inf')
+    underruns = 0
+    completed = True
+    for k in range(nslots, len(segs)):
+        seg = segs[k]
+        # the slot is idle once the previous segment stored in it ended
+        if not _wait(instr, t_late + starts[k - nslots + 1] + guard, poll):
+            print('WARNING: the program stopped before segment {} of {}'.format(k + 1, len(segs)))
+            completed = False
+            break
+        t0 = time.perf_counter()
+        compiled = compile_program(seg.prog, seg.vp, seg.ip, seg.tp, 0, seg.next)
+        steps, stats = upload_compiled(instr, compiled)
+        t_up += time.perf_counter() - t0
+        uploaded += len(seg.vp)
+        slack = t_early + starts[k] - time.monotonic()
+        min_slack = min(min_slack, slack)
+        if verbose:
+            print('segment {}/{}: PROG {}, {} steps, {} bytes in {:.2f}s, slack {:.2f}s'.format(
+                k + 1, len(segs), seg.prog, steps, len(program_bytes(compiled)), stats.elapsed, slack))
+        if slack < 0 or steps != len(seg.vp):
+            underruns += 1
+            print('WARNING: underrun, segment {} of {} uploaded {:.2f}s late'.format(k + 1, len(segs), -slack))
+            write_cmd(instr, "PROG:RUN OFF")
+            completed = False
+            break
+    if completed:
+        completed = _wait(instr, t_early + duration - guard, poll)
+        # the last segment is playing: wait for the end of the run
+        while query(instr, "PROG:RUN?").strip() == b'ON':
+            time.sleep(min(poll, MIN_ONT * 10))
+        if not completed:
+            print('WARNING: the program stopped before the end of the profile')
+    link = uploaded / t_up if t_up > 0 else float('inf')
+    return StreamStats(len(segs), nsteps, duration, need, link,
+                       min_slack if min_slack != float('inf') else 0.0, underruns, completed)
+
+# print the streaming report
+def print_stream(stats):
+    print('stream: {} steps in {} segments, {:.2f}s, {}'.format(
+        stats.steps, stats.segments, stats.duration, 'completed' if stats.completed else 'NOT COMPLETED'))
+    print('stream: link {:.0f} steps/s, profile needs {:.0f} steps/s, min slack {:.2f}s, {} underruns'.format(
+        stats.link_rate, stats.step_rate, stats.min_slack, stats.underruns))
@@ -0,0 +1,163 @@
+###################################################################################################
+#   XLN_STREAM_PGM - STREAM A PROFILE LONGER THAN THE PROGRAM MEMORY THROUGH TWO PROGRAM SLOTS
+#   ------------------------------------------------------------------------------------------
+#
+#   This is an example code to demonstrate the BK PRECISION XLN Programmable Power Supply Series. 
+#   
+#   The XLN series have a CP1202 Serial to USB bridge, and enumerate as a serial port. 
+#   On Windows, it will enumerate as a 'COMxx' port name.
+#   On MacOSX, it will enumerate as a '/dev/tty.usbserial-<serial_number>', where <serial_number> 
+#   is the equipment serial number. This naming scheme allows multiple XLN units to be connected to the
+#   same computer, and to be correctly identified.
+#   
+#   The example code uses the pyserial module, and SCPI commands to control the XLN power supply.
+#   This is the basic sequence to talk to the power supply:
+# 
+#   1)  Identify the serial port device name. On Windows, it enumerates as a 'COMxx' virtual serial port. 
+#       On MacOS, it enumerates as a tty.usbserial device, with name '/dev/tty.usbserial-<sernum>', where
+#       <sernum> is the serial number of the XLN power supply. 
+# 
+#   2)  The communication uses the PySerial module API, to open the serial port and exchange ascii strings
+#       with the power supply. All strings exchanged to/from the serial port are byte strings, and need to 
+#       be byte encoded. 
+# 
+#   3)  The XLN series devices have a CP1202 Serial-to-USB Bridge chip, which is bus-powered. So, even when
+#       the power supply is unpowered or unresponsive, the USB device port can be enumerated and opened. This
+#       requires an positive identification from the power supply, before starting sending control commands. 
+# 
+#   4)  The power supply responds with its full device name to the '*IDN?' command, and also with the model and
+#       version to the commands 'MODEL?' and 'VER?'. The serial number can also be read with the 'SYS:SER?' SCPI 
+#       command. We use here the MODEL returned to validate a working device. 
+#       NOTE:   If the power supply is connected and powered up, but is not responding to any identification commands,
+#               it might be necessary to do a manual power OFF/ON on the power supply. 
+# 
+#   5)  Some commands do not need a response, but a few commands are query/response commands, and need to have the 
+#       response read, even if it will be discarded. 
+# 
+#   6)  The serial port must be closed at the end of the program, to avoid a locked port in some operating systems. 
+# 
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+# 
+#   The program memory holds NUM_PROGRAMS slots of MAX_STEPS steps. This script plays a 20 minute
+#   profile of 2400 steps, more than the whole program memory, with the instrument timing, using the
+#   xln_stream double-buffered player:
+#       1) Defines the profile, with 0.5s steps
+#       2) Authenticates the XLN power supply model
+#       3) Uploads the first two segments of 100 steps into PROG 1 and PROG 2, linked to each other
+#          with 'PROG:NEXT', and measures the link throughput
+#       4) Runs PROG 1 ('PROG:RUN ON'), and uploads each next segment into the idle slot while the
+#          other one runs, checking the run with 'PROG:RUN?'
+#       5) Reports the upload slack of the segments, and any underrun
+#       6) Close the serial port
+#   A warning is printed before the start if the link cannot sustain the profile step rate.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import sys
+import time
+from xln_discover import find_port
+from xln_scpi import serial_for_url
+from xln_ident import identify, print_identity, ID_UNRESPONSIVE
+from xln_stream import stream_program, print_stream
+import numpy as np
+
+script_ver = "v1.1.2"
+model_id = b'XLN3640'                       # change the model_id to your XLN model
+portname = '/dev/tty.usbserial-275K22178'   # change the device port name for your device name!
+                                            # on windows use 'COMxx'
+                                            # use 'socket://localhost:5025' for the xln_emu.py emulator
+                                            # use 'daemon://<sernum>' for a supply served by xln_daemon.py
+                                            # use 'replay://<session.xlr>' to replay a xln_transcript.py recording
+                                            # use None to find the 'model_id' supply by auto-discovery
+
+# --- define the profile ------------------------
+duration = 1200.0                           # 20 minutes
+tp = 0.5                                    # 500ms steps
+t = np.arange(0, duration, tp)
+vp = 12.0 + 2.0*np.sin(2*np.pi*t/37.0) + 1.0*np.sin(2*np.pi*t/5.3)
+ip = 6.0                                    # 6A current limit
+slots = [1, 2]                              # ring of program slots, use more slots for faster profiles
+# -----------------------------------------------
+
+# main code
+print()
+print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+print('LIST PROGRAM STREAMING ', script_ver)
+print('----------------------------------------------')
+if portname is None:
+    # find the port of the 'model_id' power supply, from the cached port map or by probing the CP2102 ports
+    portname = find_port(model=model_id)
+    print('auto-discovery:\t\t', portname)
+if portname is None:
+    print('ERROR: no {} power supply found. check the USB cable and the power.'.format(model_id.decode()))
+    sys.exit(1)
+bk = serial_for_url(portname, do_not_open=True)
+bk.baudrate = 57600
+bk.timeout = 0.2
+bk.open()
+if bk.is_open:
+    print('Serial port OPEN')
+    # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
+    ident = identify(bk, portname)
+    print_identity(portname, ident)
+    model, sernum = ident.model, ident.sernum
+    if model_id in model:
+        # The power supply responded. Now we can send SCPI commands. 
+        print(model_id.decode(), "validated!")
+        bk.write("*cls\r\n".encode())
+
+        bk.write("OUTP ON\r\n".encode())
+        bk.write("OUTP?\r\n".encode())
+        print("OUTP? : ", bk.readline())
+
+        print('STREAMING {} steps through PROG {} ...'.format(len(vp), ', '.join(str(p) for p in slots)))
+        stats = stream_program(bk, vp, ip, tp, slots=slots, verbose=True, sernum=sernum.strip().decode())
+        print_stream(stats)
+        if stats.completed:
+            print("PROGRAM STOPPED.")
+        else:
+            print('ERROR: STREAMING STOPPED BEFORE THE END OF THE PROFILE!')
+    elif ident.state == ID_UNRESPONSIVE:
+        print('ERROR: USB BRIDGE PRESENT, POWER SUPPLY UNRESPONSIVE! CHECK THE POWER, OR POWER CYCLE IT.')
+    else:
+        print('MODEL ID ERROR!')
+    bk.close()
+    print('Serial port CLOSED')
+else:
+    print('ERROR: serial.open() failed.')
@@ -0,0 +1,257 @@
+###################################################################################################
+#   XLN_TELEMETRY - APPEND-ONLY MEMORY-MAPPED V/I TELEMETRY LOG
+#   -----------------------------------------------------------
+#
+#   This module saves the timestamped V/I samples of a capture to disk, in constant memory, for
+#   captures of any length, such as multi-day soak tests.
+#
+#   1)  Format: a 128-byte header, followed by fixed-size little-endian records:
+#
+#           t       float64 time.monotonic() timestamp, in seconds
+#           v       float32 output voltage, in volts
+#           i       float32 output current, in amps
+#
+#       The header holds a magic string, the format version, the header and record sizes, the offset
+#       from the monotonic timestamps to the wall clock time (time.time()), the creation time, and
+#       the serial number and model of the instrument. The records start on a 16-byte boundary.
+#
+#   2)  Writer: the records are collected in a preallocated chunk, and appended to the file one chunk
+#       at a time. The file is only ever appended to, so a reader can map it while it grows, and a
+#       crash loses at most the last chunk. A torn record at the end of the file is dropped when the
+#       file is opened again for append. The monotonic clock restarts at each boot, so when a log is
+#       appended to with a different wall clock offset than its header, the appended timestamps are
+#       shifted to the clock of the header, and their wall clock time stays right.
+#
+#   3)  Reader: the records are a NumPy structured memmap of the file, so a capture of any size loads
+#       instantly, and only the pages actually used are read from disk.
+#
+#   4)  Export: the log is converted to CSV, or to Parquet when pyarrow is installed, in blocks of
+#       records, also in constant memory. pyarrow is only imported by a Parquet export, so the
+#       scripts that log telemetry do not pay for its import.
+#
+#   The writer drains the samples of a xln_ringbuf.RingBuffer, such as the ring of a xln_acq.Sampler,
+#   at the pace of the consumer loop, so logging adds no work to the sampler thread.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   TelemetryWriter(path, sernum, model)    opens a log for append, creating it if needed
+#   append(t, v, i) / extend(t, v, i)       appends one sample, or arrays of samples
+#   drain(ring)                             appends the samples of a ring buffer since the last drain
+#   flush() / close()                       writes the pending chunk / and closes the file
+#   lost                                    samples overwritten in the ring before they were drained
+#
+#   open_log(path)                          (header, records): the header dict and the records memmap
+#   export(path, out)                       converts a log to a '.csv' or '.parquet' file
+#
+#   Run 'python xln_telemetry.py capture.xlt capture.csv' to convert a log from the command line.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import os
+import sys
+import time
+import struct
+import numpy as np
+
+# log header: magic, version, header size, record size, wall clock offset, creation time, sernum, model
+MAGIC = b'XLNTLOG\0'
+VERSION = 1
+HEADER_SIZE = 128
+_HEADER = struct.Struct('<8sHHIdd24s16s')
+
+# log record
+RECORD = np.dtype([('t', '<f8'), ('v', '<f4'), ('i', '<f4')])
+
+# largest difference between the wall clock offset of the log header and the current one that is not
+# corrected on append, in seconds
+OFFSET_TOLERANCE = 1.0
+
+# read and check the header of an open log file. returns the header dict
+def _read_header(f):
+    raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE or not raw.startswith(MAGIC):
+        raise ValueError('not a XLN telemetry log')
+    magic, version, hsize, rsize, offset, created, sernum, model = _HEADER.unpack_from(raw)
+    if version != VERSION or hsize != HEADER_SIZE or rsize != RECORD.itemsize:
+        raise ValueError('unsupported XLN telemetry log version {}'.format(version))
+    return {'version': version, 'offset': offset, 'created': created,
+            'sernum': sernum.rstrip(b'\0').decode(errors='replace'),
+            'model': model.rstrip(b'\0').decode(errors='replace')}
+
+# append-only telemetry log writer
+class TelemetryWriter:
+    def __init__(self, path, sernum='', model='', chunk=4096, sync=False):
+        self.path = path
+        self.sync = sync                # fsync() every chunk, for captures that must survive a power loss
+        self.chunk = np.zeros(chunk, dtype=RECORD)
+        self.n = 0
+        self.count = 0
+        self.lost = 0
+        self._index = None
+        self.shift = 0.0                # added to the timestamps, to the clock of the header
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                self.header = _read_header(f)
+            # the clock changed since the log was created, after a reboot or a wall clock change
+            shift = time.time() - time.monotonic() - self.header['offset']
+            if abs(shift) > OFFSET_TOLERANCE:
+                print('WARNING: {}: clock offset changed by {:.3f}s, appended timestamps are shifted'.format(
+                    path, shift))
+                self.shift = shift
+            # drop a torn record left by an interrupted write
+            size = os.path.getsize(path)
+            whole = HEADER_SIZE + (size - HEADER_SIZE) // RECORD.itemsize * RECORD.itemsize
+            if whole != size:
+                os.truncate(path, whole)
+            self.f = open(path, 'ab')
+        else:
+            if isinstance(sernum, bytes):
+                sernum = sernum.decode(errors='replace')
+            if isinstance(model, bytes):
+                model = model.decode(errors='replace')
+            self.header = {'version': VERSION, 'offset': time.time() - time.monotonic(), 'created': time.time(),
+                           'sernum': sernum.strip(), 'model': model.strip()}
+            self.f = open(path, 'wb')
+            raw = _HEADER.pack(MAGIC, VERSION, HEADER_SIZE, RECORD.itemsize, self.header['offset'],
+                               self.header['created'], self.header['sernum'].encode()[:24],
+                               self.header['model'].encode()[:16])
+            self.f.write(raw.ljust(HEADER_SIZE, b'\0'))
+            self.f.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # append one sample
+    def append(self, t, v, i):
+        self.chunk[self.n] = (t + self.shift, v, i)
+        self.n += 1
+        self.count += 1
+        if self.n == len(self.chunk):
+            self.flush()
+
+    # append arrays of samples
+    def extend(self, t, v, i):
+        k = 0
+        while k < len(t):
+            m = min(len(t) - k, len(self.chunk) - self.n)
+            dst = self.chunk[self.n:self.n + m]
+            dst['t'] = np.add(t[k:k + m], self.shift)
+            dst['v'] = v[k:k + m]
+            dst['i'] = i[k:k + m]
+            self.n += m
+            self.count += m
+            k += m
+            if self.n == len(self.chunk):
+                self.flush()
+
+    # append the samples of 'ring' appended since the last drain. the first drain takes all the samples
+    # still held in the ring
+    def drain(self, ring):
+        if self._index is None:
+            self._index = ring.count - len(ring)
+        index = self._index
+        (t, v, i), self._index = ring.since(index)
+        self.lost += self._index - index - len(t)
+        self.extend(t, v, i)
+
+    # write the pending records to the file
+    def flush(self):
+        if self.n:
+            self.f.write(self.chunk[:self.n].tobytes())
+            self.n = 0
+        self.f.flush()
+        if self.sync:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+# open a telemetry log for reading. returns (header, records), where 'records' is a read-only NumPy
+# memmap with the 't', 'v' and 'i' fields. the records appended later are not included
+def open_log(path):
+    with open(path, 'rb') as f:
+        header = _read_header(f)
+    n = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize
+    if n == 0:
+        return header, np.zeros(0, dtype=RECORD)
+    return header, np.memmap(path, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(n,))
+
+# convert a telemetry log to a '.csv' or '.parquet' file 'out', 'block' records at a time. the 'time'
+# column is the wall clock time of the sample, in seconds since the epoch. returns the number of records
+def export(path, out, block=1 << 20):
+    header, rec = open_log(path)
+    ext = os.path.splitext(out)[1].lower()
+    if ext == '.parquet':
+        try:
+            import pyarrow
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError('Parquet export needs pyarrow: pip install pyarrow, or export to CSV')
+        schema = pyarrow.schema([('time', pyarrow.float64()), ('t', pyarrow.float64()),
+                                 ('vout', pyarrow.float32()), ('iout', pyarrow.float32())],
+                                metadata={'sernum': header['sernum'], 'model': header['model']})
+        with pq.ParquetWriter(out, schema) as w:
+            for k in range(0, len(rec), block):
+                r = rec[k:k + block]
+                w.write_table(pyarrow.Table.from_arrays(
+                    [r['t'] + header['offset'], np.asarray(r['t']), np.asarray(r['v']), np.asarray(r['i'])],
+                    schema=schema))
+    elif ext == '.csv':
+        with open(out, 'w') as f:
+            f.write('time,t,vout,iout\n')
+            for k in range(0, len(rec), block):
+                r = rec[k:k + block]
+                np.savetxt(f, np.column_stack((r['t'] + header['offset'], r['t'], r['v'], r['i'])),
+                           delimiter=',', fmt=('%.6f', '%.6f', '%.3f', '%.3f'))
+    else:
+        raise ValueError('unknown export format {}, use .csv or .parquet'.format(ext))
+    return len(rec)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python xln_telemetry.py <log.xlt> <out.csv|out.parquet>')
+        sys.exit(1)
+    t0 = time.perf_counter()
+    n = export(sys.argv[1], sys.argv[2])
+    print('{} records exported to {} in {:.2f}s'.format(n, sys.argv[2], time.perf_counter() - t0))
@@ -0,0 +1,251 @@
+###################################################################################################
+#   XLN_TRANSCRIPT - TIMESTAMPED SERIAL TRANSCRIPT RECORDER AND DETERMINISTIC REPLAYER
+#   ----------------------------------------------------------------------------------
+#
+#   This module records the exact byte exchange of a session with the XLN power supply, with its
+#   timing, and serves it back later as a fake serial port, without the instrument.
+#
+#   1)  Recorder: RecordingPort wraps an open serial port, and is used in its place. Every write(),
+#       every readline() (with the bytes actually returned, a partial line on a timeout) and every
+#       input buffer reset is appended to the transcript file, with its time.monotonic_ns() timestamp.
+#
+#   2)  Format: a header (magic, version, wall clock time of the start), followed by one record per
+#       event: an 11-byte '<QBH' header (nanoseconds since the start, event type, payload length)
+#       and the payload bytes. A session of a few thousand commands is a few tens of kilobytes.
+#
+#   3)  Replayer: ReplayPort serves a transcript back to the same client code. The responses are
+#       returned in the recorded order, each one when it became available in the recorded session:
+#       after the recorded time from the previous event, divided by 'speed'. The waits on the
+#       instrument are reproduced, at the original pace (speed=1), accelerated (speed>1), or without
+#       any wait (speed=0). The writes of the client are compared to the recorded ones, and the
+#       first difference is reported: the client is not running the recorded session anymore.
+#
+#   A regression of an upload or of a capture can then be reproduced, and the client code
+#   benchmarked, without the instrument and without the noise of the serial link. The scripts open a
+#   replay by port name: 'replay://session.xlr', or 'replay://session.xlr?speed=0' to replay it
+#   without the waits.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   RecordingPort(instr, path)          wraps the open port 'instr', recording to 'path'
+#   ReplayPort(path, speed)             fake port serving the transcript 'path'
+#   replay_for_url(url)                 ReplayPort of a 'replay://<file>[?speed=N]' port name
+#   divergences                         number of client writes that differ from the recording
+#   read_transcript(path)               (header, [(t_ns, kind, payload)]) of a transcript
+#
+#   Run 'python xln_transcript.py session.xlr' to print a transcript.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import sys
+import time
+import struct
+
+# transcript header: magic, version, wall clock time of the start
+MAGIC = b'XLNTRSC\0'
+VERSION = 1
+_HEADER = struct.Struct('<8sHd')
+
+# event record header: nanoseconds since the start, event type, payload length
+_EVENT = struct.Struct('<QBH')
+
+# event types
+EV_WRITE = ord('W')
+EV_READ = ord('R')
+EV_RESET = ord('X')
+
+# serial port wrapper recording a transcript of the session
+class RecordingPort:
+    def __init__(self, instr, path):
+        self.instr = instr
+        self.path = path
+        self.f = open(path, 'wb')
+        self.f.write(_HEADER.pack(MAGIC, VERSION, time.time()))
+        self.t0 = time.monotonic_ns()
+
+    # the port timeout, read and set on the wrapped port
+    @property
+    def timeout(self):
+        return self.instr.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.instr.timeout = value
+
+    def __getattr__(self, attr):
+        return getattr(self.instr, attr)
+
+    def _record(self, kind, data=b''):
+        data = bytes(data)
+        for k in range(0, max(len(data), 1), 0xFFFF):
+            chunk = data[k:k + 0xFFFF]
+            self.f.write(_EVENT.pack(time.monotonic_ns() - self.t0, kind, len(chunk)) + chunk)
+
+    def write(self, data):
+        n = self.instr.write(data)
+        self._record(EV_WRITE, data)
+        return n
+
+    def readline(self, *args, **kw):
+        line = self.instr.readline(*args, **kw)
+        self._record(EV_READ, line)
+        return line
+
+    def reset_input_buffer(self):
+        self.instr.reset_input_buffer()
+        self._record(EV_RESET)
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+        self.instr.close()
+
+# read a transcript. returns (header, events), with the header dict and the list of
+# (t_ns, kind, payload) events. a truncated last event is ignored
+def read_transcript(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    magic, version, start = _HEADER.unpack_from(raw)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a XLN transcript, or unsupported version')
+    events = []
+    k = _HEADER.size
+    while k + _EVENT.size <= len(raw):
+        t, kind, n = _EVENT.unpack_from(raw, k)
+        k += _EVENT.size
+        if k + n > len(raw):
+            break
+        events.append((t, kind, raw[k:k + n]))
+        k += n
+    return {'version': version, 'start': start}, events
+
+# fake serial port serving a recorded transcript
+class ReplayPort:
+    def __init__(self, path, speed=1.0, timeout=None):
+        self.header, events = read_transcript(path)
+        self.speed = speed
+        self.timeout = timeout
+        self.baudrate = 57600
+        self.port = path
+        self.is_open = True
+        self.divergences = 0
+        # the reads, with the recorded time since the previous event, and the recorded writes
+        self.reads = []
+        self.writes = []
+        last = 0
+        for t, kind, data in events:
+            if kind == EV_READ:
+                self.reads.append((t - last, data))
+            elif kind == EV_WRITE:
+                self.writes.append(data)
+            last = t
+        self._r = 0
+        self._w = 0
+        self._last = time.monotonic()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        data = bytes(data)
+        expected = self.writes[self._w] if self._w < len(self.writes) else None
+        self._w += 1
+        if data != expected:
+            if self.divergences == 0:
+                print('WARNING: replay diverged at write {}: {!r}, recorded {!r}'.format(self._w, data, expected))
+            self.divergences += 1
+        self._last = time.monotonic()
+        return len(data)
+
+    def readline(self, *args, **kw):
+        if self._r >= len(self.reads):
+            return b''
+        dt, data = self.reads[self._r]
+        self._r += 1
+        if self.speed > 0:
+            wait = self._last + dt / 1e9 / self.speed - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self._last = time.monotonic()
+        return data
+
+    def flush(self):
+        pass
+
+    # the recording holds the reads as the client saw them, so a reset has nothing to discard
+    def reset_input_buffer(self):
+        self._last = time.monotonic()
+
+    def reset_output_buffer(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return 0
+
+# open the ReplayPort of a 'replay://<file>[?speed=N]' port name, like serial.serial_for_url()
+def replay_for_url(url, do_not_open=False):
+    path, _, query = url[len('replay://'):].partition('?')
+    speed = 1.0
+    for arg in query.split('&'):
+        key, _, value = arg.partition('=')
+        if key == 'speed':
+            speed = float(value)
+        elif key:
+            raise ValueError('unknown replay:// option {!r}'.format(key))
+    port = ReplayPort(path, speed)
+    port.is_open = not do_not_open
+    return port
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python xln_transcript.py <session.xlr>')
+        sys.exit(1)
+    header, events = read_transcript(sys.argv[1])
+    print('transcript started', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['start'])))
+    names = {EV_WRITE: '>', EV_READ: '<', EV_RESET: 'x'}
+    for t, kind, data in events:
+        print('{:12.6f} {} {!r}'.format(t / 1e9, names.get(kind, '?'), data))
+    nw = sum(len(d) for _, k, d in events if k == EV_WRITE)
+    nr = sum(len(d) for _, k, d in events if k == EV_READ)
+    dur = events[-1][0] / 1e9 if events else 0.0
+    print('{} events, {} bytes written, {} bytes read in {:.3f}s'.format(len(events), nw, nr, dur))
@@ -0,0 +1,441 @@
+###################################################################################################
+#   XLN_UPLOAD - LIST PROGRAM UPLOAD ENGINE WITH INSTRUMENT-PACED COMMANDS
+#   ----------------------------------------------------------------------
+#
+#   This module uploads a list program (PROG 1..n) to the XLN power supply as fast as the instrument
+#   can accept the commands.
+#
+#   The XLN command parser has no input handshake on the serial link, so commands sent faster than it
+#   can execute them are lost. The original scripts used a fixed 0.2s sleep before every command, which
+#   makes a 64-step program take more than 50s to upload. Here each command is paced from instrument
+#   feedback instead:
+#
+#   1)  'opc'       every command is followed by a '*OPC?' round trip. Safe, but pays one full round
+#                   trip per command.
+#
+#   2)  'gap'       the first commands are synchronized with '*OPC?' to measure how long the instrument
+#                   takes to execute one command. The rest of the upload is sent with that minimum
+#                   inter-command gap, and a '*OPC?' sync every 'block' commands verifies that the
+#                   instrument keeps up. If a sync fails, the gap is widened. This is the default.
+#
+#   3)  'status'    every command is followed by a 'STATUS?' poll, for firmware without '*OPC?'.
+#
+#   4)  'fixed'     the legacy fixed 0.2s delay, used only if the instrument answers neither query.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   upload_program(instr, prog, vp, ip, tp, rep, nxt) clears and writes the program in slot 'prog',
+#   saves it, reads back PROG:TOTA? and returns (steps, stats), where 'stats' reports the number of
+#   commands and bytes sent, the upload time and the pacing used.
+#
+#   upload_compiled(instr, compiled) uploads a program compiled by xln_program.compile_program() as a
+#   pipelined byte stream, with '*OPC?' credit-based flow control. This is bounded by the 57600 baud
+#   wire rate instead of by the per-command round trip, and is the fastest upload path.
+#
+#   upload_diff(instr, prog, vp, ip, tp, rep, nxt, old) only rewrites the steps and header fields that
+#   differ from the program already stored in slot 'prog'. The stored program is given as the record
+#   'old' kept by the host, or read back from the instrument with read_program().
+#
+#   upload_cached(instr, sernum, prog, vp, ip, tp, rep, nxt) uses the xln_cache host-side record of
+#   the slot: the upload is skipped if the slot already holds the program, and is differential if
+#   the slot holds a known older program. The record is validated against the slot before it is
+#   used: PROG:TOTA?, PROG:REP?, PROG:NEXT? and the values of the first and last steps.
+#
+#   The other uploads take the instrument serial number 'sernum', and forget the cached record of the
+#   slot they write, so the cache never holds a record of a slot rewritten without it.
+#
+#   upload_chain(instr, links, sernum) uploads the slots of a chained program (see
+#   xln_program.link_program), then verifies the chain: the steps, repetitions and PROG:NEXT link of
+#   every slot. It returns (steps, stats), where 'steps' is the total number of steps of the
+#   verified chain, or 0 if the verification failed.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import time
+from collections import namedtuple
+from collections import deque
+from xln_scpi import write_cmd, query, read_integer, opc_sync, opc_ack, opc_rtt
+from xln_program import as_list, fmt_num, program_record, compile_program, compile_diff, SLOW_COMMANDS
+from xln_cache import ProgramCache, program_hash
+
+# pacing strategies
+PACE_OPC = 'opc'
+PACE_GAP = 'gap'
+PACE_STATUS = 'status'
+PACE_FIXED = 'fixed'
+
+# legacy fixed delay between commands
+FIXED_GAP = 0.2
+
+# timeout for the PROG:SAV completion handshake. saving to flash is much slower than a parameter write
+SAVE_TIMEOUT = 2.0
+
+# upload report
+UploadStats = namedtuple('UploadStats', 'commands nbytes elapsed pacing gap')
+
+# send commands to the instrument, pacing each one from instrument feedback
+class Pacer:
+    def __init__(self, instr, pacing=PACE_GAP, calib=8, block=16, margin=1.25, verbose=False):
+        self.instr = instr
+        self.pacing = pacing
+        self.calib = calib              # number of '*OPC?' synchronized commands used to measure the gap
+        self.block = block              # '*OPC?' verification interval in 'gap' mode
+        self.margin = margin            # safety factor applied to the measured gap
+        self.verbose = verbose
+        self.gap = 0.0
+        self.commands = 0
+        self.nbytes = 0
+        self._rtt = None
+        self._samples = []
+        self._pending = 0
+        self._last = 0.0
+        self._probe()
+
+    # find the best pacing strategy the instrument supports
+    def _probe(self):
+        if self.pacing == PACE_FIXED:
+            self.gap = FIXED_GAP
+            return
+        if self.pacing in (PACE_OPC, PACE_GAP):
+            # the first '*OPC?' is repeated, to flush any stale response from the input buffer
+            self._rtt = opc_rtt(self.instr) or opc_rtt(self.instr)
+            if self._rtt is not None:
+                return
+            print('WARNING: *OPC? not answered, falling back to STATUS? pacing')
+            self.pacing = PACE_STATUS
+        if query(self.instr, "STATUS?").strip() != b'':
+            return
+        print('WARNING: STATUS? not answered, falling back to fixed {}s pacing'.format(FIXED_GAP))
+        self.pacing = PACE_FIXED
+        self.gap = FIXED_GAP
+
+    # wait for the minimum gap since the previous command
+    def _wait_gap(self):
+        dt = self._last + self.gap - time.perf_counter()
+        if dt > 0:
+            time.sleep(dt)
+
+    # send one command, and pace it according to the selected strategy
+    def send(self, cmd):
+        self._wait_gap()
+        t0 = time.perf_counter()
+        write_cmd(self.instr, cmd)
+        self.commands += 1
+        self.nbytes += len(cmd) + 2
+        if self.verbose:
+            print(cmd)
+        if self.pacing == PACE_OPC:
+            if not opc_sync(self.instr):
+                print('WARNING: *OPC? timeout after', cmd)
+        elif self.pacing == PACE_STATUS:
+            query(self.instr, "STATUS?")
+        elif self.pacing == PACE_GAP:
+            if len(self._samples) < self.calib:
+                # calibration: time the command plus '*OPC?', minus the idle '*OPC?' round trip
+                if opc_sync(self.instr):
+                    self._samples.append(time.perf_counter() - t0 - self._rtt)
+                    self.gap = max(max(self._samples), 0.0) * self.margin
+            else:
+                self._pending += 1
+                if self._pending >= self.block:
+                    self.sync()
+        self._last = time.perf_counter() if self.pacing != PACE_GAP else t0
+
+    # wait until the instrument has processed all commands sent so far. returns True on success
+    def sync(self, timeout=None):
+        self._pending = 0
+        if self.pacing == PACE_FIXED:
+            time.sleep(timeout or FIXED_GAP)
+            return True
+        if self.pacing == PACE_STATUS:
+            saved = self.instr.timeout
+            if timeout is not None:
+                self.instr.timeout = timeout
+            try:
+                ok = query(self.instr, "STATUS?").strip() != b''
+            finally:
+                self.instr.timeout = saved
+            return ok
+        ok = opc_sync(self.instr, timeout)
+        if not ok and self.pacing == PACE_GAP:
+            # the instrument fell behind: widen the gap and wait for it to drain
+            self.gap = max(self.gap * 1.5, 0.005)
+            print('WARNING: *OPC? timeout, widening command gap to {:.1f}ms'.format(self.gap * 1000))
+            ok = opc_sync(self.instr, SAVE_TIMEOUT)
+        return ok
+
+# clear, write and save list program 'prog'. vp, ip and tp are the step voltage, current and duration,
+# either as sequences or as scalars applied to all steps. rep is the repeat count and nxt the next
+# program to chain to (0 = stop).
+# returns (steps, stats): the PROG:TOTA? readback and the UploadStats of the upload
+def upload_program(instr, prog, vp, ip, tp, rep=0, nxt=0, pacing=PACE_GAP, verbose=True, sernum=None):
+    forget_slot(sernum, prog)
+    n = len(vp)
+    vp = as_list(vp, n)
+    ip = as_list(ip, n)
+    tp = as_list(tp, n)
+    t0 = time.perf_counter()
+    pacer = Pacer(instr, pacing, verbose=verbose)
+
+    # clear existing program
+    pacer.send("PROG {}".format(prog))
+    pacer.send("PROG:CLE")
+
+    # define list program header
+    pacer.send("PROG {}".format(prog))
+    pacer.send("PROG:REP {}".format(rep))
+    pacer.send("PROG:TOTA {}".format(n))
+
+    # generate all the program steps
+    for k in range(n):
+        pacer.send("PROG:STEP {}".format(k+1))
+        pacer.send("PROG:STEP:CURR {}".format(ip[k]))
+        pacer.send("PROG:STEP:VOLT {}".format(vp[k]))
+        pacer.send("PROG:STEP:ONT {}".format(tp[k]))
+
+    # set NEXT program and save
+    pacer.send("PROG:NEXT {}".format(nxt))
+    pacer.send("PROG:SAV")
+    pacer.sync(SAVE_TIMEOUT)
+    elapsed = time.perf_counter() - t0
+
+    # readback total steps to validate
+    steps = read_total(instr, prog)
+    return steps, UploadStats(pacer.commands, pacer.nbytes, elapsed, pacer.pacing, pacer.gap)
+
+# forget the host-side cache record of slot 'prog' of the instrument 'sernum', before the slot is written
+# by an upload that does not go through upload_cached()
+def forget_slot(sernum, prog, cache=None):
+    if sernum:
+        (cache or ProgramCache()).invalidate(sernum, prog)
+
+# select program 'prog' and read back its total number of steps
+def read_total(instr, prog):
+    write_cmd(instr, "PROG {}".format(prog))
+    write_cmd(instr, "PROG:TOTA?")
+    return read_integer(instr)
+
+# upload a program compiled by xln_program.compile_program() as a pipelined byte stream.
+# the lines are packed into windows of up to 'window' bytes, and every window is closed with '*OPC?'.
+# up to 'depth' windows are in flight: a new window is only written after the '1' of the window
+# 'depth' positions before it was received. This credit-based flow control keeps the serial link busy
+# without ever holding more than depth*window bytes in the CP2102 and instrument input buffers.
+# PROG:CLE and PROG:SAV are synchronized on their own, with the longer SAVE_TIMEOUT.
+# returns (steps, stats), like upload_program()
+def upload_compiled(instr, compiled, window=256, depth=2, verbose=False, sernum=None):
+    t0 = time.perf_counter()
+    forget_slot(sernum, compiled.prog)
+    if not (opc_sync(instr) or opc_sync(instr)):
+        # no '*OPC?' support: fall back to the command-by-command pacer
+        print('WARNING: *OPC? not answered, falling back to STATUS? pacing')
+        pacer = Pacer(instr, PACE_STATUS, verbose=verbose)
+        for line in compiled.lines:
+            for cmd in line.decode().strip().split(';'):
+                pacer.send(cmd.lstrip(':'))
+        pacer.sync(SAVE_TIMEOUT)
+        elapsed = time.perf_counter() - t0
+        steps = read_total(instr, compiled.prog)
+        return steps, UploadStats(pacer.commands, pacer.nbytes, elapsed, pacer.pacing, pacer.gap)
+
+    inflight = deque()
+    nbytes = 0
+    ok = True
+
+    # wait for the '1' of the oldest window in flight
+    def ack(timeout=None):
+        inflight.popleft()
+        return opc_ack(instr, timeout)
+
+    # write one window, closed by '*OPC?'
+    def send(buf):
+        instr.write(buf + b"*OPC?\r\n")
+        inflight.append(len(buf))
+        if verbose:
+            print(buf.decode().strip())
+        return len(buf) + 7
+
+    buf = b''
+    for line in compiled.lines:
+        slow = line.startswith(SLOW_COMMANDS)
+        if buf and (slow or len(buf) + len(line) > window):
+            nbytes += send(buf)
+            buf = b''
+            while len(inflight) >= depth:
+                ok = ack() and ok
+        buf += line
+        if slow:
+            nbytes += send(buf)
+            buf = b''
+            while inflight:
+                ok = ack(SAVE_TIMEOUT) and ok
+    if buf:
+        nbytes += send(buf)
+    while inflight:
+        ok = ack(SAVE_TIMEOUT) and ok
+    elapsed = time.perf_counter() - t0
+    if not ok:
+        print('WARNING: *OPC? timeout during program upload')
+    steps = read_total(instr, compiled.prog)
+    return steps, UploadStats(compiled.ncmd, nbytes, elapsed, 'stream', 0.0)
+
+# queries of one program step
+_STEP_QUERY = "PROG:STEP {}\r\nPROG:STEP:VOLT?\r\nPROG:STEP:CURR?\r\nPROG:STEP:ONT?\r\n"
+
+# read back list program 'prog' from the instrument, as a program record (see xln_program).
+# the queries of 'batch' steps are pipelined in a single write. returns None if the instrument does not answer
+def read_program(instr, prog, batch=4):
+    write_cmd(instr, "PROG {}".format(prog))
+    instr.write("PROG:TOTA?\r\nPROG:REP?\r\nPROG:NEXT?\r\n".encode())
+    try:
+        n = int(instr.readline())
+        rep = int(instr.readline())
+        nxt = int(instr.readline())
+        steps = []
+        for k0 in range(0, n, batch):
+            ks = range(k0, min(k0 + batch, n))
+            instr.write(b''.join(_STEP_QUERY.format(k+1).encode() for k in ks))
+            for k in ks:
+                steps.append([fmt_num(float(instr.readline())) for _ in range(3)])
+    except ValueError:
+        return None
+    return {'rep': rep, 'next': nxt, 'steps': steps}
+
+# differential upload: only rewrite the steps and header fields of program 'prog' that differ from
+# the stored program record 'old'. if 'old' is None, the stored program is read back from the instrument.
+# returns (steps, stats), like upload_program(). stats.commands is 0 if the program was already up to date
+def upload_diff(instr, prog, vp, ip, tp, rep=0, nxt=0, old=None, verbose=False, sernum=None):
+    t0 = time.perf_counter()
+    forget_slot(sernum, prog)
+    if old is None:
+        old = read_program(instr, prog)
+    new = program_record(vp, ip, tp, rep, nxt)
+    if old is None:
+        print('WARNING: PROG {} readback failed, uploading the whole program'.format(prog))
+        old = {'rep': -1, 'next': -1, 'steps': []}
+    compiled = compile_diff(prog, old, new)
+    if not compiled.lines:
+        return len(new['steps']), UploadStats(0, 0, time.perf_counter() - t0, 'diff', 0.0)
+    steps, stats = upload_compiled(instr, compiled, verbose=verbose)
+    return steps, stats._replace(elapsed=time.perf_counter() - t0, pacing='diff')
+
+# cheap validation of a program record against slot 'prog': PROG:TOTA?, PROG:REP? and PROG:NEXT?
+# in a single round trip, then the values of the first and last steps in a second one.
+# returns True if they agree with the record
+def validate_program(instr, prog, record):
+    write_cmd(instr, "PROG {}".format(prog))
+    instr.write("PROG:TOTA?\r\nPROG:REP?\r\nPROG:NEXT?\r\n".encode())
+    resp = [instr.readline().strip() for _ in range(3)]
+    expected = [str(len(record['steps'])).encode(), str(record['rep']).encode(), str(record['next']).encode()]
+    if resp != expected:
+        return False
+    n = len(record['steps'])
+    ks = sorted({0, n - 1}) if n else []
+    instr.write(b''.join(_STEP_QUERY.format(k+1).encode() for k in ks))
+    # all the response lines are read before they are compared, so none is left on the link
+    resp = [instr.readline() for _ in range(3 * len(ks))]
+    try:
+        steps = [[fmt_num(float(x)) for x in resp[3*j:3*j+3]] for j in range(len(ks))]
+    except ValueError:
+        return False
+    return steps == [record['steps'][k] for k in ks]
+
+# cached upload of program 'prog' to the instrument with serial number 'sernum':
+#   - the slot holds the same program (same hash, validated): the upload is skipped
+#   - the slot holds a known older program (validated): differential upload against the cached record
+#   - unknown or changed slot: full upload
+# the cache entry is updated after a successful upload. returns (steps, stats), like upload_program()
+def upload_cached(instr, sernum, prog, vp, ip, tp, rep=0, nxt=0, cache=None, verbose=False):
+    t0 = time.perf_counter()
+    cache = cache or ProgramCache()
+    new = program_record(vp, ip, tp, rep, nxt)
+    n = len(new['steps'])
+    entry = cache.get(sernum, prog) if sernum else None
+    if entry is not None and not validate_program(instr, prog, entry['record']):
+        # the slot was changed from the front panel, or by another host
+        print('PROG {} changed since the last upload, cache entry invalidated'.format(prog))
+        cache.invalidate(sernum, prog)
+        entry = None
+    if entry is not None and entry['hash'] == program_hash(new):
+        return n, UploadStats(0, 0, time.perf_counter() - t0, 'cache', 0.0)
+    if entry is not None:
+        steps, stats = upload_diff(instr, prog, vp, ip, tp, rep, nxt, old=entry['record'], verbose=verbose)
+    else:
+        steps, stats = upload_compiled(instr, compile_program(prog, vp, ip, tp, rep, nxt), verbose=verbose)
+    if sernum and steps == n:
+        cache.put(sernum, prog, new)
+    elif sernum:
+        cache.invalidate(sernum, prog)
+    return steps, stats._replace(elapsed=time.perf_counter() - t0)
+
+# verify the slots of a chained program: steps, repetitions and PROG:NEXT link of every slot.
+# returns the list of the slots that do not match
+def verify_chain(instr, links):
+    return [ln.prog for ln in links
+            if not validate_program(instr, ln.prog, program_record(ln.vp, ln.ip, ln.tp, 0, ln.next))]
+
+# upload the slots of a chained program, and verify the chain. the slots are uploaded through the
+# host-side cache if the instrument serial number 'sernum' is given. 'verbose' prints the upload report
+# of each slot. returns (steps, stats)
+def upload_chain(instr, links, sernum=None, verbose=False):
+    t0 = time.perf_counter()
+    commands = nbytes = 0
+    for ln in links:
+        if sernum:
+            steps, stats = upload_cached(instr, sernum, ln.prog, ln.vp, ln.ip, ln.tp, 0, ln.next)
+        else:
+            compiled = compile_program(ln.prog, ln.vp, ln.ip, ln.tp, 0, ln.next)
+            steps, stats = upload_compiled(instr, compiled)
+        if verbose:
+            print_stats(ln.prog, stats)
+        commands += stats.commands
+        nbytes += stats.nbytes
+    bad = verify_chain(instr, links)
+    if bad:
+        print('WARNING: program chain verification failed on PROG', ', '.join(str(p) for p in bad))
+    steps = 0 if bad else sum(len(ln.vp) for ln in links)
+    return steps, UploadStats(commands, nbytes, time.perf_counter() - t0, 'chain', 0.0)
+
+# print the upload report
+def print_stats(prog, stats):
+    if stats.commands == 0:
+        print("PROG {} is up to date, upload skipped ({:.2f}s)".format(prog, stats.elapsed))
+        return
+    gap = ", gap {:.1f}ms".format(stats.gap * 1000) if stats.pacing == PACE_GAP else ""
+    print("PROG {} upload: {} commands, {} bytes in {:.2f}s ({} pacing{})".format(
+        prog, stats.commands, stats.nbytes, stats.elapsed, stats.pacing, gap))
@@ -43,11 +43,25 @@
 #   The program opens the serial port, authenticates the XLN power supply model, and sends the following sequence of
 #   commands:
 #       1) Turn the output ON
-#       2) Send a sequence of stored voltage steps defined in an internal python list
-#       3) Read the output voltage and display the voltage as a realtime plot
-#       4) Turn the output OFF
-#       5) Waits for the user to close the plot window
-#       6) Close the serial port
+#       2) Send a sequence of stored voltage steps defined in an internal python list, each one at
+#          its absolute deadline, from a xln_sched host-timed scheduler thread
+#       3) Read the output voltage and current in the time between the deadlines, and display them as
+#          a realtime scrolling plot, blitted at a fixed frame rate
+#       4) Print the step timing error report, with the jitter histogram
+#       5) Save all the samples to the xln_telemetry log 'log_file', if set, drained from the sampler
+#          ring buffer at every plot frame
+#       6) Print the xln_metrics count, bytes and latency of each SCPI command, and export them
+#       7) Turn the output OFF
+#       8) Waits for the user to close the plot window
+#       9) Close the serial port
+#   The serial session can be recorded to 'transcript_file', and replayed with xln_transcript, by
+#   running the script again with the port name 'replay://<transcript_file>'.
+#
+#   In headless mode ('headless = True', or 'python xln.py wave --headless'), there is no plot and
+#   matplotlib is not imported: the sampler thread reads V/I back-to-back in the time between the
+#   deadlines, at the maximum rate of the link, and the samples are written as CSV records (t, vout,
+#   iout) to 'out_file', or to stdout with '-' (the report then goes to stderr). The achieved sample
+#   rate and the longest gap between two samples are reported at the end.
 # 
 #--------------------------------------------------------------------------------------------------
 #   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
@@ -85,168 +99,237 @@
 # 
 ###################################################################################################
 
-import serial
+import sys
 import time
-from math import ceil as ceil
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-import matplotlib.style as mplstyle
+import contextlib
+from xln_discover import find_port
+from xln_scpi import serial_for_url
+from xln_ident import identify, print_identity, ID_UNRESPONSIVE
+from xln_metrics import MeteredPort, print_metrics
+from xln_transcript import RecordingPort
 
-script_ver = "v1.0.9"
+script_ver = "v1.14.1"
 model_id = b'XLN3640'                       # change the model_id to your XLN model
 portname = '/dev/tty.usbserial-275K22178'   # change the device port name for your device name!
                                             # on windows use 'COMxx'
+                                            # use 'socket://localhost:5025' for the xln_emu.py emulator
+                                            # use 'daemon://<sernum>' for a supply served by xln_daemon.py
+                                            # use 'replay://<session.xlr>' to replay a xln_transcript.py recording
+                                            # use None to find the 'model_id' supply by auto-discovery
 
 # staircase waveform definition
 vp = [0.0,  0.5,  1.0,  1.5,  2.0,  2.5,  3.0,  3.5,  4.0,  4.5,  5.0,  5.5,  6.0,  6.5,  7.0,  7.5,  8.0,  8.5,  9.0,  9.5, 10.0,  0.0]
 ip = [6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  6.0,  1.0]
 tp = [1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00]
 
-# plot setup
-# mplstyle.use('dark_background')             # dark background with white lines
-mplstyle.use('seaborn-dark')                # gray waveform background with white lines
-plt.ion()                                   # using matplotlib interactive mode for realtime update
-fig = plt.figure(figsize=(6, 3))
-x = [0]
-y1 = [0]
-y2 = [0]
-ln1, = plt.plot(x, y1, '-g', label='VOUT')
-ln2, = plt.plot(x, y2, '-r', label='IOUT')
-plt.title('{} REALTIME OUTPUT'.format(model_id.decode()))
-plt.grid()
-plt.legend()
-plt.axis([0, 500, 0, 10])
-plt.setp(ln1, 'color', 'g', 'linewidth', 2.0)
-plt.setp(ln2, 'color', 'r', 'linewidth', 2.0)
-
-# command to write VOUT
-cmd_wr_vout = "SOUR:VOLT {}\r\n"
-
-# command to write IOUT
-cmd_wr_iout = "SOUR:CURR {}\r\n"
-
-# command to read VOUT
-cmd_rd_vout = "VOUT?\r\n"
-
-# command to read IOUT
-cmd_rd_iout = "IOUT?\r\n"
-
-# plot realtime update function
-def update_plt(yplot1, yplot2):
-    x.append(x[-1] + 1)
-    y1.append(yplot1)
-    y2.append(yplot2)
-    ln1.set_data(x, y1) 
-    ln2.set_data(x, y2) 
-    return ln1, ln2,
-
-# read output value. return -1 if read error.
-def read_cmd(instr, cmd):
+# plot frame rate, independent of the sample rate
+fps = 20
+
+# headless mode: no plot, the samples are written as CSV records to 'out_file' ('-' for stdout)
+headless = False
+out_file = '-'
+record_period = 0.05                        # time between the record writes, in seconds
+
+# telemetry log of the samples, None to not save them. convert with 'python xln_telemetry.py <log> <out.csv>'
+log_file = None
+
+# link metrics export: writes '<metrics_file>.json' and the Prometheus '<metrics_file>.prom'. None to only print them
+metrics_file = None
+
+# transcript of the serial session, for xln_transcript.ReplayPort. None to not record it
+transcript_file = None
+
+# plot realtime update function. redraws the scrolling window of the samples held in the sampler
+# ring buffer, decimated to the plot width
+def update_plt(rtp, ring):
+    rtp.update(ring)
+
+# print the last (V,I) of the steps ended from step 'k' on. returns the index of the next step to print
+def print_steps(sampler, k):
+    ends = sampler.ends
+    while k < len(ends):
+        vout, iout = ends[k][1:]
+        print("Vout: ", vout, "Iout: ", iout)
+        k += 1
+    return k
+
+# redraw the realtime plot at 'fps' frames per second for the specified duration, with the samples
+# acquired by the sampler thread, and save the new samples to the telemetry log.
+# returns the last (vout, iout) sample
+def read_pause(rtp, sampler, tpause, log=None):
+    t_end = time.monotonic() + tpause
+    t_frame = time.monotonic()
+    while True:
+        update_plt(rtp, sampler.ring)
+        if log is not None:
+            log.drain(sampler.ring)
+        t_frame += 1.0 / fps
+        rtp.pause(max(t_frame - time.monotonic(), 0.001))
+        if time.monotonic() >= t_end:
+            break
+    return sampler.last[1:]
+
+# headless record stream: writes the samples of the sampler ring buffer as CSV (t, vout, iout) rows,
+# with 't' in seconds from 't0'
+class RecordWriter:
+    def __init__(self, out, t0):
+        self.out = out
+        self.t0 = t0
+        self.index = 0
+        self.count = 0
+        self.lost = 0               # samples overwritten in the ring before they were written
+        self.gap = 0.0              # longest time between two consecutive samples
+        self.t_first = self.t_last = None
+        out.write('t,vout,iout\n')
+
+    # write the samples appended to 'ring' since the last write
+    def write(self, ring):
+        (t, v, i), index = ring.since(self.index)
+        self.lost += index - self.index - len(t)
+        self.index = index
+        if not len(t):
+            return
+        t = t - self.t0
+        if self.t_last is not None:
+            self.gap = max(self.gap, t[0] - self.t_last)
+        else:
+            self.t_first = t[0]
+        if len(t) > 1:
+            self.gap = max(self.gap, float((t[1:] - t[:-1]).max()))
+        self.t_last = t[-1]
+        self.out.write(''.join('{:.6f},{:.3f},{:.3f}\n'.format(*r) for r in zip(t.tolist(), v.tolist(), i.tolist())))
+        self.count += len(t)
+
+    # the achieved sample rate, from the first to the last sample written
+    def rate(self):
+        if self.count < 2 or self.t_last <= self.t_first:
+            return 0.0
+        return (self.count - 1) / (self.t_last - self.t_first)
+
+# main code. runs the realtime plot, or the headless mode with the records written to 'out_file'
+def main(portname=portname, model_id=model_id, vp=vp, ip=ip, tp=tp, headless=headless, out_file=out_file,
+         log_file=log_file):
+    if not headless:
+        play(portname, model_id, vp, ip, tp, log_file=log_file)
+        return
+    out = sys.stdout if out_file in (None, '-') else open(out_file, 'w')
     try:
-        instr.write(cmd.encode())
-        rd = instr.readline()
-        # print('rd:', rd)
-        val = float(rd)
-    except:
-        val = -1.0
-    return val
-    
-# generic write command with numeric argument
-def write_cmd(instr, cmd, arg):
-    _cmd = cmd.format(arg).encode()
-    instr.write(_cmd)
-
-# write the VOUT setting to the instrument
-def write_vout(instr, vout):
-    write_cmd(instr, cmd_wr_vout, vout)
-
-# write the IOUT limit to the instrument
-def write_iout(instr, iout):
-    write_cmd(instr, cmd_wr_iout, iout)
-
-# read the VOUT output
-def read_vout(instr):
-    return read_cmd(instr, cmd_rd_vout)
-
-# read the IOUT output
-def read_iout(instr):
-    return read_cmd(instr, cmd_rd_iout)
-
-# read (V,I) and update the realtime plot for the specified duration
-def read_pause(instr, tpause):
-    vout, iout = -1, -1
-    pts = ceil(tpause / 0.12)
-    for i in range(pts):
-        plt.pause(0.001)
-        time.sleep(0.020)
-        vout = read_vout(instr)
-        iout = read_iout(instr)
-        update_plt(vout, iout)
-    return vout, iout
-
-# main code
-print()
-print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
-print('REALTIME WAVEFORM ', script_ver)
-print('----------------------------------------------')
-bk = serial.Serial()
-bk.port = portname
-bk.baudrate = 57600
-bk.timeout = 0.2
-bk.open()
-if bk.is_open:
-    print('Serial port OPEN')
-    # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
-    bk.reset_input_buffer()
-    bk.reset_output_buffer()
-    bk.write("\r\n".encode())               
-    bk.write("*idn?\r\n".encode())
-    idn = bk.readline()                     
-    bk.write("MODEL?\r\n".encode())
-    model = bk.readline()                   
-    bk.write("SYS:SER?\r\n".encode())          
-    sernum = bk.readline()                  
-    bk.write("VER?\r\n".encode())          
-    version = bk.readline()
-    print('portname:\t\t', portname)
-    print('Instrument ID:\t\t', idn)
-    print('Instrument MODEL:\t', model)
-    print('Instrument VERSION:\t', version)
-    print('Instrument SN:\t\t', sernum)
-    if model_id in model:
-        # The power supply responded. Now we can send SCPI commands. 
-        print(model_id.decode(), "validated!")
-        bk.write("*cls\r\n".encode())
+        # with the records on stdout, the report is printed to stderr
+        with contextlib.redirect_stdout(sys.stderr if out is sys.stdout else sys.stdout):
+            play(portname, model_id, vp, ip, tp, out, log_file)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+# play the waveform, with the realtime plot, or headless with the records written to 'out'.
+# NumPy and matplotlib are only imported here, so importing this module is fast, and matplotlib is
+# not imported at all in headless mode
+def play(portname, model_id, vp, ip, tp, out=None, log_file=log_file):
+    from xln_sched import Scheduler, print_timing
+    from xln_telemetry import TelemetryWriter
+    if out is None:
+        import matplotlib.pyplot as plt
+        import matplotlib.style as mplstyle
+        from xln_plot import RealtimePlot
+
+        # plot setup
+        # mplstyle.use('dark_background')             # dark background with white lines
+        mplstyle.use('seaborn-dark')                # gray waveform background with white lines
+        plt.ion()                                   # using matplotlib interactive mode for realtime update
+        rtp = RealtimePlot('{} REALTIME OUTPUT'.format(model_id.decode()), window=30.0, ylim=(0, 10))
+
+    print()
+    print('B&K PRECISION REMOTE CONTROL EXAMPLE BY CISTEK')
+    print('REALTIME WAVEFORM ', script_ver)
+    print('----------------------------------------------')
+    if portname is None:
+        # find the port of the 'model_id' power supply, from the cached port map or by probing the CP2102 ports
+        portname = find_port(model=model_id)
+        print('auto-discovery:\t\t', portname)
+    if portname is None:
+        print('ERROR: no {} power supply found. check the USB cable and the power.'.format(model_id.decode()))
+        sys.exit(1)
+    bk = serial_for_url(portname, do_not_open=True)
+    bk.baudrate = 57600
+    bk.timeout = 0.2
+    bk.open()
+    if bk.is_open:
+        print('Serial port OPEN')
+        if transcript_file:
+            # record every byte exchanged, with its timestamp
+            bk = RecordingPort(bk, transcript_file)
+        # count the commands, bytes and round-trip latency of every SCPI command
+        bk = MeteredPort(bk, portname)
+        # The serial port is open, but we need to make the power supply to respond to *IDN? before sending commands. 
+        ident = identify(bk, portname)
+        print_identity(portname, ident)
+        model, sernum = ident.model, ident.sernum
+        if model_id in model:
+            # The power supply responded. Now we can send SCPI commands. 
+            print(model_id.decode(), "validated!")
+            bk.write("*cls\r\n".encode())
         
-        # turn output ON
-        bk.write("OUTP ON\r\n".encode())
-        bk.write("OUTP?\r\n".encode())
-        print("OUTP? : ", bk.readline())
-        bk.write("STATUS?\r\n".encode())
-        print("STATUS? : ", bk.readline())
-
-        # draw initial figure
-        plt.show(block=False)
-        plt.pause(0.1)
+            # turn output ON
+            bk.write("OUTP ON\r\n".encode())
+            bk.write("OUTP?\r\n".encode())
+            print("OUTP? : ", bk.readline())
+            bk.write("STATUS?\r\n".encode())
+            print("STATUS? : ", bk.readline())
+
+            # draw initial figure
+            if out is None:
+                rtp.show()
         
-        # generate the staircase ramp and read (V,I)
-        k = 0; vout = -1
-        while k < len(vp):
-            write_vout(bk, vp[k])
-            write_iout(bk, ip[k])
-            vout, iout = read_pause(bk, tp[k])
-            print("Vout: ", vout, "Iout: ", iout)
-            k = k + 1
-        vout, iout = read_pause(bk, 0.2)
-        print("Vout: ", vout, "Iout: ", iout)
-        bk.write("OUTP OFF\r\n".encode())
-        print("OUTP OFF : ", bk.readline())
-        plt.show(block=True)    # blocks until user closes plot window
-    else:
-        print('MODEL ID ERROR!')
-    bk.close()
-    print('Serial port CLOSED')
-else:
-    print('ERROR: serial.open() failed.')
+            # start the host-timed staircase ramp: each step is written at its absolute deadline, and
+            # the (V,I) samples fill the time between the deadlines
+            sampler = Scheduler(bk, vp, ip, tp, capacity=4096)
+            log = TelemetryWriter(log_file, sernum, model) if log_file else None
+            rec = RecordWriter(out, time.monotonic()) if out is not None else None
+            sampler.start()
 
+            # redraw the plot, or write the records, until the end of the ramp, and print the last
+            # (V,I) of each step, sampled by the scheduler before the next deadline
+            k = 0
+            while sampler.is_alive():
+                if rec is None:
+                    read_pause(rtp, sampler, 1.0 / fps, log)
+                else:
+                    time.sleep(record_period)
+                    rec.write(sampler.ring)
+                    if log is not None:
+                        log.drain(sampler.ring)
+                k = print_steps(sampler, k)
+            sampler.stop()
+            print_steps(sampler, k)
+            print("sample rate: {:.1f} samples/s".format(sampler.rate()))
+            print_timing(sampler)
+            if rec is not None:
+                rec.write(sampler.ring)
+                out.flush()
+                print("records: {} written to {} ({} lost), {:.1f} samples/s, longest gap {:.1f}ms".format(
+                    rec.count, getattr(out, 'name', out_file), rec.lost, rec.rate(), rec.gap * 1e3))
+            if log is not None:
+                log.drain(sampler.ring)
+                log.close()
+                print("telemetry log: {} samples saved to {} ({} lost)".format(log.count, log_file, log.lost))
+            print("missing samples: {}, retries: {}".format(sampler.engine.failures, sampler.engine.retries_done))
+            bk.write("OUTP OFF\r\n".encode())
+            print("OUTP OFF : ", bk.readline())
+            if out is None:
+                update_plt(rtp, sampler.ring)
+                plt.show(block=True)    # blocks until user closes plot window
+        elif ident.state == ID_UNRESPONSIVE:
+            print('ERROR: USB BRIDGE PRESENT, POWER SUPPLY UNRESPONSIVE! CHECK THE POWER, OR POWER CYCLE IT.')
+        else:
+            print('MODEL ID ERROR!')
+        print_metrics(bk)
+        if metrics_file:
+            bk.export_json(metrics_file + '.json')
+            bk.export_prometheus(metrics_file + '.prom')
+        bk.close()
+        print('Serial port CLOSED')
+    else:
+        print('ERROR: serial.open() failed.')
 
+if __name__ == '__main__':
+    main()
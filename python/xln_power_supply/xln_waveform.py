@@ -0,0 +1,305 @@
+###################################################################################################
+#   XLN_WAVEFORM - VECTORIZED WAVEFORM COMPILER
+#   -------------------------------------------
+#
+#   This module turns a sampled waveform into the smallest equivalent list program step list, ready
+#   for xln_program.compile_program().
+#
+#   The example scripts used to upload every raw sample as its own step, even when neighbouring
+#   samples round to the same setpoint. Here the whole waveform is processed with NumPy array
+#   operations, with no per-sample Python loop:
+#
+#   1)  Sampling: the voltage and current can be arrays, scalars, or callables f(t) sampled over
+#       time with period 'dt'. The sample durations can be a scalar or an array.
+#
+#   2)  Clamping: the setpoints are clamped to the output range of the XLN model (0..Vmax, 0..Imax).
+#
+#   3)  Quantization: the setpoints are rounded to the programming resolution (1mV, 1mA).
+#
+#   4)  Timing: the step boundaries are rounded to the time resolution (1ms) on the cumulative time
+#       axis, so rounding errors do not accumulate over a long waveform. If the minimum step duration
+#       is longer than the time resolution, the boundaries are rounded to that duration instead, and
+#       each step holds the setpoint found at its start.
+#
+#   5)  Run-length merging: consecutive steps with the same quantized setpoints are merged into one
+#       step, with the sum of their durations.
+#
+#   A densely sampled profile can also be segmented into variable-length steps, with the fewest steps
+#   that keep the error within a tolerance: short steps where the signal changes fast, long steps
+#   where it is flat. Each step is as long as possible (greedy), which gives the minimum number of
+#   steps for a maximum-error (L-infinity) bound, and its setpoint is the midpoint of the signal range
+#   it covers. The ends of all the steps of up to 32 samples are computed at once, with running
+#   max/min array passes, so a noisy profile made of many short steps costs a few array operations
+#   per sample instead of a Python loop iteration per step. The first sample out of tolerance of a
+#   longer step is found with the NumPy cumulative max/min of a window that doubles until it holds
+#   the end of the step, so each long step costs a few array operations on about twice its length.
+#   If the steps do not fit the step budget, the tolerance is increased by bisection to the smallest
+#   error that fits.
+#
+#--------------------------------------------------------------------------------------------------
+#   DESCRIPTION
+#   -----------
+#
+#   compile_waveform(v, i, dt, duration, model) returns a Waveform (vp, ip, tp, samples, clamped):
+#   the step voltage, current and duration arrays, the number of input samples, and the number of
+#   samples that were clamped to the model limits.
+#
+#   segment_waveform(v, i, dt, tol, max_steps) returns the Waveform of the variable-length steps of
+#   the profile, within 'tol' volts of it, or within the smallest error that fits 'max_steps' steps.
+#   'error' holds the maximum voltage error achieved.
+#
+#   sample_signal(f, duration, dt) samples a callable f(t) at t = 0, dt, 2*dt, ... < duration.
+#
+#--------------------------------------------------------------------------------------------------
+#   THIS CODE IS CREATED BY GRIDVORTEX SYSTEMS FOR CISTEK EQUIPAMENTOS DE MEDICAO AS EXAMPLE CODE 
+#   SUPPORT FOR CISTEK CUSTOMERS. THIS CODE IS PROVIDED AS IS, WITH NO IMPLIED OR EXPLICIT GUARANTEES
+#   OF PERFORMANCE OR FUNCTIONALITY. 
+#   NEITHER CISTEK NOR GRIDVORTEX ARE LIABLE FOR ANY DIRECT OR INDIRECT DAMAGES DERIVED FROM USE OF 
+#   THIS CODE. 
+#   THIS CODE IS PUBLISHED AS OPEN SOURCE FOR FREE USE. SUPPORT WILL BE PROVIDED ON GOODWILL, WITH NO 
+#   OBLIGATION OF SUPPORT OR SERVICE BEING IMPLIED WITH THE PROVISION OF THIS CODE. 
+#--------------------------------------------------------------------------------------------------
+#   LICENSE:    BSD 2-CLAUSE LICENSE
+#       
+#               Copyright (c) 2023, by Jonny Doin, GridVortex Systems 
+#               
+#               Redistribution and use in source and binary forms, with or without
+#               modification, are permitted provided that the following conditions are met:
+#               
+#               1. Redistributions of source code must retain the above copyright notice, this list 
+#               of conditions and the following disclaimer.
+#               
+#               2. Redistributions in binary form must reproduce the above copyright notice, this 
+#               list of conditions and the following disclaimer in the documentation and/or other 
+#               materials provided with the distribution.
+#               
+#               THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY 
+#               EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES 
+#               OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT 
+#               SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, 
+#               INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED 
+#               TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR 
+#               BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN 
+#               CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN 
+#               ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH 
+#               DAMAGE.
+# 
+###################################################################################################
+
+import numpy as np
+from collections import namedtuple
+from xln_program import MODELS, VOLT_RES, CURR_RES, TIME_RES, MIN_ONT
+
+# compiled waveform
+Waveform = namedtuple('Waveform', 'vp ip tp samples clamped error', defaults=(None,))
+
+# sample the callable 'f' over [0, duration) with period 'dt'
+def sample_signal(f, duration, dt):
+    return np.asarray(f(np.arange(0.0, duration, dt)), dtype=float)
+
+# expand 'x' (array, scalar or callable) into an array of 'n' samples
+def _samples(x, n, duration, dt):
+    if callable(x):
+        x = sample_signal(x, duration, dt)
+    return np.broadcast_to(np.asarray(x, dtype=float), (n,))
+
+# round to the resolution 'res'
+def quantize(x, res):
+    return np.round(x / res) * res
+
+# indices of the first sample of each run of equal (v, i) samples
+def _run_starts(v, i):
+    change = (v[1:] != v[:-1]) | (i[1:] != i[:-1])
+    return np.flatnonzero(np.concatenate(([True], change)))
+
+# clamp the setpoints to the output range of 'model' (str or bytes). returns (v, i, clamped samples)
+def _clamp(v, i, model):
+    if model is None:
+        return v, i, 0
+    if isinstance(model, bytes):
+        model = model.decode()
+    vmax, imax = MODELS[model.strip()]
+    vc = np.clip(v, 0.0, vmax)
+    ic = np.clip(i, 0.0, imax)
+    return vc, ic, int(np.count_nonzero((vc != v) | (ic != i)))
+
+# expand the arguments of a waveform into (v, i, dt) arrays of 'n' samples
+def _expand(v, i, dt, duration):
+    if callable(v) or callable(i):
+        if duration is None:
+            raise ValueError('a callable waveform needs a duration')
+        n = len(np.arange(0.0, duration, dt))
+    else:
+        n = np.size(v) if np.ndim(v) else np.size(i)
+    v = _samples(v, n, duration, dt)
+    i = _samples(i, n, duration, dt)
+    dt = np.broadcast_to(np.asarray(dt, dtype=float), (n,))
+    return v, i, dt
+
+# compile a waveform into the smallest equivalent step list. 'v' and 'i' are the voltage and current
+# setpoints, 'dt' the sample duration (scalar or array). if 'v' or 'i' is callable, it is sampled
+# over 'duration' with period 'dt'. 'model' (str or bytes) clamps the setpoints to its output range
+def compile_waveform(v, i, dt, duration=None, model=None, min_ont=MIN_ONT):
+    v, i, dt = _expand(v, i, dt, duration)
+    n = len(v)
+    v, i, clamped = _clamp(v, i, model)
+
+    # quantize the setpoints, and merge the equal runs
+    vq = quantize(v, VOLT_RES)
+    iq = quantize(i, CURR_RES)
+    k = _run_starts(vq, iq)
+    t = np.concatenate(([0.0], np.cumsum(dt)))          # sample boundaries on the time axis
+    tb = np.concatenate((t[k], t[-1:]))                 # step boundaries
+
+    # round the step boundaries to the time grid, and drop the steps shorter than one grid period
+    grid = max(min_ont, TIME_RES)
+    tb = np.round(tb / grid) * grid
+    keep = np.concatenate((np.diff(tb) > grid / 2, [True]))
+    tb = tb[keep]
+    if grid > TIME_RES:
+        # each step holds the setpoint found at its start
+        k = np.minimum(np.searchsorted(t, tb[:-1], side='right') - 1, n - 1)
+    else:
+        k = k[keep[:-1]]
+    vq, iq = vq[k], iq[k]
+
+    # merge the runs made equal by the dropped steps
+    r = _run_starts(vq, iq)
+    tb = np.concatenate((tb[r], tb[-1:]))
+    tp = quantize(np.diff(tb), TIME_RES)
+    return Waveform(vq[r], iq[r], tp, n, clamped)
+
+# index of the first sample after 's' where the range of any of the signals 'ys' exceeds its 'spans',
+# searching a window that doubles from 'w' samples. returns (index, window size used)
+def _step_end(ys, spans, s, w):
+    n = len(ys[0])
+    while True:
+        end = min(s + w, n)
+        e = end
+        for y, span in zip(ys, spans):
+            seg = y[s:end]
+            over = np.maximum.accumulate(seg) - np.minimum.accumulate(seg) > span
+            j = int(over.argmax())
+            if over[j]:
+                e = min(e, s + j)
+        if e < end or end == n:
+            return e, w
+        w *= 2
+
+# step end lookup tables, on the time axis 't' of n samples (n+1 boundaries). a step can only end on a
+# sample boundary closest to the time resolution grid, so rounding the step durations to the time
+# resolution does not move the steps. returns the arrays, indexed by sample boundary:
+#   down[e]     the last grid boundary at or before 'e'
+#   up[e]       the first grid boundary at or after 'e'
+def _end_tables(t):
+    n = len(t) - 1
+    g = np.arange(0.0, t[-1], TIME_RES)
+    e = np.arange(n + 1)
+    grid = np.zeros(n + 1, dtype=bool)
+    # the first boundary past a quarter of the resolution before each grid time: the cumulative sum of
+    # a long time axis drifts from the exact multiples of the resolution
+    grid[np.searchsorted(t, g - TIME_RES / 4)] = True
+    grid[[0, n]] = True
+    down = np.maximum.accumulate(np.where(grid, e, 0))
+    up = np.minimum.accumulate(np.where(grid, e, n)[::-1])[::-1]
+    return down, up
+
+# ends of the short steps: for every sample 's', the end of the step starting at 's' if it is at most
+# 'k' samples long, computed for all the samples at once with 'k' running max/min passes, or -1 for a
+# longer step. the ends follow the same grid and minimum duration rules as _segment()
+def _short_ends(ys, spans, t, tables, min_ont, k=32):
+    down, up = tables
+    n = len(t) - 1
+    first = np.full(n, k + 1)
+    for y, span in zip(ys, spans):
+        hi = y.copy()
+        lo = y.copy()
+        for j in range(1, k + 1):
+            m = n - j
+            if m <= 0:
+                break
+            np.maximum(hi[:m], y[j:], out=hi[:m])
+            np.minimum(lo[:m], y[j:], out=lo[:m])
+            over = (hi[:m] - lo[:m] > span) & (first[:m] > j)
+            first[:m][over] = j
+            if np.all(first[:m] <= j):
+                break
+    s = np.arange(n)
+    e = np.where(first <= k, s + first, n)
+    short = (first <= k) | (n - s <= k)
+    e = down[e]
+    emin = np.maximum(np.searchsorted(t, t[:-1] + min_ont - TIME_RES / 2), s + 1)
+    e = np.where(e < emin, up[np.minimum(emin, n)], e)
+    return np.where(short, e, -1).tolist()
+
+# greedy segmentation of the signals 'ys' with ranges within 'spans', on the time axis 't', with the
+# step end lookup 'tables', and steps of at least 'min_ont' seconds. stops after 'limit' steps.
+# the ends of the short steps of a noisy signal are looked up in the _short_ends() table.
+# returns (step start indices, samples covered)
+def _segment(ys, spans, t, tables, min_ont, limit):
+    down, up = tables
+    n = len(ys[0])
+    # a signal that never leaves its span does not limit the steps
+    sel = [(y, span) for y, span in zip(ys, spans) if np.ptp(y) > span]
+    ys, spans = [y for y, _ in sel], [span for _, span in sel]
+    ends = _short_ends(ys, spans, t, tables, min_ont) if ys else None
+    starts = []
+    s = 0
+    w = 16
+    while s < n and len(starts) < limit:
+        starts.append(s)
+        if ends is not None and ends[s] >= 0:
+            s = ends[s]
+            continue
+        e, w = _step_end(ys, spans, s, w) if ys else (n, w)
+        # end the step on the last grid boundary within tolerance, but not before the minimum duration
+        e = down[e]
+        emin = max(s + 1, int(np.searchsorted(t, t[s] + min_ont - TIME_RES / 2)))
+        if e < emin:
+            e = up[min(emin, n)]
+        # the next step is likely about as long as this one
+        w = max(int(1.25 * (e - s)), 16)
+        s = min(e, n)
+    return np.array(starts), s
+
+# segment a profile into variable-length steps, with the maximum voltage error 'tol' (and 'itol' for
+# the current), and at most 'max_steps' steps. the tolerance is increased if the steps do not fit
+def segment_waveform(v, i, dt, tol, max_steps=None, itol=None, duration=None, model=None, min_ont=MIN_ONT):
+    v, i, dt = _expand(v, i, dt, duration)
+    n = len(v)
+    v, i, clamped = _clamp(v, i, model)
+    t = np.concatenate(([0.0], np.cumsum(dt)))
+    limit = max_steps or n
+    itol = CURR_RES / 2 if itol is None else itol
+    ys = (np.ascontiguousarray(v), np.ascontiguousarray(i))
+    tables = _end_tables(t)
+
+    def segment(vtol):
+        return _segment(ys, (2 * vtol, 2 * itol), t, tables, min_ont, limit)
+
+    starts, end = segment(tol)
+    if end < n:
+        # too many steps. the number of steps scales about as 1/tol: extrapolate an upper bound of the
+        # tolerance from the part of the profile covered (at least doubling it), then bisect down to 1%
+        lo, hi = tol, tol
+        top = (v.max() - v.min()) / 2 + VOLT_RES      # a single voltage step
+        while end < n:
+            if hi >= top:
+                raise ValueError('the current profile does not fit in {} steps'.format(limit))
+            lo, hi = hi, min(max(1.1 * n / max(end, 1), 2.0) * hi, top)
+            starts, end = segment(hi)
+        while hi - lo > max(VOLT_RES / 2, 0.01 * hi):
+            mid = (lo + hi) / 2
+            s, end = segment(mid)
+            if end < n:
+                lo = mid
+            else:
+                hi, starts = mid, s
+
+    # step setpoint: the midpoint of the signal range of the step
+    vmax = np.maximum.reduceat(v, starts)
+    vmin = np.minimum.reduceat(v, starts)
+    imid = (np.maximum.reduceat(i, starts) + np.minimum.reduceat(i, starts)) / 2
+    tb = np.concatenate((t[starts], t[-1:]))
+    wf = compile_waveform((vmax + vmin) / 2, imid, np.diff(tb), min_ont=min_ont)
+    return wf._replace(samples=n, clamped=clamped, error=float(np.max(vmax - vmin)) / 2)